@@ -0,0 +1,90 @@
+'''
+Parser throughput benchmark.
+
+Parses a generated unit of several megabytes with each parser backend, and
+reports how fast each one reads it, in megabytes of source per second.  The
+syntax trees made by the backends are checked to be the same.  A parse
+makes a great many objects, so the garbage collector's share of the time is
+included.
+
+    python benchmarks/parse_throughput.py [--size MB] [--runs N]
+                                          [--parser NAME]
+'''
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from lispy.parser import PARSERS, get_parser
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+# one chunk of the generated unit: %(n)d is replaced by a counter, so that
+# the names differ
+CHUNK = '''
+    (defun fibb_%(n)d (n)
+      (if (or (= n 0) (= n 1))
+          1
+          (+ (fibb_%(n)d (- n 1)) (fibb_%(n)d (- n 2)))))
+    (set x_%(n)d (list %(n)d 2.5 "string %(n)d" #t #f))
+    (print (fibb_%(n)d 10) x_%(n)d)
+'''
+
+
+def make_unit(size):
+    '''
+    :param size: the size of the unit, in bytes
+    :type size: int
+    :return: the text of a unit of (about) the given size
+    :rtype: str
+    '''
+    chunks = []
+    total = 0
+    n = 0
+    while total < size:
+        chunk = CHUNK % dict(n=n)
+        chunks.append(chunk)
+        total += len(chunk)
+        n += 1
+    return '(begin' + ''.join(chunks) + ')\n'
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    ap.add_argument('--size', type=float, default=4,
+                    help='the size of the unit, in megabytes')
+    ap.add_argument('--runs', type=int, default=3)
+    ap.add_argument('--parser', action='append', choices=PARSERS,
+                    help='the backend to time (may be repeated; default: '
+                         'all)')
+    args = ap.parse_args(argv)
+
+    text = make_unit(int(args.size * 1e6))
+    mb = len(text.encode('utf-8')) / 1e6
+    print('unit: %.1f MB, %d lines' % (mb, text.count('\n') + 1))
+    names = args.parser or PARSERS
+    for name in names:
+        parser = get_parser(name)
+        best = None
+        for i in range(args.runs):
+            gc.collect()
+            start = time.perf_counter()
+            parser.parse('main', text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print('%-8s %8.2f s %8.2f MB/s' % (name, best, mb / best))
+    # the trees are compared once the timing is done, so that no run is
+    # slowed by having to keep another tree in memory
+    expected = get_parser(names[0]).parse('main', text)
+    for name in names[1:]:
+        if get_parser(name).parse('main', text) != expected:
+            raise SystemExit('%s and %s made different syntax trees' %
+                             (names[0], name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Startup benchmark.
+
+Measures the time from starting a process to the first expression being
+evaluated: each run starts `python -m lispy` on a unit whose first
+expression prints a line, and the clock stops when that line arrives.  Bare
+`python -c pass` runs are timed too, for comparison.
+
+    python benchmarks/startup.py [--runs N] [--engine ENGINE] [--build]
+
+With --build, the package is first built (with its parser tables) into a
+temporary directory, and that copy is timed, as an installed package would
+be.  Otherwise the source tree is timed.
+'''
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UNIT = '(begin (print 1) (+ 1 2))'
+
+
+def time_to_first_line(cmd, env, cwd):
+    '''
+    :return: seconds from starting cmd to the first line of its output (or
+             to its exit, if it prints nothing)
+    :rtype: float
+    '''
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, env=env, cwd=cwd)
+    proc.stdout.readline()
+    elapsed = time.perf_counter() - start
+    proc.stdout.read()
+    if proc.wait():
+        raise RuntimeError('%s failed' % ' '.join(cmd))
+    return elapsed
+
+
+def build(dest):
+    '''
+    Build the package, with its parser tables, into dest.
+    '''
+    subprocess.check_call([sys.executable, 'setup.py', '-q', 'build_py',
+                           '-d', dest], cwd=ROOT, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL)
+
+
+def report(name, times):
+    times = [t * 1000 for t in times]
+    print('%-10s min %7.1f ms   median %7.1f ms   max %7.1f ms' %
+          (name, min(times), statistics.median(times), max(times)))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    ap.add_argument('--runs', type=int, default=20)
+    ap.add_argument('--engine', default=None)
+    ap.add_argument('--build', action='store_true',
+                    help='time a built copy of the package')
+    args = ap.parse_args(argv)
+
+    work = tempfile.mkdtemp()
+    try:
+        path = ROOT
+        if args.build:
+            path = os.path.join(work, 'build')
+            build(path)
+        with open(os.path.join(work, 'main'), 'w') as f:
+            f.write(UNIT)
+        env = dict(os.environ, PYTHONPATH=path, PYTHONDONTWRITEBYTECODE='')
+        env.pop('LISPY_CACHE_DIR', None)
+        cmd = [sys.executable, '-m', 'lispy', 'main']
+        if args.engine:
+            cmd += ['--engine', args.engine]
+        # warm up (and write the .pyc files)
+        time_to_first_line(cmd, env, work)
+        baseline = [time_to_first_line([sys.executable, '-c', 'pass'], env,
+                                       work) for i in range(args.runs)]
+        lispy = [time_to_first_line(cmd, env, work)
+                 for i in range(args.runs)]
+        report('python', baseline)
+        report('lispy', lispy)
+    finally:
+        shutil.rmtree(work)
+
+
+if __name__ == '__main__':
+    main()
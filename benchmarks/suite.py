@@ -0,0 +1,338 @@
+'''
+Benchmark suite.
+
+Times a set of workloads that stand for the ways LisPy is used, with each
+engine (or parser backend), and compares the times with a baseline: the
+results of an earlier run, written with --output.  The run fails (exit
+status 1) if a workload has become slower than its baseline time by more
+than the threshold.
+
+    python benchmarks/suite.py [--workload NAME] [--engine NAME]
+                               [--repeat N] [--output FILE]
+                               [--baseline FILE] [--threshold FRACTION]
+                               [--threshold-for NAME=FRACTION]
+
+The workloads are:
+
+fibb         recursive calls (fibb, from the test sources)
+count        a while loop that counts with set
+scope_chain  reading names through a deep chain of nested functions
+load_graph   a run that loads a tree of units (compiled units are cached)
+parse        parsing a large generated unit (for each parser backend)
+startup      starting python -m lispy, up to the first line printed
+
+Each workload is run once to warm up, and then --repeat times.  The fastest
+time is the one compared, as it is the one least disturbed by the rest of
+the machine.  A result is named by its workload and variant, as in
+fibb/closure; --threshold-for takes either (a workload name stands for all
+of its variants).  Keep baselines per machine: times from different
+machines can't be compared.
+'''
+import argparse
+import collections
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.cache import UnitCache
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+from lispy.parser import PARSERS, get_parser
+
+from parse_throughput import make_unit
+from startup import time_to_first_line
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The version of the format of the results files
+FORMAT = 1
+
+#: The default threshold: the fraction by which a workload may slow down
+DEFAULT_THRESHOLD = 0.10
+
+FIBB = '''(begin
+  (defun fibb (n)
+    (if (or (= n 0) (= n 1))
+        1
+        (+ (fibb (- n 1)) (fibb (- n 2)))))
+  (fibb 15))'''
+
+COUNT = '''(begin (set i 0)
+                  (while (!= i 20000) (set i (+ i 1)))
+                  i)'''
+
+'''
+A workload.
+
+    variants: () -> list[str]: the variants to time
+    measure: (str, int) -> list[float]: the times of the given number of
+             runs of a variant, in seconds
+'''
+Workload = collections.namedtuple('Workload', 'variants measure')
+
+
+def time_calls(func, repeat):
+    '''
+    :param func: the code to time
+    :type func: () -> any
+    :param repeat: the number of times to time it
+    :type repeat: int
+    :return: the times of the calls of func, in seconds, after one call to
+             warm up
+    :rtype: list[float]
+    '''
+    func()
+    times = []
+    for i in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_units(units, main='main'):
+    '''
+    :param units: the source of each unit (unit name -> source)
+    :type units: dict[str,str]
+    :return: a function that makes the runs of a workload: it takes an
+             engine name and the number of runs to time, and runs the main
+             unit in a new global environment each time (with the compiled
+             units cached, as they would be)
+    '''
+    def measure(engine, repeat):
+        interpreter = Interpreter(DictLoader(units), engine=engine,
+                                  cache=UnitCache())
+        return time_calls(lambda: interpreter.run_module(main), repeat)
+    return measure
+
+
+def scope_chain_unit(depth, count):
+    '''
+    :return: a unit that nests depth functions, each with a parameter, and
+             loops count times in the innermost, reading the parameters of
+             the outermost and the innermost
+    :rtype: str
+    '''
+    text = ('(begin (set i 0) (set s 0) (while (!= i %d) (begin '
+            '(set s (+ s a0 a%d)) (set i (+ i 1)))) s)' % (count, depth - 1))
+    for d in reversed(range(depth)):
+        text = '(begin (defun f%d (a%d) %s) (f%d 1))' % (d, d, text, d)
+    return text
+
+
+def load_graph_units(count):
+    '''
+    :return: count units, each of which loads two others (forming a binary
+             tree), defines a function and calls it, and a main unit that
+             loads the root of the tree
+    :rtype: dict[str,str]
+    '''
+    units = dict(main='(begin (load "m0") v0)')
+    for i in range(count):
+        children = [c for c in (2 * i + 1, 2 * i + 2) if c < count]
+        load = ''
+        if children:
+            load = '(load %s)' % ' '.join('"m%d"' % c for c in children)
+        units['m%d' % i] = (
+            '(begin %s (defun g%d (x) (+ x %d)) (set v%d (g%d 1)))' %
+            (load, i, i, i, i))
+    return units
+
+
+def measure_parse(parser_name, repeat):
+    text = make_unit(200000)
+    parser = get_parser(parser_name)
+    return time_calls(lambda: parser.parse('main', text), repeat)
+
+
+def measure_startup(engine, repeat):
+    work = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(work, 'main'), 'w') as f:
+            f.write('(begin (print 1) (+ 1 2))')
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        env.pop('LISPY_CACHE_DIR', None)
+        cmd = [sys.executable, '-m', 'lispy', 'main', '--engine', engine]
+        # warm up (and write the .pyc files)
+        time_to_first_line(cmd, env, work)
+        return [time_to_first_line(cmd, env, work) for i in range(repeat)]
+    finally:
+        shutil.rmtree(work)
+
+
+def engines():
+    return list(ENGINES)
+
+
+def parsers():
+    return list(PARSERS)
+
+
+#: The workloads (name -> Workload), in the order they are run
+WORKLOADS = collections.OrderedDict([
+    ('fibb', Workload(engines, run_units(dict(main=FIBB)))),
+    ('count', Workload(engines, run_units(dict(main=COUNT)))),
+    ('scope_chain', Workload(engines, run_units(dict(
+        main=scope_chain_unit(24, 2000))))),
+    ('load_graph', Workload(engines, run_units(load_graph_units(127)))),
+    ('parse', Workload(parsers, measure_parse)),
+    ('startup', Workload(engines, measure_startup)),
+])
+
+
+def run_workloads(names, variants, repeat, log=None):
+    '''
+    :param names: the workloads to run
+    :type names: list[str]
+    :param variants: the variants to run (engine or parser names), or None
+                     for all
+    :type variants: list[str] or None
+    :param repeat: the number of timed runs of each
+    :type repeat: int
+    :param log: where to report progress, or None
+    :type log: io.TextIOBase or None
+    :return: the results (result name -> {'min': seconds, 'median':
+             seconds, 'times': [seconds...]})
+    :rtype: dict
+    '''
+    results = collections.OrderedDict()
+    for name in names:
+        workload = WORKLOADS[name]
+        for variant in workload.variants():
+            if variants and variant not in variants:
+                continue
+            key = '%s/%s' % (name, variant)
+            if log is not None:
+                print('running %s' % key, file=log, flush=True)
+            times = workload.measure(variant, repeat)
+            results[key] = dict(min=min(times),
+                                median=statistics.median(times),
+                                times=times)
+    return results
+
+
+def threshold_for(key, thresholds, default):
+    '''
+    :return: the threshold of a result: the one given for its name, or its
+             workload's name, or the default
+    :rtype: float
+    '''
+    if key in thresholds:
+        return thresholds[key]
+    return thresholds.get(key.split('/')[0], default)
+
+
+def compare(results, baseline, thresholds, default):
+    '''
+    Compare results with a baseline.
+
+    :param results: the results of this run (see run_workloads)
+    :param baseline: the results of an earlier run
+    :param thresholds: thresholds for results or workloads (name ->
+                       fraction)
+    :type thresholds: dict[str,float]
+    :param default: the threshold of the rest
+    :type default: float
+    :return: a row for each result: (name, time, baseline time or None,
+             change or None, status)
+    :rtype: list[tuple]
+    '''
+    rows = []
+    for (key, result) in results.items():
+        old = baseline.get(key)
+        if old is None:
+            rows.append((key, result['min'], None, None, 'new'))
+            continue
+        change = result['min'] / old['min'] - 1
+        if change > threshold_for(key, thresholds, default):
+            status = 'REGRESSED'
+        else:
+            status = 'ok'
+        rows.append((key, result['min'], old['min'], change, status))
+    return rows
+
+
+def print_rows(rows, file=None):
+    print('%-22s %11s %11s %8s  %s' % ('workload', 'time', 'baseline',
+                                       'change', 'status'), file=file)
+    for (key, t, old, change, status) in rows:
+        print('%-22s %8.2f ms %s %s  %s' % (
+            key, t * 1000,
+            '%8.2f ms' % (old * 1000) if old is not None else ' ' * 11,
+            '%+7.1f%%' % (change * 100) if change is not None else ' ' * 8,
+            status), file=file)
+
+
+def parse_threshold(text):
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError('expected NAME=FRACTION, not %r'
+                                         % text)
+    return (name, float(value))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    ap.add_argument('--workload', action='append', choices=list(WORKLOADS),
+                    help='the workload to run (may be repeated; default: '
+                         'all)')
+    ap.add_argument('--engine', action='append', metavar='NAME',
+                    help='the engine (or parser backend, for parse) to run '
+                         'the workloads with (may be repeated; default: '
+                         'all)')
+    ap.add_argument('--repeat', type=int, default=5,
+                    help='the number of timed runs of each workload')
+    ap.add_argument('--output', metavar='FILE',
+                    help='write the results to FILE, as JSON')
+    ap.add_argument('--baseline', metavar='FILE',
+                    help='compare the results with those in FILE')
+    ap.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                    metavar='FRACTION',
+                    help='how much slower than its baseline a workload may '
+                         'get, as a fraction of the baseline (default: '
+                         '%(default)g)')
+    ap.add_argument('--threshold-for', type=parse_threshold, action='append',
+                    default=[], metavar='NAME=FRACTION',
+                    help='the threshold of one workload, or of one variant '
+                         'of it (may be repeated)')
+    args = ap.parse_args(argv)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('format') != FORMAT:
+            ap.error('%s is not a results file of this suite' %
+                     args.baseline)
+    results = run_workloads(args.workload or list(WORKLOADS), args.engine,
+                            args.repeat, log=sys.stderr)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(dict(format=FORMAT, python=platform.python_version(),
+                           machine=platform.machine(), repeat=args.repeat,
+                           results=results), f, indent=2)
+            f.write('\n')
+    rows = compare(results, baseline['results'] if baseline else dict(),
+                   dict(args.threshold_for), args.threshold)
+    print_rows(rows)
+    regressed = [row[0] for row in rows if row[4] == 'REGRESSED']
+    if regressed:
+        print('%d workload(s) regressed: %s' % (len(regressed),
+                                               ', '.join(regressed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,5 @@
-from lispy.interpreter import Interpreter
-from lispy.interpreter.loader import FileSysLoader
-import os, sys
+import sys
 
+from lispy.__main__ import main
 
-cwd = os.getcwd()
-loader = FileSysLoader([cwd])
-interp = Interpreter(loader)
-result = interp.run_module(sys.argv[1])
+sys.exit(main())
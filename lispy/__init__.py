@@ -1 +1,3 @@
 __author__ = 'Dan Bullok and Ben Lambeth'
+
+__version__ = '0.1'
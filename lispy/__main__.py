@@ -1,6 +1,121 @@
+'''
+Command line interface.
+
+    python -m lispy [options] unit
+    python -m lispy batch [options] unit...
+
+Runs a unit, loaded from the current directory (or the directories given
+with -I).  The batch command runs many units across a pool of processes
+(see lispy.batch); to run a unit named batch, use ./batch.
+
+Only the standard library modules needed to read the arguments are imported
+until the unit is run, so that short runs start quickly.
+'''
+import os
+import sys
+
 __author__ = 'Dan Bullok and Ben Lambeth'
 
-from .parser import LispyParser
-import logging
 
-lispy = LispyParser()
+def make_arg_parser():
+    '''
+    :return: the parser for the command line arguments
+    :rtype: argparse.ArgumentParser
+    '''
+    import argparse
+    ap = argparse.ArgumentParser(prog='lispy', description='Run a LisPy unit.')
+    ap.add_argument('unit', help='the name of the unit to run')
+    ap.add_argument('-I', '--path', action='append', metavar='DIR',
+                    help='directory to load units from (may be repeated; '
+                         'default: the current directory)')
+    ap.add_argument('-e', '--engine', default=None,
+                    help='evaluation engine: tree, closure, stack or vm')
+    ap.add_argument('-a', '--arg-mode', default=None,
+                    help='how arguments are passed: strict, name or need')
+    ap.add_argument('-p', '--parser', default=None,
+                    help='parser backend: ply or reader')
+    ap.add_argument('--stream', action='store_true',
+                    help='read and run the unit one top-level form at a '
+                         'time, so that very large units fit in memory')
+    ap.add_argument('--cache-dir', default=None, metavar='DIR',
+                    help='keep compiled units in DIR between runs')
+    ap.add_argument('--profile', action='store_true',
+                    help='time the calls of each function, and print them '
+                         'to stderr after the run')
+    ap.add_argument('--profile-sort', default='cumtime',
+                    choices=('calls', 'tottime', 'cumtime', 'name'),
+                    help='the column to sort the profile by (default: '
+                         'cumtime)')
+    ap.add_argument('--profile-output', default=None, metavar='FILE',
+                    help='profile the run, and write the results to FILE '
+                         'in the format read by pstats')
+    ap.add_argument('--sample', default=None, metavar='FILE',
+                    help='sample the LisPy call stack while the unit runs, '
+                         'and write the samples to FILE in the collapsed '
+                         'stack format read by flame graph tools')
+    ap.add_argument('--sample-interval', default=0.005, type=float,
+                    metavar='SECONDS',
+                    help='the time between samples (default: 0.005)')
+    return ap
+
+
+def main(argv=None):
+    '''
+    :param argv: the command line arguments (default: sys.argv[1:])
+    :type argv: list[str] or None
+    :return: the exit status
+    :rtype: int
+    '''
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['batch']:
+        from . import batch
+        return batch.main(argv[1:])
+    ap = make_arg_parser()
+    args = ap.parse_args(argv)
+
+    from .interpreter import Interpreter
+    from .interpreter.loader import FileSysLoader
+    from .interpreter.error import LispyError
+
+    kwargs = dict()
+    if args.engine is not None:
+        kwargs['engine'] = args.engine
+    if args.arg_mode is not None:
+        kwargs['arg_mode'] = args.arg_mode
+    if args.parser is not None:
+        kwargs['parser'] = args.parser
+    if args.cache_dir is not None:
+        from .interpreter.cache import UnitCache
+        kwargs['cache'] = UnitCache(directory=args.cache_dir)
+    if args.profile or args.profile_output is not None:
+        kwargs['profile'] = True
+    if args.sample is not None:
+        kwargs['sample_interval'] = args.sample_interval
+    loader = FileSysLoader(args.path or [os.getcwd()])
+    try:
+        interpreter = Interpreter(loader, **kwargs)
+    except ValueError as e:
+        ap.error(str(e))
+    try:
+        if args.stream:
+            with loader.open_unit(args.unit) as f:
+                interpreter.run_stream(f, args.unit)
+        else:
+            interpreter.run_module(args.unit)
+    except LispyError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        profiler = interpreter.profiler
+        if args.profile:
+            profiler.print_stats(sort=args.profile_sort, file=sys.stderr)
+        if args.profile_output is not None:
+            profiler.dump_stats(args.profile_output)
+        if args.sample is not None:
+            interpreter.sampler.write_collapsed(args.sample)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
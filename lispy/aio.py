@@ -0,0 +1,114 @@
+'''
+Running LisPy from asyncio.
+
+Evaluation is plain Python, and a unit may run for as long as it likes, so a
+unit that is awaited (see Interpreter.run_module_async) is run in a worker
+thread: interpreters are reentrant, so any number of units can run at once,
+and the event loop goes on serving other tasks while they do.
+
+The running unit stays linked to the event loop it was awaited from:
+
+* a builtin made by async_builtin can do its I/O as a coroutine on the
+  loop, while the unit's thread waits for the result, so the I/O of many
+  units overlaps
+* every CHECK_INTERVAL steps (calls of LisPy functions and iterations of
+  while loops: see interpreter.budget), the unit yields to the loop (see
+  checkpoint): it waits for the loop to go round once, so a unit that spins
+  can't starve the loop, and a unit whose task has been cancelled stops
+  there
+'''
+import asyncio
+import contextvars
+import functools
+
+from .builtins import strict
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The number of steps between checkpoints
+CHECK_INTERVAL = 1024
+
+# the _Link of the unit that is running in this thread, if it was awaited
+_link = contextvars.ContextVar('lispy_aio_link', default=None)
+
+
+class _Link(object):
+    '''
+    The link between a unit running in a worker thread and the event loop
+    it was awaited from.
+    '''
+
+    def __init__(self, loop):
+        self.loop = loop
+        #: set when the awaiting task is cancelled
+        self.cancelled = False
+
+    def wait(self, coroutine):
+        '''
+        Run a coroutine on the loop, and wait for its result.
+
+        :raises asyncio.CancelledError: if the awaiting task has been
+                                        cancelled
+        '''
+        if self.cancelled:
+            coroutine.close()
+            raise asyncio.CancelledError()
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+
+async def run_in_thread(func, *args):
+    '''
+    Call func(*args) in a thread of the running loop's default executor,
+    linked to the loop (see checkpoint and async_builtin).  If the awaiting
+    task is cancelled, func is stopped at its next checkpoint.
+
+    :return: the result of func
+    '''
+    loop = asyncio.get_running_loop()
+    link = _Link(loop)
+    context = contextvars.copy_context()
+    context.run(_link.set, link)
+    try:
+        return await loop.run_in_executor(
+            None, functools.partial(context.run, func, *args))
+    except asyncio.CancelledError:
+        link.cancelled = True
+        raise
+
+
+def checkpoint():
+    '''
+    Yield to the event loop, if the unit running in this thread was awaited.
+    Runs call this every CHECK_INTERVAL steps (see interpreter.budget).
+
+    :raises asyncio.CancelledError: if the awaiting task has been cancelled
+    '''
+    link = _link.get()
+    if link is not None:
+        link.wait(asyncio.sleep(0))
+
+
+def async_builtin(func):
+    '''
+    Make a builtin from a coroutine function, for builtins that do I/O.
+
+    The builtin is strict (see builtins.strict): its arguments are
+    evaluated first (in order, in the unit's thread), and the coroutine
+    function is called with their values (not with the caller's scope).
+    In a unit that was awaited, the coroutine runs on the event loop, and
+    the unit waits for its result.  Otherwise, it runs on an event loop
+    of its own (see asyncio.run).
+
+    :param func: the coroutine function
+    :type func: (any...) -> coroutine
+    :return: the builtin
+    :rtype: function
+    '''
+    @strict
+    @functools.wraps(func)
+    def builtin(parent_scope, *values):
+        link = _link.get()
+        if link is None:
+            return asyncio.run(func(*values))
+        return link.wait(func(*values))
+    return builtin
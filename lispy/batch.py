@@ -0,0 +1,287 @@
+'''
+Running many units across a pool of processes.
+
+    python -m lispy batch [options] unit...
+
+Each worker process is started once, and is warmed up before it runs any
+units: it makes its interpreter and parser, and runs the prelude (if there
+is one), taking a snapshot of the global environment it leaves (see
+Interpreter.snapshot).  Every unit is then run from that snapshot, so units
+don't see each other's bindings, and the prelude is only run once per
+worker.  Units are sent to the workers in chunks, and their results are
+streamed back, in order or as they finish.
+'''
+import itertools
+import multiprocessing
+import os
+import pickle
+import sys
+from collections import namedtuple
+
+from . import parser
+from .interpreter import Interpreter
+from .interpreter.budget import Budget
+from .interpreter.error import LispyError
+from .interpreter.loader import CachedFileSysLoader
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The number of units sent to a worker at a time, by default
+DEFAULT_CHUNKSIZE = 32
+
+'''
+The result of running one unit in a batch.
+
+Attributes:
+    unit: the name of the unit
+    value: the value of the unit (or its repr, if it can't be sent back from
+           the worker), or None if it failed
+    error: the error message, if the unit failed, or None
+'''
+BatchResult = namedtuple('BatchResult', 'unit value error')
+
+
+def default_start_method():
+    '''
+    :return: the way worker processes are started: 'forkserver' where it is
+             available, so that workers are forked from a small, clean
+             process that has already imported lispy, and the platform's
+             default elsewhere
+    :rtype: str
+    '''
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return 'forkserver'
+    return multiprocessing.get_start_method()
+
+
+def run_batch(jobs, path=None, prelude=None, processes=None,
+              chunksize=DEFAULT_CHUNKSIZE, ordered=True, start_method=None,
+              **interpreter_kwargs):
+    '''
+    Run units across a pool of worker processes.
+
+    :param jobs: the units to run.  Each is the name of a unit, which is
+                 loaded from path, or a (name, source text) pair.
+    :type jobs: iterable[str or (str, str)]
+    :param path: the directories that units (including the prelude, and
+                 units they load) are loaded from (default: the current
+                 directory)
+    :type path: list[str] or None
+    :param prelude: the name of a unit that each worker runs before any
+                    other, or None
+    :type prelude: str or None
+    :param processes: the number of worker processes (default: the number
+                      of CPUs)
+    :type processes: int or None
+    :param chunksize: the number of units sent to a worker at a time
+    :type chunksize: int
+    :param ordered: if True, results are yielded in the order of jobs.
+                    Otherwise they are yielded as soon as they are ready.
+    :type ordered: bool
+    :param start_method: how worker processes are started (see
+                         multiprocessing), or None for
+                         default_start_method()
+    :type start_method: str or None
+    :param interpreter_kwargs: passed to each worker's Interpreter (engine,
+                               arg_mode, parser...)
+    :return: the result of each unit
+    :rtype: iterator[BatchResult]
+    '''
+    context = multiprocessing.get_context(start_method or
+                                          default_start_method())
+    if context.get_start_method() == 'forkserver':
+        context.set_forkserver_preload(['lispy.batch', 'lispy.interpreter'])
+    config = (list(path or [os.getcwd()]), prelude, interpreter_kwargs)
+    with context.Pool(processes, initializer=_init_worker,
+                      initargs=(config,)) as pool:
+        run = pool.imap if ordered else pool.imap_unordered
+        yield from run(_run_job, jobs, chunksize)
+
+
+class _Worker(object):
+    '''
+    The interpreter of a worker process, and the snapshot units are run
+    from.
+    '''
+
+    def __init__(self, config):
+        path, prelude, interpreter_kwargs = config
+        self.loader = _JobLoader(path)
+        self.interpreter = Interpreter(self.loader, **interpreter_kwargs)
+        # warm up: make the parser now, rather than for the first unit
+        parser.get_parser(interpreter_kwargs.get('parser',
+                                                 parser.DEFAULT_PARSER))
+        self.error = None
+        try:
+            if prelude is not None:
+                self.interpreter.run_module(prelude)
+            self.snapshot = self.interpreter.snapshot()
+        except Exception as e:
+            self.error = 'prelude %s failed: %s' % (prelude, _message(e))
+
+    def run(self, job):
+        '''
+        :param job: a unit name, or a (name, source text) pair
+        :return: the result of running the unit
+        :rtype: BatchResult
+        '''
+        if isinstance(job, str):
+            name = job
+            self.loader.sources = dict()
+        else:
+            name, source_text = job
+            self.loader.sources = {name: source_text}
+        if self.error is not None:
+            return BatchResult(name, None, self.error)
+        try:
+            value = self.interpreter.run_module(name, self.snapshot)
+        except Exception as e:
+            return BatchResult(name, None, _message(e))
+        try:
+            pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            value = repr(value)
+        return BatchResult(name, value, None)
+
+
+def _message(e):
+    '''
+    :return: the message for an error raised by a unit
+    :rtype: str
+    '''
+    if isinstance(e, LispyError):
+        return str(e)
+    return '%s: %s' % (type(e).__name__, e)
+
+
+class _JobLoader(CachedFileSysLoader):
+    '''
+    Loads a job's own source text (if it has one) by its name, and other
+    units from the file system.
+    '''
+
+    def __init__(self, module_dirs):
+        super().__init__(module_dirs)
+        #: the source text of the job being run (unit name -> text)
+        self.sources = dict()
+
+    def load_unit(self, unit_name, pos=None):
+        source_text = self.sources.get(unit_name)
+        if source_text is not None:
+            return source_text
+        return super().load_unit(unit_name, pos)
+
+
+_worker = None
+
+
+def _init_worker(config):
+    global _worker
+    _worker = _Worker(config)
+
+
+def _run_job(job):
+    return _worker.run(job)
+
+
+def make_arg_parser():
+    '''
+    :return: the parser for the batch command's arguments
+    :rtype: argparse.ArgumentParser
+    '''
+    import argparse
+    ap = argparse.ArgumentParser(
+        prog='lispy batch',
+        description='Run many LisPy units across a pool of processes.  One '
+                    'line is printed for each unit: its name and its value, '
+                    'separated by a tab.  Errors are printed to stderr.')
+    ap.add_argument('units', nargs='*', metavar='unit',
+                    help='the names of the units to run')
+    ap.add_argument('-f', '--units-from', metavar='FILE',
+                    help='read the names of units to run from FILE, one per '
+                         'line (- for stdin)')
+    ap.add_argument('-I', '--path', action='append', metavar='DIR',
+                    help='directory to load units from (may be repeated; '
+                         'default: the current directory)')
+    ap.add_argument('--prelude', metavar='UNIT',
+                    help='a unit that each worker runs before the others')
+    ap.add_argument('-j', '--jobs', type=int, default=None,
+                    help='the number of worker processes (default: the '
+                         'number of CPUs)')
+    ap.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                    help='the number of units sent to a worker at a time')
+    ap.add_argument('--unordered', action='store_true',
+                    help='print results as they are ready, rather than in '
+                         'the order of the units')
+    ap.add_argument('--start-method', default=None,
+                    choices=multiprocessing.get_all_start_methods(),
+                    help='how worker processes are started (default: %s)'
+                         % default_start_method())
+    ap.add_argument('-e', '--engine', default=None,
+                    help='evaluation engine: tree, closure, stack or vm')
+    ap.add_argument('-a', '--arg-mode', default=None,
+                    help='how arguments are passed: strict, name or need')
+    ap.add_argument('-p', '--parser', default=None,
+                    help='parser backend: ply or reader')
+    ap.add_argument('--max-steps', type=int, default=None,
+                    help='stop a unit after this many function calls and '
+                         'loop iterations')
+    ap.add_argument('--time-limit', type=float, default=None,
+                    metavar='SECONDS', help='stop a unit after this long')
+    ap.add_argument('--max-allocations', type=int, default=None,
+                    help='stop a unit after it has made this many frames '
+                         'and lists')
+    return ap
+
+
+def _read_names(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def main(argv=None):
+    '''
+    :param argv: the batch command's arguments
+    :type argv: list[str] or None
+    :return: the exit status: 1 if any unit failed
+    :rtype: int
+    '''
+    ap = make_arg_parser()
+    args = ap.parse_args(argv)
+    kwargs = dict()
+    for name in ('engine', 'arg_mode', 'parser'):
+        if getattr(args, name) is not None:
+            kwargs[name] = getattr(args, name)
+    limits = (args.max_steps, args.time_limit, args.max_allocations)
+    if limits != (None, None, None):
+        kwargs['budget'] = Budget(*limits)
+    try:
+        # fail here, rather than in every worker
+        Interpreter(None, cache=None, **kwargs)
+    except ValueError as e:
+        ap.error(str(e))
+    jobs = args.units
+    names_file = None
+    if args.units_from is not None:
+        if args.units_from == '-':
+            names_file = sys.stdin
+        else:
+            names_file = open(args.units_from)
+        jobs = itertools.chain(jobs, _read_names(names_file))
+    status = 0
+    try:
+        for result in run_batch(jobs, args.path, args.prelude, args.jobs,
+                                args.chunksize, not args.unordered,
+                                args.start_method, **kwargs):
+            if result.error is None:
+                print('%s\t%s' % (result.unit, result.value))
+            else:
+                status = 1
+                print('%s\t%s' % (result.unit, result.error),
+                      file=sys.stderr)
+    finally:
+        if names_file not in (None, sys.stdin):
+            names_file.close()
+    return status
@@ -1,2 +1,3 @@
 __author__ = 'Dan Bullok and Ben Lambeth'
-from .builtins import global_builtins, interpreter_builtins
+from .builtins import global_builtins, interpreter_builtins, \
+    tail_positions, strict_builtins, special_forms, pure_builtins, strict
@@ -7,6 +7,24 @@ __author__ = 'Dan Bullok and Ben Lambeth'
 
 import operator, functools
 
+#: Builtins that evaluate all their arguments, in order, before doing
+#: anything else (see strict).
+strict_builtins = set()
+
+
+def strict(builtin):
+    '''
+    Declare a builtin strict.  It is called with the caller's scope and the
+    values of its arguments, in order, rather than the argument expressions:
+    the evaluator works out the values itself, and passes them straight in.
+
+    :param builtin: the builtin
+    :type builtin: function
+    :return: builtin
+    '''
+    strict_builtins.add(builtin)
+    return builtin
+
 
 def ifBuiltin(parent_scope, condition, true_expr, false_expr):
     if condition.evaluate(parent_scope):
@@ -19,31 +37,30 @@ def expandArgs(parent_scope, args):
     return [a.evaluate(parent_scope) for a in args]
 
 
+@strict
 def plusBuiltin(parent_scope, *args):
-    x = expandArgs(parent_scope, args)
-    return sum(x)
+    return sum(args)
 
 
+@strict
 def minusBuiltin(parent_scope, *args):
-    x = expandArgs(parent_scope, args)
-    return functools.reduce(operator.sub, x[1:], x[0])
+    return functools.reduce(operator.sub, args[1:], args[0])
 
 
+@strict
 def timesBuiltin(parent_scope, *args):
-    x = expandArgs(parent_scope, args)
-    return functools.reduce(operator.mul, x, 1)
+    return functools.reduce(operator.mul, args, 1)
 
 
+@strict
 def divBuiltin(parent_scope, *args):
-    x = expandArgs(parent_scope, args)
-
     def sensitiveDiv(a, b):
         if type(a) is float or type(b) is float:
             return a / b
         else:
             return a // b
 
-    return functools.reduce(sensitiveDiv, x[1:], x[0])
+    return functools.reduce(sensitiveDiv, args[1:], args[0])
 
 
 def compareBuiltin(op):
@@ -54,15 +71,15 @@ def compareBuiltin(op):
     :type op: (any, any) -> bool
     :return: comparison function suitable for use as a builtin
     '''
+    @strict
     def f(parent_scope, *args):
-        last_value = args[0].evaluate(parent_scope)
-        for a in args[1:]:
-            v = a.evaluate(parent_scope)
-            if op(v, last_value):
-                last_value = v
-                continue
-            return False
+        last_value = args[0]
+        for v in args[1:]:
+            if not op(v, last_value):
+                return False
+            last_value = v
         return True
+    f.op = op
     return f
 
 
@@ -72,13 +89,32 @@ ltBuiltin = compareBuiltin(lambda x, y: x < y)
 gtBuiltin = compareBuiltin(lambda x, y: x > y)
 gteBuiltin = compareBuiltin(lambda x, y: x >= y)
 lteBuiltin = compareBuiltin(lambda x, y: x <= y)
-orBuiltin = compareBuiltin(lambda x, y: x or y)
-andBuiltin = compareBuiltin(lambda x, y: x and y)
+
+
+def orBuiltin(parent_scope, *args):
+    # stops at the first true argument
+    for a in args:
+        if a.evaluate(parent_scope):
+            return True
+    return False
+
+
+def andBuiltin(parent_scope, *args):
+    # stops at the first false argument
+    for a in args:
+        if not a.evaluate(parent_scope):
+            return False
+    return True
 
 
 def whileBuiltin(parent_scope, cond, *body):
     last_value = None
+    # each iteration is a step (see interpreter.budget)
+    meter = parent_scope.meter
     while (cond.evaluate(parent_scope)):
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(cond.pos)
         for a in body:
             last_value = a.evaluate(parent_scope)
     return last_value
@@ -97,14 +133,38 @@ def printBuiltin(parent_scope, *args):
         print(last_value)
     return last_value
 
-def loadBuiltinMaker(interpreter):
-    def loadBuiltin(parent_scope, *unit_names):
+def unitBuiltin(load):
+    '''
+    Create a builtin that loads units.
+
+    :param load: loads a unit, given its name and the position of the
+                 request, and returns its value
+    :type load: (str, TokenPos) -> any
+    :return: a builtin that loads each unit named by its arguments, and
+             returns the value of the last
+    '''
+    def unitsBuiltin(parent_scope, *unit_names):
         assert (len(unit_names)>=1)
         result=None
         for unit in unit_names:
-            result = interpreter.evaluate_unit(unit)
+            result = load(unit.evaluate(parent_scope), unit.pos)
         return result
-    return loadBuiltin
+    return unitsBuiltin
+
+
+def loadBuiltinMaker(interpreter):
+    # runs a unit unless it has been loaded from the same source
+    return unitBuiltin(interpreter.load_unit)
+
+
+def reloadBuiltinMaker(interpreter):
+    # runs a unit even if it has been loaded
+    return unitBuiltin(functools.partial(interpreter.load_unit, force=True))
+
+
+def requireBuiltinMaker(interpreter):
+    # runs a unit unless it has been loaded
+    return unitBuiltin(interpreter.require_unit)
 
 
 #: Default set of builtin functions (function name -> function)
@@ -128,5 +188,31 @@ global_builtins = {
 }
 
 interpreter_builtins = {
-    'load': loadBuiltinMaker
+    'load': loadBuiltinMaker,
+    'reload': reloadBuiltinMaker,
+    'require': requireBuiltinMaker
 }
+
+#: Builtins that return the value of one of their argument expressions
+#: unchanged (builtin -> function that, given the number of arguments,
+#: returns the positions of those arguments).  When a call to one of these is
+#: in tail position, so are those arguments.
+tail_positions = {
+    ifBuiltin: lambda nargs: (1, 2),
+    beginBuiltin: lambda nargs: (nargs - 1,),
+}
+
+#: Builtins that control whether, and how often, their arguments are
+#: evaluated.  Calls to these are special forms: the evaluators carry them
+#: out themselves, as long as the name still refers to the builtin when the
+#: call runs (see datatypes.SpecialForm).
+special_forms = frozenset((ifBuiltin, whileBuiltin, beginBuiltin, andBuiltin,
+                           orBuiltin))
+
+#: Builtins whose value depends only on the values of their arguments, and
+#: that have no effects.  A call to one of these with constant arguments can
+#: be worked out before it runs.
+pure_builtins = frozenset((plusBuiltin, minusBuiltin, timesBuiltin,
+                           divBuiltin, eqBuiltin, neqBuiltin, ltBuiltin,
+                           gtBuiltin, lteBuiltin, gteBuiltin, orBuiltin,
+                           andBuiltin))
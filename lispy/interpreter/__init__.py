@@ -1,75 +1,480 @@
 __author__ = 'Dan Bullok and Ben Lambeth'
 
-from .scope import Scope, ArgExpr
+from .scope import Scope, ArgExpr, BY_NAME
 from .datatypes import StaticDatum, VarRef, Set, FunctionDef, FunctionCall, \
     ExprSeq, List
 from .error import UnitNotFoundError
 
 
-def make_datum(t):
+def _children(t):
     '''
-    Create a Datum from a AstNode.
-
-    :param t: the AST node convert from
-    :type t: AstNode
-    :return: A datum representing the node
-    :rtype: datatypes.Datum
+    :return: the AST nodes that a node's datum is built from
+    :rtype: list
     '''
+    dtype, dval, dpos = t
+    if dtype == 'SET':
+        return [dval['value']]
+    elif dtype == 'DEFUN':
+        return [dval['body']]
+    elif dtype == 'FUNC_CALL':
+        return dval['arg_exprs'][1]
+    elif dtype in ('EXPRSEQ', 'LIST'):
+        return dval
+    return []
+
 
+def _build(t, children):
+    '''
+    Create the Datum for a node from the Datums of its children.
+    '''
     dtype, dval, dpos = t
     if dtype in ('BOOL', 'INT', 'FLOAT', 'STRING'):
         return StaticDatum(dpos, dval)
     elif dtype == 'ID':
         return VarRef(dpos, t)
     elif dtype == 'SET':
-        dval['value'] = make_datum(dval['value'])
-        return Set(dpos, **dval)
+        return Set(dpos, dval['name'], children[0])
     elif dtype == 'DEFUN':
-        dval['body'] = make_datum(dval['body'])
-        return FunctionDef(dpos, **dval)
+        return FunctionDef(dpos, dval['name'], dval['args'], children[0])
     elif dtype == 'FUNC_CALL':
-        dval['arg_exprs'] = [make_datum(a) for a in dval['arg_exprs'][1]]
-        return FunctionCall(dpos, **dval)
+        return FunctionCall(dpos, dval['name'], children)
     elif dtype == 'EXPRSEQ':
-        return ExprSeq(dpos, [make_datum(i) for i in dval])
+        return ExprSeq(dpos, children)
     elif dtype == 'LIST':
-        return List(dpos, [make_datum(i) for i in dval])
+        return List(dpos, children)
     else:
         raise Exception("Unknown statement type %s at %s.  Value = %s" % (
             dtype, dpos, dval))
 
 
+def make_datum(t):
+    '''
+    Create a Datum from a AstNode.
+
+    The tree is walked with an explicit stack rather than by recursion, so
+    deeply nested source doesn't run into Python's recursion limit.  The AST
+    is not modified.
+
+    :param t: the AST node convert from
+    :type t: AstNode
+    :return: A datum representing the node
+    :rtype: datatypes.Datum
+    '''
+    # (node, number of children) for nodes whose children are being built,
+    # and the datums that have been built but not yet used by their parent.
+    todo = [(t, None)]
+    built = []
+    while todo:
+        node, nchildren = todo.pop()
+        if nchildren is None:
+            children = _children(node)
+            todo.append((node, len(children)))
+            todo.extend((c, None) for c in reversed(children))
+        elif nchildren:
+            children = built[-nchildren:]
+            del built[-nchildren:]
+            built.append(_build(node, children))
+        else:
+            built.append(_build(node, []))
+    return built[0]
+
+
 __DEFAULT_BUILTINS__ = 'builtins'
 
-from ..parser import LispyParser
-from .scope import GlobalScope
-from ..builtins import global_builtins, interpreter_builtins
+import contextlib
+import inspect
+import threading
+
+from .. import aio, parser as parsers
+from .engine import make_engine, DEFAULT_ENGINE
+from .optimizer import optimize
+from .cache import shared_cache, source_hash
+from .budget import Meter
+from .profiler import Profiler, unit_key
+from .sampler import Sampler
+from ..builtins import global_builtins
+from .modules import ModuleRegistry
+from .snapshot import Snapshot
+
+
+def _async_builtins(bindings):
+    '''
+    :param bindings: builtins (name -> value)
+    :type bindings: Mapping
+    :return: a copy of bindings, with each coroutine function in it made
+             into a builtin (see aio.async_builtin)
+    :rtype: dict
+    '''
+    return {name: (aio.async_builtin(value)
+                   if inspect.iscoroutinefunction(value) else value)
+            for name, value in bindings.items()}
 
 
 class Interpreter(object):
-    def __init__(self, loader, debug_level=0, builtins=None):
+    '''
+    Loads, compiles and runs units.
+
+    An interpreter is reentrant.  Each call to run_module (or run_stream)
+    starts a run of its own, with its own global environment and module
+    registry, and the interpreter holds nothing that changes while a unit
+    runs.  So separate interpreters, or one interpreter, can run units at
+    once in any number of threads, including under free-threaded builds of
+    CPython, where the threads really do run at the same time.  What runs
+    share (the parsers, the cache of compiled units, the builtins and
+    snapshots) is either never changed or locked.  The methods that act on
+    the last run (modules, snapshot, load_unit...) act on the last run
+    started by the calling thread.
+    '''
+
+    def __init__(self, loader, debug_level=0, builtins=None,
+                 engine=DEFAULT_ENGINE, arg_mode=BY_NAME,
+                 cache=shared_cache, parser=parsers.DEFAULT_PARSER,
+                 budget=None, profile=False, sample_interval=None):
+        '''
+        :param loader: the loader used to retrieve source units
+        :type loader: loader.Loader
+        :param builtins: the bindings every run starts with (name ->
+                         value), or None for lispy.builtins.global_builtins.
+                         A coroutine function among them is made into a
+                         builtin by aio.async_builtin, so that it is
+                         awaited rather than returning its coroutine.
+        :type builtins: Mapping or None
+        :param engine: the name of the evaluation engine.  'closure' (the
+                       default) compiles each unit to Python closures before
+                       running it.  'tree' walks the Datum tree directly,
+                       and is kept for differential testing.  'stack'
+                       evaluates with an explicit stack, so deep recursion
+                       doesn't exhaust the Python stack.  'vm' compiles
+                       each unit to bytecode and runs it on a virtual
+                       machine.  The engines don't scope names the same
+                       way.  The compiled ones (closure, stack and vm) scope
+                       them lexically: a function sees the names bound
+                       where it is written (see resolver.py).  The tree
+                       engine scopes them dynamically: a function sees the
+                       names bound by its callers.  A function that uses a
+                       name bound by a caller it isn't written inside only
+                       finds it on the tree engine.
+        :type engine: str
+        :param arg_mode: how arguments are passed to functions: 'strict'
+                         evaluates them before the call, 'name' (the
+                         default) each time they are used, and 'need' the
+                         first time they are used.
+        :type arg_mode: str
+        :param cache: where compiled units are cached.  By default, the
+                      cache shared by all interpreters in the process.  Use
+                      None to compile every unit each time it is loaded.
+        :type cache: cache.UnitCache or None
+        :param parser: the name of the parser backend (see lispy.parser).
+                       'ply' (the default) uses the parser generated by ply,
+                       and 'reader' the hand-written reader, which is
+                       faster.  Both produce the same syntax tree.
+        :type parser: str
+        :param budget: the limits on the work each run may do, or None for
+                       no limits.  A run that goes over one raises
+                       BudgetExceededError.
+        :type budget: budget.Budget or None
+        :param profile: if True, time every call of a function or builtin,
+                        and every unit run, in profiler (see
+                        profiler.Profiler).  Profiled runs are slower.
+        :type profile: bool
+        :param sample_interval: if given, sample the LisPy call stacks of
+                                the runs every sample_interval seconds, in
+                                sampler (see sampler.Sampler).  Sampling
+                                costs next to nothing.
+        :type sample_interval: float or None
+        '''
+        if parser not in parsers.PARSERS:
+            raise ValueError('Unknown parser "%s".  Choose one of: %s' %
+                             (parser, ', '.join(parsers.PARSERS)))
         self._loader = loader
-        self._parser = LispyParser()
-        self._global_scope = None
-
-    def run_module(self, unit_name):
-        source_text = self._loader.load_unit(unit_name)
-        ast = self._parser.parse(unit_name, source_text)
-        self._global_scope = GlobalScope(global_builtins,
-                                         interpreter_builtins,
-                                         self)
-        code = make_datum(ast)
-        result = code.evaluate(self._global_scope)
-        # print(result)
-        return result
+        self._engine = make_engine(engine, arg_mode)
+        self._cache = cache
+        self._parser = parser
+        #: the bindings every run starts with (name -> value)
+        self.builtins = (global_builtins if builtins is None
+                         else _async_builtins(builtins))
+        self.budget = budget
+        #: records the calls made by the interpreter's runs, if they are
+        #: profiled
+        self.profiler = Profiler() if profile else None
+        #: samples the call stacks of the interpreter's runs, if they are
+        #: sampled
+        self.sampler = (None if sample_interval is None
+                        else Sampler(sample_interval))
+        # the last run started by each thread
+        self._local = threading.local()
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @property
+    def modules(self):
+        '''
+        :return: the units loaded by the last run (unit name ->
+                 modules.Module)
+        :rtype: modules.ModuleRegistry
+        '''
+        return self._last_run().modules
+
+    def compile_unit(self, unit_name, pos=None):
+        '''
+        Load, parse and compile a unit.
+
+        :param unit_name: the name of the unit to compile
+        :type unit_name: str
+        :param pos: the position of the request (see Loader.load_unit)
+        :type pos: TokenPos or None
+        :return: the compiled unit, ready to be evaluated
+        '''
+        return self._compile_source(unit_name,
+                                    self._loader.load_unit(unit_name, pos))
+
+    def _compile_source(self, unit_name, source_text):
+        if self._cache is None:
+            return self._compile(self._parse(unit_name, source_text))
+        return self._cache.compiled(unit_name, source_text, self._engine,
+                                    self._parse, self._compile)
+
+    def _parse(self, unit_name, source_text):
+        # the parser is only loaded if a unit isn't in the cache
+        return parsers.get_parser(self._parser).parse(unit_name, source_text)
+
+    def _compile(self, ast):
+        datum = make_datum(ast)
+        if self._engine.optimize:
+            datum = optimize(datum)
+        return self._engine.compile(datum)
+
+    def run_module(self, unit_name, snapshot=None):
+        '''
+        Run a unit in a new global environment.
+
+        :param unit_name: the name of the unit to run
+        :type unit_name: str
+        :param snapshot: the global environment to start from, or None to
+                         start with just the builtins
+        :type snapshot: Snapshot or None
+        :return: the value of the unit
+        '''
+        return self._start(snapshot).load_unit(unit_name)
+
+    def snapshot(self):
+        '''
+        Freeze the global environment left by the last run (or the builtins,
+        if nothing has been run), so that runs can start from it (see
+        run_module).  The interpreter itself goes on from the snapshot, as
+        though it had started from it, so the snapshot doesn't change.
+
+        :return: the snapshot
+        :rtype: Snapshot
+        '''
+        run = self._last_run()
+        own, shared = self._engine.global_layers(run.global_scope)
+        snapshot = Snapshot(self._engine.name, self._engine.arg_mode,
+                            dict(shared, **own), dict(run.modules))
+        self._start(snapshot)
+        return snapshot
+
+    def _start(self, snapshot):
+        '''
+        Start a new run, as the calling thread's last run.
+
+        :rtype: _Run
+        '''
+        run = _Run(self, snapshot)
+        self._local.run = run
+        return run
+
+    def _last_run(self):
+        '''
+        :return: the last run started by the calling thread.  One is started
+                 if there hasn't been one.
+        :rtype: _Run
+        '''
+        run = getattr(self._local, 'run', None)
+        if run is None:
+            run = self._start(None)
+        return run
 
-    def evaluate_unit(self, unit_name):
-        source_text = self._loader.load_unit(unit_name)
-        ast = self._parser.parse(unit_name, source_text)
-        code = make_datum(ast)
-        result = code.evaluate(self._global_scope)
+    def run_stream(self, source, unit_name='<stream>', snapshot=None):
+        '''
+        Run a unit made of a sequence of top-level forms, reading, compiling
+        and evaluating one form at a time, so that only the form being run
+        is held in memory (see lispy.parser.reader.Reader.read_forms).
+        Streams are always read with the 'reader' parser backend, and aren't
+        cached.
+
+        :param source: the text of the unit, a file (opened in text mode) to
+                       read it from, or an iterable of chunks of it
+        :type source: str or io.TextIOBase or iterable[str]
+        :param unit_name: the name of the unit (used in positions)
+        :type unit_name: str
+        :param snapshot: the global environment to start from (see
+                         run_module)
+        :type snapshot: Snapshot or None
+        :return: the value of the last form, or None if there are none
+        '''
+        run = self._start(snapshot)
+        with run.sampling():
+            scope = run.global_scope
+            result = None
+            for form in parsers.get_parser('reader').read_forms(unit_name,
+                                                                source):
+                result = self._compile(form).evaluate(scope)
         return result
 
+    def load_unit(self, unit_name, pos=None, force=False):
+        '''
+        Load a unit into the global scope of the last run, and record it in
+        the run's module registry.  The unit is only run if it hasn't been
+        loaded yet, its source text has changed since it was, or force is
+        True.  A unit that is already being loaded (because it loads itself,
+        directly or not) is never run again.
+
+        :param unit_name: the name of the unit to load
+        :type unit_name: str
+        :param pos: the position of the request (see Loader.load_unit)
+        :type pos: TokenPos or None
+        :param force: if True, run the unit even if it has been loaded
+        :type force: bool
+        :return: the value of the unit (when it was last run)
+        '''
+        return self._last_run().load_unit(unit_name, pos, force)
+
+    def require_unit(self, unit_name, pos=None):
+        '''
+        Load a unit, if it hasn't been loaded yet.  Unlike load_unit, the
+        source of a unit that has been loaded isn't read again to see if it
+        has changed.
+
+        :param unit_name: the name of the unit to load
+        :type unit_name: str
+        :param pos: the position of the request (see Loader.load_unit)
+        :type pos: TokenPos or None
+        :return: the value of the unit
+        '''
+        return self._last_run().require_unit(unit_name, pos)
+
+    def evaluate_unit(self, unit_name, pos=None):
+        '''
+        Run a unit, even if it has already been loaded (see load_unit).
+        '''
+        return self.load_unit(unit_name, pos, force=True)
+
+    async def run_module_async(self, unit_name, snapshot=None):
+        '''
+        Run a unit in a new global environment, as a coroutine (see
+        run_module).  The unit runs in a worker thread, so the event loop
+        isn't blocked while it does.  Builtins made by aio.async_builtin run
+        on the event loop, and the unit yields to it every so many steps (see
+        lispy.aio).  Cancelling the task stops the unit at its next
+        checkpoint or async builtin.
+
+        :param unit_name: the name of the unit to run
+        :type unit_name: str
+        :param snapshot: the global environment to start from, or None to
+                         start with just the builtins
+        :type snapshot: Snapshot or None
+        :return: the value of the unit
+        '''
+        run = self._start(snapshot)
+        return await aio.run_in_thread(run.load_unit, unit_name)
+
+    async def evaluate_async(self, unit_name, pos=None):
+        '''
+        Run a unit in the last run's global environment, as a coroutine,
+        even if it has already been loaded (see evaluate_unit and
+        run_module_async).
+
+        :param unit_name: the name of the unit to run
+        :type unit_name: str
+        :param pos: the position of the request (see Loader.load_unit)
+        :type pos: TokenPos or None
+        :return: the value of the unit
+        '''
+        run = self._last_run()
+        return await aio.run_in_thread(run.load_unit, unit_name, pos, True)
+
+
+class _Run(object):
+    '''
+    One run of an interpreter: the global scope that units are run in, the
+    modules they have loaded, and the meter that counts their work against
+    the interpreter's budget.  The load, reload and require builtins in
+    the scope act on the run, not the interpreter, so runs going on at the
+    same time don't see each other's units.
+    '''
+
+    def __init__(self, interpreter, snapshot):
+        '''
+        :param interpreter: the interpreter that loads and compiles units
+        :type interpreter: Interpreter
+        :param snapshot: the global environment to start from, or None to
+                         start with just the builtins
+        :type snapshot: Snapshot or None
+        '''
+        self.interpreter = interpreter
+        engine = interpreter.engine
+        profiler = interpreter.profiler
+        if snapshot is None:
+            self.modules = ModuleRegistry()
+            bindings = interpreter.builtins
+        else:
+            snapshot.check(engine)
+            self.modules = ModuleRegistry(snapshot.modules)
+            bindings = snapshot.bindings
+        if profiler is not None:
+            bindings = profiler.wrap_bindings(bindings)
+        self.global_scope = engine.new_global_scope(self, bindings)
+        #: counts the work done by the run (see budget.Meter)
+        self.meter = self.global_scope.meter = Meter(interpreter.budget)
+        self.meter.profiler = profiler
+
+    def load_unit(self, unit_name, pos=None, force=False):
+        '''
+        See Interpreter.load_unit.
+        '''
+        interpreter = self.interpreter
+        source_text = interpreter._loader.load_unit(unit_name, pos)
+        text_hash = source_hash(source_text)
+        module = self.modules.get(unit_name)
+        if module is not None and (not module.loaded or (
+                not force and module.source_hash == text_hash)):
+            return module.value
+        code = interpreter._compile_source(unit_name, source_text)
+        engine = interpreter.engine
+        scope = self.global_scope
+        profiler = interpreter.profiler
+        if profiler is None:
+            run = lambda: code.evaluate(scope)
+        else:
+            run = lambda: profiler.call(unit_key(unit_name), _run_code,
+                                        scope, (code,))
+        with self.sampling():
+            return self.modules.run(
+                unit_name, text_hash,
+                lambda: engine.global_layers(scope), run).value
+
+    def sampling(self):
+        '''
+        :return: a context manager that samples the run (if the interpreter
+                 samples its runs) while it is in effect
+        '''
+        sampler = self.interpreter.sampler
+        if sampler is None:
+            return contextlib.nullcontext()
+        return sampler.track(self.meter)
 
+    def require_unit(self, unit_name, pos=None):
+        '''
+        See Interpreter.require_unit.
+        '''
+        module = self.modules.get(unit_name)
+        if module is not None:
+            return module.value
+        return self.load_unit(unit_name, pos)
 
 
+def _run_code(scope, code):
+    return code.evaluate(scope)
@@ -0,0 +1,192 @@
+'''
+Limits on the work a run may do.
+
+A Budget sets the limits, and each run of an interpreter gets a Meter of its
+own that counts the run's work against them (see Interpreter).  The meter
+is kept with the run's global bindings, and every frame (or scope) made
+while the run goes on can reach it.
+
+Work is counted in steps: a step is a call of a function defined in LisPy
+(calls of builtins aren't counted), or an iteration of a while loop.  Every
+loop in a unit takes steps, so a unit that never ends runs out of steps, or
+time.  Frames and lists are counted as allocations.
+
+Counting has to be cheap, as it is always on.  Engines take a step with
+
+    meter.fuel -= 1
+    if meter.fuel < 0:
+        meter.refuel(pos)
+
+and count an allocation with
+
+    meter.space -= 1
+    if meter.space < 0:
+        meter.out_of_space(pos)
+
+Only the slow path, which runs every aio.CHECK_INTERVAL steps at most,
+checks the step limit and the clock, and yields to the event loop if the run
+was awaited (see aio.checkpoint).  A sampling profiler can send a run down
+the slow path at its next step, to take a sample there (see Meter.preempt
+and sampler.Sampler).
+'''
+import sys
+import time
+
+from ..aio import checkpoint, CHECK_INTERVAL
+from .error import BudgetExceededError
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+
+class Budget(object):
+    '''
+    The limits on a run.  A budget can be shared by any number of
+    interpreters and runs.
+    '''
+
+    def __init__(self, max_steps=None, time_limit=None,
+                 max_allocations=None):
+        '''
+        :param max_steps: the number of steps a run may take, or None for
+                          no limit
+        :type max_steps: int or None
+        :param time_limit: the number of seconds a run may go on for, from
+                           its first step, or None for no limit.  The clock
+                           is checked every aio.CHECK_INTERVAL steps.
+        :type time_limit: float or None
+        :param max_allocations: the number of frames (or scopes) and lists a
+                                run may make, or None for no limit.  What
+                                needs a frame differs a little between
+                                engines.
+        :type max_allocations: int or None
+        '''
+        self.max_steps = max_steps
+        self.time_limit = time_limit
+        self.max_allocations = max_allocations
+
+    def __repr__(self):
+        return 'Budget(max_steps=%r, time_limit=%r, max_allocations=%r)' % (
+            self.max_steps, self.time_limit, self.max_allocations)
+
+
+#: A budget with no limits
+UNLIMITED = Budget()
+
+
+class Meter(object):
+    '''
+    Counts the steps and allocations of one run against its budget.
+    '''
+    __slots__ = ('fuel', 'space', 'budget', 'profiler', 'sampler',
+                 '_granted', '_deadline', '_ticks', '_stolen')
+
+    def __init__(self, budget=None):
+        '''
+        :param budget: the limits on the run (default: UNLIMITED)
+        :type budget: Budget or None
+        '''
+        self.budget = budget = budget or UNLIMITED
+        #: the number of steps that can be taken before refuel is called
+        self.fuel = 0
+        #: the number of allocations left
+        self.space = (sys.maxsize if budget.max_allocations is None
+                      else budget.max_allocations)
+        #: the profiler of the run, if it is profiled (see profiler.Profiler).
+        #: Engines wrap the functions defined during the run with it.
+        self.profiler = None
+        #: the sampling profiler that samples the run, if it is sampled (see
+        #: sampler.Sampler)
+        self.sampler = None
+        # the number of steps that have been allowed so far
+        self._granted = 0
+        self._deadline = None
+        # the samples due, and the fuel taken away to take them
+        self._ticks = 0
+        self._stolen = 0
+
+    @property
+    def steps(self):
+        '''
+        :return: the number of steps taken so far
+        :rtype: int
+        '''
+        return self._granted - max(self.fuel, 0) - self._stolen
+
+    @property
+    def allocations(self):
+        '''
+        :return: the number of allocations made so far
+        :rtype: int
+        '''
+        budget = self.budget
+        if budget.max_allocations is None:
+            return sys.maxsize - self.space
+        return budget.max_allocations - self.space
+
+    def refuel(self, pos):
+        '''
+        Take a step when there is no fuel left: check the limits, yield to
+        the event loop, and allow the next steps.
+
+        :param pos: where the step is being taken
+        :type pos: TokenPos
+        :raises BudgetExceededError: if the run has gone over a limit
+        '''
+        if self._ticks:
+            ticks = self._ticks
+            self._ticks = 0
+            self.sampler.sample(sys._getframe(1), ticks)
+            if self._stolen:
+                # give back the fuel preempt took
+                self.fuel = self._stolen - 1
+                self._stolen = 0
+                return
+        budget = self.budget
+        if budget.time_limit is not None:
+            if self._deadline is None:
+                self._deadline = time.monotonic() + budget.time_limit
+            elif time.monotonic() > self._deadline:
+                raise BudgetExceededError(
+                    pos, 'time', 'The time limit of %g seconds was exceeded'
+                                 % budget.time_limit)
+        chunk = CHECK_INTERVAL
+        if budget.max_steps is not None:
+            chunk = min(chunk, budget.max_steps - self._granted)
+            if chunk <= 0:
+                raise BudgetExceededError(
+                    pos, 'steps', 'The limit of %d steps was exceeded'
+                                  % budget.max_steps)
+        checkpoint()
+        self._granted += chunk
+        # this step uses one
+        self.fuel = chunk - 1
+
+    def preempt(self):
+        '''
+        Make the run take a sample at its next step: called by the sampler
+        every sampling interval, from the sampler's thread.  The run's fuel
+        is taken away, so that the next step takes the slow path, and given
+        back there.
+
+        Under the GIL, threads only switch at calls and jumps, so a step
+        can't be half taken when the fuel is taken away.  Under free-
+        threaded builds, a run can now and then take up to CHECK_INTERVAL
+        steps more than its limit.
+        '''
+        self._ticks += 1
+        fuel = self.fuel
+        if fuel > 0:
+            self._stolen += fuel
+            self.fuel = 0
+
+    def out_of_space(self, pos):
+        '''
+        Called when an allocation has gone over the limit.
+
+        :param pos: where the allocation is being made
+        :type pos: TokenPos
+        :raises BudgetExceededError: always
+        '''
+        raise BudgetExceededError(
+            pos, 'allocations', 'The limit of %d allocations was exceeded'
+                                % self.budget.max_allocations)
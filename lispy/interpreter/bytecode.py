@@ -0,0 +1,644 @@
+'''
+Bytecode compiler.
+
+Lowers a Datum tree (the output of make_datum) to Code objects: a flat array
+of instructions, a constant pool and a table of resolved names.  Code holds
+no Python closures and no references to the Datum tree, so it can be pickled
+and loaded again later.  The VM (see vm.py) runs it.
+
+Each instruction is two ints in the array, an opcode and an argument, so the
+instruction at index pc is ops[pc], ops[pc + 1].  Jump targets are array
+indexes.
+
+Names are resolved as for the closure engine (see resolver.py).  The
+parameters of the current function are read straight from the frame by slot.
+Other locals are read and written following the set rules, and globals by
+name.
+
+A call pushes the callee and then picks one of three ways to pass the
+arguments, depending on what the callee is at run time:
+
+    * a lispy function (in strict mode) or a strict builtin (see
+      builtins.strict) gets the values of the arguments, which are evaluated
+      inline.
+    * a lispy function gets thunks when arguments are passed lazily.
+    * any other builtin gets the argument expressions, to evaluate as it
+      pleases.
+
+Every argument is compiled once, inline, and ends with an END_ARG
+instruction.  Thunks and the expressions passed to builtins run that same
+stretch of code (from the start of the argument up to its END_ARG) on their
+own.
+
+Calls to if, while, begin, and and or, and two-argument arithmetic and
+comparisons, are compiled to jumps and inline instructions, as long as the
+name still refers to the builtin when the call runs.  If it doesn't, the
+callee is called like any other builtin.  Calls inlined by the optimizer (see
+optimizer.py) are compiled the same way: the body runs in place of the call
+as long as the callee is still the function that was inlined.
+'''
+
+from array import array
+from collections import namedtuple
+
+from .resolver import resolve
+from .compiler import _early_plan
+from .scope import STRICT, BY_NAME
+from .datatypes import StaticDatum, VarRef, Set, FunctionDef, FunctionCall, \
+    ExprSeq, List, Folded, Inlined, SpecialForm
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: Version of the bytecode format.  Changes whenever compiled code from an
+#: older version could behave differently.
+VERSION = 7
+
+# Opcodes.  The argument (arg) of each is described alongside.
+CONST = 0  # push consts[arg]
+LOAD_FAST = 1  # push parameter arg of the current frame
+LOAD_REF = 2  # push the value of the name refs[arg]
+LOAD_GLOBAL = 3  # push the global named by refs[arg]
+STORE_FAST = 4  # pop into parameter arg of the current frame
+STORE_REF = 5  # pop and bind to the name refs[arg] (set rules)
+STORE_GLOBAL = 6  # pop into the global named by refs[arg]
+DUP = 7  # push the top of the stack again
+POP = 8  # discard the top of the stack
+JUMP = 9  # go to arg
+JUMP_IF_FALSE = 10  # pop, and go to arg if the value is false
+END_ARG = 11  # end of an argument expression (arg unused)
+RETURN = 12  # return the top of the stack
+MAKE_FUNCTION = 13  # push a function with body consts[arg] and this frame
+PUSH_FRAME = 14  # make a new frame with arg slots
+POP_FRAME = 15  # go back to the parent frame
+BUILD_LIST = 16  # pop arg values and push them as a list
+SELECT_CALL = 17  # choose how to pass the arguments of CallSite consts[arg]
+MAKE_ARGS = 18  # push thunks for the arguments of CallSite consts[arg]
+CALL = 19  # call with arg argument values
+TAIL_CALL = 20  # call with arg argument values, returning the result
+CALL_OTHER = 21  # call with the argument expressions of CallSite consts[arg]
+GUARD = 22  # skip to the generic call unless the callee is Guard consts[arg]
+COMPARE = 23  # pop two values, push the comparison named by consts[arg]
+EVALUATE = 24  # push consts[arg].evaluate(frame), for foreign Datums
+ADD = 25  # pop two numbers, push their sum
+SUBTRACT = 26  # pop two numbers, push the first minus the second
+MULTIPLY = 27  # pop two numbers, push their product
+LOOP = 28  # go back to arg, the test of a while loop
+INLINED = 29  # pop, unless the callee isn't Inline consts[arg] (see below)
+
+#: opcode -> name, for disassembly
+OPNAMES = {v: k for (k, v) in dict(globals()).items()
+           if k.isupper() and type(v) is int and k != 'VERSION'}
+
+#: The names of the builtins that are compiled inline
+INLINE = ('if', 'while', 'begin', '+', '-', '*', '=', '!=', '<', '>', '<=',
+          '>=', 'or', 'and')
+
+'''
+An argument expression of a call.
+
+Attributes:
+    start: index of the first instruction of the argument
+    stop: index just past its END_ARG instruction
+    static: True if the argument is a constant
+    value: the constant (when static is True)
+    pos: the position of the argument in the source
+    early: when arguments are passed lazily, the plan for evaluating the
+        argument when the call is made (see compiler._early_plan), or None
+'''
+Arg = namedtuple('Arg', 'start stop static value pos early')
+
+'''
+A call site.
+
+Attributes:
+    name: the name of the callee (a Syn)
+    args: tuple of Arg
+    thunks: index of the MAKE_ARGS for a lispy function that takes lazy
+        arguments (-1 if arguments are strict)
+    other: index of the CALL_OTHER instruction
+'''
+CallSite = namedtuple('CallSite', 'name args thunks other')
+
+'''
+The check made before running an inline builtin.
+
+Attributes:
+    name: the name of the builtin
+    other: index of the instruction to go to, with the callee still on the
+        stack, if the callee isn't the builtin: the CALL_OTHER of an inline
+        call, or the POP before the call as written, for a folded call
+'''
+Guard = namedtuple('Guard', 'name other')
+
+'''
+The check made before running the body of a function inlined at a call (see
+optimizer.py).  The callee is popped, and counts as called, if it is a
+function with this body (and the run isn't sampled or profiled).
+
+Attributes:
+    code: the Code of the function
+    other: index of the instruction to go to, with the callee still on the
+        stack, if it isn't: the POP before the call as written
+'''
+Inline = namedtuple('Inline', 'code other')
+
+
+class Code(object):
+    '''
+    A compiled unit or function body.
+    '''
+    __slots__ = ('ops', 'consts', 'refs', 'nparams', 'nlocals', 'arg_mode',
+                 'name', 'pos', 'positions', 'linked')
+
+    def __init__(self, ops, consts, refs, nparams, nlocals, arg_mode, name,
+                 pos, positions):
+        '''
+        :param ops: the instructions
+        :type ops: array
+        :param consts: the constant pool
+        :type consts: tuple
+        :param refs: the names used by the code
+        :type refs: tuple[resolver.Ref]
+        :param nparams: the number of parameters (0 for a unit)
+        :type nparams: int
+        :param nlocals: the number of local slots after the parameters
+        :type nlocals: int
+        :param arg_mode: how arguments are passed (one of scope.ARG_MODES)
+        :type arg_mode: str
+        :param name: the function name, or None for a unit
+        :type name: str or None
+        :param pos: where the code starts in the source
+        :type pos: TokenPos
+        :param positions: the positions in the source of the instructions
+                          that count towards a run's budget (calls, loops
+                          and allocations), by index (see budget.Meter)
+        :type positions: dict[int,TokenPos]
+        '''
+        self.ops = ops
+        self.consts = consts
+        self.refs = refs
+        self.nparams = nparams
+        self.nlocals = nlocals
+        self.arg_mode = arg_mode
+        self.name = name
+        self.pos = pos
+        self.positions = positions
+        #: run time tables, built by the VM when the code first runs
+        self.linked = None
+
+    def __getstate__(self):
+        return (self.ops, self.consts, self.refs, self.nparams, self.nlocals,
+                self.arg_mode, self.name, self.pos, self.positions)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def __repr__(self):
+        return '<Code %s at %s>' % (self.name or 'unit', self.pos)
+
+
+def compile_code(datum, arg_mode=BY_NAME):
+    '''
+    Compile a Datum, which is evaluated at the top level.
+
+    :param datum: the datum to compile (usually a whole unit)
+    :type datum: datatypes.Datum
+    :param arg_mode: how arguments are passed to functions (one of
+                     scope.ARG_MODES)
+    :type arg_mode: str
+    :rtype: Code
+    '''
+    asm = _Assembler(resolve(datum), arg_mode, dict())
+    asm.expr(datum)
+    asm.emit(RETURN)
+    return asm.code(0, 0, None, datum.pos)
+
+
+def disassemble(code):
+    '''
+    :param code: compiled code
+    :type code: Code
+    :return: the instructions of code, one per line, for debugging
+    :rtype: str
+    '''
+    ops = code.ops
+    lines = []
+    for pc in range(0, len(ops), 2):
+        op, arg = ops[pc], ops[pc + 1]
+        lines.append('%4d %-14s %d' % (pc, OPNAMES[op], arg))
+    return '\n'.join(lines)
+
+
+class _Assembler(object):
+    '''
+    Builds the Code for one unit or function body.
+    '''
+
+    def __init__(self, res, arg_mode, functions):
+        '''
+        :param res: the names resolved by the resolver
+        :type res: resolver.Resolution
+        :param arg_mode: how arguments are passed
+        :type arg_mode: str
+        :param functions: the Code of each function of the unit compiled so
+                          far, shared by the Assemblers of the unit
+        :type functions: dict[FunctionDef,Code]
+        '''
+        self.res = res
+        self.arg_mode = arg_mode
+        self.functions = functions
+        self.ops = array('i')
+        self.consts = []
+        self._const_index = dict()
+        self.refs = []
+        self._ref_index = dict()
+        self.positions = dict()
+        # True while the slow form of a Folded is emitted (see folded)
+        self.slow = False
+
+    def code(self, nparams, nlocals, name, pos):
+        return Code(self.ops, tuple(self.consts), tuple(self.refs), nparams,
+                    nlocals, self.arg_mode, name, pos, self.positions)
+
+    def emit(self, op, arg=0, pos=None):
+        '''
+        :param pos: the position of the instruction in the source, for those
+                    that count towards a run's budget
+        :type pos: TokenPos or None
+        :return: the index of the new instruction
+        '''
+        pc = len(self.ops)
+        self.ops.append(op)
+        self.ops.append(arg)
+        if pos is not None:
+            self.positions[pc] = pos
+        return pc
+
+    def patch(self, pc, arg):
+        '''
+        Set the argument of the instruction at pc.
+        '''
+        self.ops[pc + 1] = arg
+
+    def here(self):
+        '''
+        :return: the index of the next instruction
+        '''
+        return len(self.ops)
+
+    def const(self, value):
+        '''
+        :return: the index of value in the constant pool
+        '''
+        if type(value) in (int, float, str, bool, type(None)):
+            # the type is part of the key, since 1 == 1.0 == True
+            key = (type(value), value)
+            index = self._const_index.get(key)
+            if index is None:
+                index = self._const_index[key] = len(self.consts)
+                self.consts.append(value)
+            return index
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def ref(self, ref):
+        '''
+        :return: the index of ref in the name table
+        '''
+        index = self._ref_index.get(ref)
+        if index is None:
+            index = self._ref_index[ref] = len(self.refs)
+            self.refs.append(ref)
+        return index
+
+    def expr(self, datum, tail=False):
+        '''
+        Emit the instructions that push the value of datum.
+
+        :param tail: True if datum is in tail position within a function
+                     body
+        '''
+        emitter = _EMITTERS.get(type(datum))
+        if emitter is None:
+            # not one of ours: let it evaluate itself
+            self.emit(EVALUATE, self.const(datum))
+        else:
+            emitter(self, datum, tail)
+
+    def sequence(self, items, tail):
+        '''
+        Emit items, keeping only the value of the last.
+        '''
+        if not items:
+            self.emit(CONST, self.const(None))
+        for (n, i) in enumerate(items):
+            if n:
+                self.emit(POP)
+            self.expr(i, tail and n == len(items) - 1)
+
+    def arg(self, datum, tail=False):
+        '''
+        Emit an argument expression, followed by END_ARG.
+
+        :rtype: Arg
+        '''
+        start = self.here()
+        self.expr(datum, tail)
+        self.emit(END_ARG)
+        static = type(datum) is StaticDatum
+        early = None
+        if not static and self.arg_mode != STRICT:
+            early = _early_plan(datum, self.res)
+        return Arg(start, self.here(), static,
+                   datum.value if static else None, datum.pos, early)
+
+    def load(self, ref):
+        if not ref.chain:
+            self.emit(LOAD_GLOBAL, self.ref(ref))
+        elif ref.bound and ref.chain == ((0, ref.chain[0].slot),):
+            self.emit(LOAD_FAST, ref.chain[0].slot)
+        else:
+            self.emit(LOAD_REF, self.ref(ref))
+
+    def store(self, ref):
+        if not ref.chain:
+            self.emit(STORE_GLOBAL, self.ref(ref))
+        elif ref.bound and ref.chain == ((0, ref.chain[0].slot),):
+            self.emit(STORE_FAST, ref.chain[0].slot)
+        else:
+            self.emit(STORE_REF, self.ref(ref))
+
+    def static(self, datum, tail):
+        self.emit(CONST, self.const(datum.value))
+
+    def var_ref(self, datum, tail):
+        self.load(self.res.ref(datum))
+
+    def set(self, datum, tail):
+        self.expr(datum.value_expr)
+        self.emit(DUP)
+        self.store(self.res.ref(datum))
+
+    def function_code(self, datum):
+        '''
+        :param datum: a function of the unit
+        :type datum: FunctionDef
+        :return: the Code of the body of datum.  Each function is compiled
+                 once, so calls inlined in other functions can tell it by
+                 its Code.
+        :rtype: Code
+        '''
+        code = self.functions.get(datum)
+        if code is not None:
+            return code
+        block = self.res.block(datum)
+        body = _Assembler(self.res, self.arg_mode, self.functions)
+        if type(datum.body) is ExprSeq:
+            # the body shares the function's frame
+            body.sequence(datum.body.items, True)
+        else:
+            body.expr(datum.body, True)
+        body.emit(RETURN)
+        code = self.functions[datum] = body.code(
+            block.nparams, block.nlocals, datum.name.value, datum.pos)
+        return code
+
+    def function_def(self, datum, tail):
+        self.emit(MAKE_FUNCTION, self.const(self.function_code(datum)))
+        self.store(self.res.ref(datum))
+        self.emit(CONST, self.const(None))
+
+    def function_call(self, datum, tail):
+        ref = self.res.ref(datum)
+        name = ref.name.value
+        self.load(ref)
+        if not ref.chain and name in INLINE:
+            inline = _INLINE_EMITTERS[name]
+            if inline.accepts(len(datum.arg_exprs)):
+                return self.inline_call(datum, tail, inline)
+        self.generic_call(datum, tail)
+
+    def generic_call(self, datum, tail):
+        nargs = len(datum.arg_exprs)
+        call = TAIL_CALL if tail else CALL
+        select = self.emit(SELECT_CALL)
+        # argument values, evaluated inline
+        args = tuple(self.arg(a) for a in datum.arg_exprs)
+        self.emit(call, nargs, datum.pos)
+        jumps = [self.emit(JUMP)]
+        thunks = -1
+        if self.arg_mode != STRICT:
+            thunks = self.emit(MAKE_ARGS)
+            self.emit(call, nargs, datum.pos)
+            jumps.append(self.emit(JUMP))
+        other = self.emit(CALL_OTHER)
+        for j in jumps:
+            self.patch(j, self.here())
+        site = self.const(CallSite(datum.name, args, thunks, other))
+        for pc in (select, thunks, other):
+            if pc >= 0:
+                self.patch(pc, site)
+
+    def inline_call(self, datum, tail, inline):
+        guard = self.emit(GUARD)
+        jumps, args = inline(self, datum.arg_exprs, tail)
+        jumps.append(self.emit(JUMP))
+        other = self.emit(CALL_OTHER)
+        for j in jumps:
+            self.patch(j, self.here())
+        self.patch(guard, self.const(Guard(datum.name.value, other)))
+        self.patch(other, self.const(CallSite(datum.name, args, -1, other)))
+
+    def expr_seq(self, datum, tail):
+        block = self.res.block(datum)
+        if block is None:
+            # defines nothing, so it doesn't need a frame of its own
+            self.sequence(datum.items, tail)
+        else:
+            self.emit(PUSH_FRAME, len(block.names), datum.pos)
+            self.sequence(datum.items, tail)
+            self.emit(POP_FRAME)
+
+    def folded(self, datum, tail):
+        if self.slow:
+            # The fast form is made of parts of the slow one, which are
+            # emitted once more for each Folded they are in.  The slow form
+            # gives the same result, so inside a slow form, only it is
+            # emitted.
+            self.expr(datum.slow, tail)
+            return
+        guards = []
+        for (ref, builtin) in datum.guards:
+            self.load(self.res.ref(ref))
+            guards.append((self.emit(GUARD), ref.name.value))
+        self.expr(datum.fast, tail)
+        end = self.emit(JUMP)
+        fail = self.here()
+        self.emit(POP)
+        self.slow = True
+        self.expr(datum.slow, tail)
+        self.slow = False
+        self.patch(end, self.here())
+        for (pc, name) in guards:
+            self.patch(pc, self.const(Guard(name, fail)))
+
+    def inlined(self, datum, tail):
+        guards = []
+        for (ref, builtin) in datum.guards:
+            self.load(self.res.ref(ref))
+            guards.append((self.emit(GUARD), ref.name.value))
+        self.load(self.res.ref(datum.call))
+        inline = self.emit(INLINED, 0, datum.pos)
+        self.expr(datum.body, tail)
+        end = self.emit(JUMP)
+        fail = self.here()
+        self.emit(POP)
+        self.expr(datum.call, tail)
+        self.patch(end, self.here())
+        for (pc, name) in guards:
+            self.patch(pc, self.const(Guard(name, fail)))
+        self.patch(inline, self.const(
+            Inline(self.function_code(datum.func), fail)))
+
+    def special_form(self, datum, tail):
+        # calls to if, while, begin, and and or are compiled inline already
+        self.function_call(datum.call, tail)
+
+    def list(self, datum, tail):
+        for i in datum.items:
+            self.expr(i)
+        self.emit(BUILD_LIST, len(datum.items), datum.pos)
+
+
+_EMITTERS = {
+    StaticDatum: _Assembler.static,
+    VarRef: _Assembler.var_ref,
+    Set: _Assembler.set,
+    FunctionDef: _Assembler.function_def,
+    FunctionCall: _Assembler.function_call,
+    ExprSeq: _Assembler.expr_seq,
+    List: _Assembler.list,
+    Folded: _Assembler.folded,
+    Inlined: _Assembler.inlined,
+    SpecialForm: _Assembler.special_form,
+}
+
+
+def _inline(accepts):
+    '''
+    Decorator for the functions that compile a builtin inline.  Each takes
+    the assembler, the argument expressions and whether the call is in tail
+    position.  It returns the indexes of the jumps that go to the end of the
+    call, and the Args.
+
+    :param accepts: whether the builtin can be compiled inline for a number
+                    of arguments
+    :type accepts: (int) -> bool
+    '''
+    def decorate(f):
+        f.accepts = accepts
+        return f
+    return decorate
+
+
+@_inline(lambda nargs: nargs == 3)
+def _inline_if(asm, arg_exprs, tail):
+    cond, true_expr, false_expr = arg_exprs
+    args = [asm.arg(cond)]
+    branch = asm.emit(JUMP_IF_FALSE)
+    args.append(asm.arg(true_expr, tail))
+    jumps = [asm.emit(JUMP)]
+    asm.patch(branch, asm.here())
+    args.append(asm.arg(false_expr, tail))
+    return jumps, tuple(args)
+
+
+@_inline(lambda nargs: nargs >= 1)
+def _inline_while(asm, arg_exprs, tail):
+    cond = arg_exprs[0]
+    body = arg_exprs[1:]
+    asm.emit(CONST, asm.const(None))
+    top = asm.here()
+    args = [asm.arg(cond)]
+    done = asm.emit(JUMP_IF_FALSE)
+    if body:
+        # replace the last value
+        asm.emit(POP)
+    for (n, a) in enumerate(body):
+        if n:
+            asm.emit(POP)
+        args.append(asm.arg(a))
+    asm.emit(LOOP, top, cond.pos)
+    asm.patch(done, asm.here())
+    return [], tuple(args)
+
+
+@_inline(lambda nargs: nargs >= 1)
+def _inline_begin(asm, arg_exprs, tail):
+    args = []
+    for (n, a) in enumerate(arg_exprs):
+        if n:
+            asm.emit(POP)
+        args.append(asm.arg(a, tail and n == len(arg_exprs) - 1))
+    return [], tuple(args)
+
+
+@_inline(lambda nargs: nargs >= 1)
+def _inline_and(asm, arg_exprs, tail):
+    args = []
+    branches = []
+    for a in arg_exprs:
+        args.append(asm.arg(a))
+        branches.append(asm.emit(JUMP_IF_FALSE))
+    asm.emit(CONST, asm.const(True))
+    jumps = [asm.emit(JUMP)]
+    for b in branches:
+        asm.patch(b, asm.here())
+    asm.emit(CONST, asm.const(False))
+    return jumps, tuple(args)
+
+
+@_inline(lambda nargs: nargs >= 1)
+def _inline_or(asm, arg_exprs, tail):
+    args = []
+    jumps = []
+    for a in arg_exprs:
+        args.append(asm.arg(a))
+        branch = asm.emit(JUMP_IF_FALSE)
+        asm.emit(CONST, asm.const(True))
+        jumps.append(asm.emit(JUMP))
+        asm.patch(branch, asm.here())
+    asm.emit(CONST, asm.const(False))
+    return jumps, tuple(args)
+
+
+def _inline_compare(name):
+    @_inline(lambda nargs: nargs == 2)
+    def emit(asm, arg_exprs, tail):
+        args = tuple(asm.arg(a) for a in arg_exprs)
+        asm.emit(COMPARE, asm.const(name))
+        return [], args
+    return emit
+
+
+def _inline_arithmetic(opcode):
+    @_inline(lambda nargs: nargs == 2)
+    def emit(asm, arg_exprs, tail):
+        args = tuple(asm.arg(a) for a in arg_exprs)
+        asm.emit(opcode)
+        return [], args
+    return emit
+
+
+_INLINE_EMITTERS = {
+    'if': _inline_if,
+    'while': _inline_while,
+    'begin': _inline_begin,
+    'and': _inline_and,
+    'or': _inline_or,
+    '+': _inline_arithmetic(ADD),
+    '-': _inline_arithmetic(SUBTRACT),
+    '*': _inline_arithmetic(MULTIPLY),
+}
+_INLINE_EMITTERS.update((name, _inline_compare(name)) for name in INLINE
+                        if name not in _INLINE_EMITTERS)
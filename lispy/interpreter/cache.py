@@ -0,0 +1,208 @@
+'''
+Cache of compiled units.
+
+Loading a unit means lexing, parsing, building the Datum tree and compiling
+it, every time it is run or loaded.  A UnitCache keeps the result instead,
+in two tiers:
+
+    * an in-process LRU of compiled units, keyed by unit name, a hash of the
+      source text, the engine and the argument mode.
+    * optionally, a directory of serialized units.  Each file records the
+      hash of the source it was made from and the versions of lispy, the
+      bytecode format, the grammar and Python, and is ignored if any of them
+      don't match (much like a .pyc file).  Engines whose compiled units can
+      be serialized (see Engine.dump) store those.  Otherwise the syntax tree
+      is stored, which saves the parse.
+
+The source text is always loaded, so a unit that changes is compiled again.
+'''
+
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from .. import __version__
+from ..parser import grammar_version
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The default number of compiled units kept in memory
+DEFAULT_SIZE = 256
+
+#: Environment variable naming the directory of the shared cache's on-disk
+#: tier.  If it isn't set, the shared cache is only kept in memory.
+CACHE_DIR_ENV = 'LISPY_CACHE_DIR'
+
+_MAGIC = 'lispy-unit'
+
+# errors from pickling something that can't be pickled (a very deeply
+# nested tree, or an unusual object), other than pickle's own
+_UNPICKLABLE = (RecursionError, TypeError, AttributeError)
+
+# errors from reading a unit file that is damaged or unreadable, other than
+# pickle's own
+_UNREADABLE = (OSError, EOFError, ValueError, ImportError) + _UNPICKLABLE
+
+
+def source_hash(source_text):
+    '''
+    :param source_text: the text of a unit
+    :type source_text: str
+    :return: a hash of the text
+    :rtype: str
+    '''
+    return hashlib.sha256(source_text.encode('utf-8')).hexdigest()
+
+
+def _versions():
+    '''
+    :return: what a unit file must have been written with to be used
+    :rtype: tuple
+    '''
+    from . import bytecode
+    return (__version__, bytecode.VERSION, grammar_version(),
+            sys.version_info[:2])
+
+
+class UnitCache(object):
+    '''
+    A two-tier (memory and disk) cache of compiled units.  It can be shared
+    by any number of interpreters, in any number of threads.
+    '''
+
+    def __init__(self, maxsize=DEFAULT_SIZE, directory=None):
+        '''
+        :param maxsize: the number of compiled units kept in memory
+        :type maxsize: int
+        :param directory: the directory that unit files are kept in, or None
+                          to only cache units in memory.  It is created if it
+                          doesn't exist.
+        :type directory: str or None
+        '''
+        self.maxsize = maxsize
+        self.directory = directory
+        self._units = OrderedDict()
+        self._lock = threading.Lock()
+        #: number of units found in memory
+        self.hits = 0
+        #: number of units read from disk
+        self.disk_hits = 0
+        #: number of units that had to be compiled
+        self.misses = 0
+
+    def compiled(self, unit_name, source_text, engine, parse, compile):
+        '''
+        Get a compiled unit, from the cache if possible.
+
+        :param unit_name: the name of the unit
+        :type unit_name: str
+        :param source_text: the text of the unit
+        :type source_text: str
+        :param engine: the engine the unit is compiled by
+        :type engine: engine.Engine
+        :param parse: parses the text: called with the unit name and text
+        :type parse: (str, str) -> Syn
+        :param compile: compiles the syntax tree returned by parse
+        :type compile: (Syn) -> any
+        :return: the compiled unit
+        '''
+        text_hash = source_hash(source_text)
+        key = (unit_name, text_hash, engine.name, engine.arg_mode)
+        with self._lock:
+            unit = self._units.get(key)
+            if unit is not None:
+                self._units.move_to_end(key)
+                self.hits += 1
+                return unit
+        unit = from_disk = self._read(key, engine, compile)
+        if unit is None:
+            ast = parse(unit_name, source_text)
+            unit = compile(ast)
+            self._write(key, engine, unit, ast)
+        with self._lock:
+            if from_disk is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+            self._units[key] = unit
+            while len(self._units) > self.maxsize:
+                self._units.popitem(last=False)
+        return unit
+
+    def clear(self):
+        '''
+        Forget the units kept in memory.  Unit files are kept.
+        '''
+        with self._lock:
+            self._units.clear()
+
+    def _path(self, key):
+        '''
+        :return: the file that the unit with the given key is kept in
+        '''
+        unit_name, text_hash, engine_name, arg_mode = key
+        name = '\0'.join((unit_name, engine_name, arg_mode))
+        digest = hashlib.sha256(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:32] + '.lpc')
+
+    def _read(self, key, engine, compile):
+        '''
+        :return: the unit from its file, or None if there is no usable file
+        '''
+        if self.directory is None:
+            return None
+        # the disk tier's modules are only imported if it is used
+        import pickle
+        try:
+            with open(self._path(key), 'rb') as f:
+                header, kind, payload = pickle.load(f)
+        except _UNREADABLE + (pickle.UnpicklingError,):
+            # missing, unreadable or damaged: it'll be replaced
+            return None
+        if header != (_MAGIC, _versions(), key[1]):
+            return None
+        if kind == 'unit':
+            return engine.load(payload)
+        return compile(payload)
+
+    def _write(self, key, engine, unit, ast):
+        '''
+        Write the unit's file.  A unit that can't be written is still cached
+        in memory.
+        '''
+        if self.directory is None:
+            return
+        import pickle
+        import tempfile
+        payload = engine.dump(unit)
+        kind = 'ast' if payload is None else 'unit'
+        if payload is None:
+            payload = ast
+        header = (_MAGIC, _versions(), key[1])
+        try:
+            data = pickle.dumps((header, kind, payload),
+                                pickle.HIGHEST_PROTOCOL)
+        except _UNPICKLABLE + (pickle.PicklingError,):
+            return
+        # write a new file and move it into place, so a reader never sees
+        # part of one
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+#: The cache shared by interpreters that aren't given one of their own
+shared_cache = UnitCache(directory=os.environ.get(CACHE_DIR_ENV))
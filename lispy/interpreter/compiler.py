@@ -0,0 +1,1023 @@
+'''
+Closure compiler.
+
+Turns a Datum tree (the output of make_datum) into a tree of specialized
+Python closures.  Each closure is built once, with everything that can be
+worked out ahead of time (names, slot addresses, constant values, argument
+lists, which kind of node it is) already bound, and is then run directly.
+This avoids dispatching through Datum.evaluate on every visit.
+
+Compiled code runs against a Frame (see frame.py).  Names are looked up at
+the addresses worked out by the resolver (see resolver.py).  How arguments
+are passed to lispy functions (see scope.ARG_MODES) is also fixed when the
+code is compiled.
+
+Calls to lispy functions in tail position (the last expression of a body,
+and the arguments of builtins such as if and begin that return the value of
+an argument, when the builtin call is itself in tail position) don't call
+the function.  They return a TailCall, which the closest enclosing non-tail
+call runs.  So tail-recursive code runs in constant Python stack.  When
+arguments are strict and nothing can keep a reference to the frame, a
+function calling itself in tail position also reuses its frame.
+
+A call of an arithmetic or comparison builtin with two arguments keeps track
+of the types of the numbers it is called with.  Once it has seen the same
+type (int or float) for both arguments a few times, it works out the result
+itself, with the operator for that type, as long as the arguments are still
+of that type.  As soon as they aren't, it goes back to calling the builtin.
+'''
+
+import operator
+from collections import namedtuple
+from types import CodeType, FunctionType
+
+from .frame import Frame, Thunk, MemoThunk, UNBOUND, ARG_BINDERS
+from .profiler import ProfiledFunction
+from .resolver import resolve
+from .scope import STRICT, BY_NAME
+from .error import VarNameNotFoundError
+from .datatypes import StaticDatum, VarRef, Set, FunctionDef, FunctionCall, \
+    ExprSeq, List, Folded, Inlined, SpecialForm
+from ..builtins import global_builtins, tail_positions, strict_builtins, \
+    pure_builtins
+from ..builtins.builtins import plusBuiltin, minusBuiltin, timesBuiltin, \
+    divBuiltin, eqBuiltin, neqBuiltin, ltBuiltin, gtBuiltin, lteBuiltin, \
+    gteBuiltin, ifBuiltin, whileBuiltin, beginBuiltin, andBuiltin
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The number of calls that an arithmetic or comparison call site has to see
+#: with two numbers of the same type before it is specialized to that type
+SPECIALIZE_AFTER = 8
+
+#: The builtins whose call sites learn the types of their arguments (builtin
+#: -> type of number -> an operator that gives the same result as the
+#: builtin, for two arguments of that type).  Comparisons compare the second
+#: argument with the first (see builtins.compareBuiltin).
+_NUMERIC_OPS = {
+    plusBuiltin: {int: operator.add,
+                  # the builtin sums from 0, which turns -0.0 into 0.0
+                  float: lambda x, y: 0 + x + y},
+    minusBuiltin: {int: operator.sub, float: operator.sub},
+    timesBuiltin: {int: operator.mul, float: operator.mul},
+    divBuiltin: {int: operator.floordiv, float: operator.truediv},
+    eqBuiltin: {int: operator.eq, float: operator.eq},
+    neqBuiltin: {int: operator.ne, float: operator.ne},
+    ltBuiltin: {int: operator.gt, float: operator.gt},
+    gtBuiltin: {int: operator.lt, float: operator.lt},
+    lteBuiltin: {int: operator.ge, float: operator.ge},
+    gteBuiltin: {int: operator.le, float: operator.le},
+}
+
+'''
+What the compiler needs to know about the unit being compiled.
+
+Attributes:
+    res: the names resolved by the resolver (a resolver.Resolution)
+    arg_mode: how arguments are passed to functions (one of scope.ARG_MODES)
+    func: the FunctionDef whose frame is the current frame, if the frame can
+        be reused by tail calls from the function to itself.  Otherwise None.
+    compiled: the closures compiled so far ((datum, tail, func) ->
+        closure).  The optimizer builds the fast form of a Folded from parts
+        of its slow form, so the same datum can be compiled from both.
+'''
+_Context = namedtuple('_Context', 'res arg_mode func compiled')
+
+
+class CompiledExpr(object):
+    '''
+    A compiled expression.
+
+    Builtins receive their arguments unevaluated, as objects that have an
+    evaluate(parent_scope) method.  A CompiledExpr stores the compiled closure
+    itself as its evaluate attribute, so evaluating one costs a single call.
+    '''
+    __slots__ = ('evaluate', 'datum')
+
+    def __init__(self, run, datum):
+        '''
+        :param run: the compiled closure
+        :type run: (Frame) -> any
+        :param datum: the Datum the closure was compiled from
+        :type datum: datatypes.Datum
+        '''
+        self.evaluate = run
+        self.datum = datum
+
+    @property
+    def pos(self):
+        return self.datum.pos
+
+    @property
+    def value(self):
+        return self.datum.value
+
+    def __str__(self):
+        return str(self.datum)
+
+
+class TailCall(object):
+    '''
+    What a call in tail position returns instead of the result of the call:
+    the function to call, and the frame to run its body in.
+    '''
+    __slots__ = ('func', 'frame')
+
+    def __init__(self, func, frame):
+        '''
+        :param func: the function being called
+        :type func: CompiledFunction
+        :param frame: the frame of the call, with the arguments bound
+        :type frame: Frame
+        '''
+        self.func = func
+        self.frame = frame
+
+
+def finish(result):
+    '''
+    Run tail calls until there is a result.
+
+    :param result: a value, or a TailCall
+    :return: the value
+    '''
+    while type(result) is TailCall:
+        result = result.func.body(result.frame)
+    return result
+
+
+class CompiledFunction(object):
+    '''
+    A function defined by compiled code: a compiled FunctionDef together with
+    the frame it was defined in.
+
+    It can be called like a FunctionDef, with the caller's frame and the
+    unevaluated arguments.  Compiled call sites skip that and build the new
+    frame directly.
+    '''
+    __slots__ = ('datum', 'env', 'nparams', 'unbound', 'body', 'make_arg')
+
+    def __init__(self, datum, env, nparams, unbound, body, make_arg):
+        '''
+        :param datum: the function definition
+        :type datum: FunctionDef
+        :param env: the frame the function was defined in
+        :type env: Frame
+        :param nparams: the number of parameters
+        :type nparams: int
+        :param unbound: initial values of the local slots that follow the
+                        parameters
+        :type unbound: list
+        :param body: the compiled body of the function
+        :type body: (Frame) -> any
+        :param make_arg: binds an argument: called with the caller's frame
+                         and the compiled argument expression
+        :type make_arg: (Frame, (Frame) -> any) -> any
+        '''
+        self.datum = datum
+        self.env = env
+        self.nparams = nparams
+        self.unbound = unbound
+        self.body = body
+        self.make_arg = make_arg
+
+    def __call__(self, parent_scope, *arg_vals):
+        assert (self.nparams == len(arg_vals))
+        meter = parent_scope.genv.meter
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(self.datum.pos)
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(self.datum.pos)
+        make_arg = self.make_arg
+        values = [make_arg(parent_scope, a.evaluate) for a in arg_vals]
+        values += self.unbound
+        body = self.body
+        if meter.profiler is not None:
+            body = _recorded(self, meter.profiler).body
+        return finish(body(Frame(values, self.env, parent_scope.genv)))
+
+    @property
+    def pos(self):
+        return self.datum.pos
+
+    @property
+    def value(self):
+        return self.datum.value
+
+
+def compile_datum(datum, arg_mode=BY_NAME):
+    '''
+    Compile a Datum, which is evaluated at the top level, into a
+    CompiledExpr.
+
+    :param datum: the datum to compile
+    :type datum: datatypes.Datum
+    :param arg_mode: how arguments are passed to functions (one of
+                     scope.ARG_MODES)
+    :type arg_mode: str
+    :return: the compiled expression
+    :rtype: CompiledExpr
+    '''
+    cx = _Context(resolve(datum), arg_mode, None, dict())
+    return CompiledExpr(_compile(datum, cx), datum)
+
+
+def _compile(datum, cx, tail=False):
+    '''
+    :param cx: what the compiler knows about the unit
+    :type cx: _Context
+    :param tail: True if datum is in tail position within a function body.
+                 The closure may then return a TailCall.
+    :type tail: bool
+    :return: a closure that evaluates datum in the frame it is passed
+    :rtype: (Frame) -> any
+    '''
+    compiler = _COMPILERS.get(type(datum))
+    if compiler is None:
+        # not one of ours (a hand built Datum, for instance): let it
+        # evaluate itself.
+        return datum.evaluate
+    key = (datum, tail, cx.func)
+    code = cx.compiled.get(key)
+    if code is None:
+        code = cx.compiled[key] = compiler(datum, cx, tail)
+    return code
+
+
+def _frame_at(frame, depth):
+    for i in range(depth):
+        frame = frame.parent
+    return frame
+
+
+def _forced(values, slot):
+    '''
+    :return: the value in a slot, evaluating it first if it is an argument
+             that hasn't been evaluated
+    '''
+    v = values[slot]
+    t = type(v)
+    if t is Thunk:
+        return v.force()
+    if t is MemoThunk:
+        v = values[slot] = v.force()
+    return v
+
+
+def _param_reader(slot, arg_mode):
+    '''
+    :return: a closure that fetches a parameter of the current frame
+    :rtype: (Frame) -> any
+    '''
+    if arg_mode == STRICT:
+        def run(frame):
+            return frame.values[slot]
+    elif arg_mode == BY_NAME:
+        def run(frame):
+            v = frame.values[slot]
+            if type(v) is Thunk:
+                return v.force()
+            return v
+    else:
+        def run(frame):
+            values = frame.values
+            v = values[slot]
+            if type(v) is MemoThunk:
+                v = values[slot] = v.force()
+            return v
+    return run
+
+
+def _reader(ref, arg_mode):
+    '''
+    :param ref: a resolved name
+    :type ref: resolver.Ref
+    :param arg_mode: how arguments are passed
+    :type arg_mode: str
+    :return: a closure that fetches the value bound to the name
+    :rtype: (Frame) -> any
+    '''
+    name = ref.name.value
+    pos = ref.name.pos
+    if not ref.chain:
+        def run(frame):
+            try:
+                return frame.genv[name]
+            except KeyError:
+                raise VarNameNotFoundError(pos, name)
+    elif ref.bound and len(ref.chain) == 1:
+        # a parameter: always bound, and maybe still an unevaluated argument
+        depth, slot = ref.chain[0]
+        if depth == 0:
+            run = _param_reader(slot, arg_mode)
+        elif depth == 1:
+            def run(frame):
+                return _forced(frame.parent.values, slot)
+        else:
+            def run(frame):
+                return _forced(_frame_at(frame, depth).values, slot)
+    else:
+        chain = ref.chain
+
+        def run(frame):
+            for depth, slot in chain:
+                values = _frame_at(frame, depth).values
+                if values[slot] is not UNBOUND:
+                    return _forced(values, slot)
+            try:
+                return frame.genv[name]
+            except KeyError:
+                raise VarNameNotFoundError(pos, name)
+    return run
+
+
+def _writer(ref):
+    '''
+    :param ref: a resolved name
+    :type ref: resolver.Ref
+    :return: a closure that binds a value to the name, following the rules
+             for set.
+    :rtype: (Frame, any) -> None
+    '''
+    name = ref.name.value
+    if not ref.chain:
+        def write(frame, v):
+            frame.genv[name] = v
+    elif ref.bound and len(ref.chain) == 1:
+        depth, slot = ref.chain[0]
+
+        def write(frame, v):
+            _frame_at(frame, depth).values[slot] = v
+    else:
+        chain = ref.chain
+        bound = ref.bound
+        # the name gets created in the innermost frame if it isn't bound
+        # anywhere
+        first_depth, first_slot = chain[0]
+
+        def write(frame, v):
+            for depth, slot in chain:
+                values = _frame_at(frame, depth).values
+                if values[slot] is not UNBOUND:
+                    values[slot] = v
+                    return
+            if not bound and name in frame.genv:
+                frame.genv[name] = v
+                return
+            _frame_at(frame, first_depth).values[first_slot] = v
+    return write
+
+
+def _compile_sequence(items, cx, tail):
+    '''
+    :return: a closure that evaluates items in order in the same frame and
+             returns the last value
+    '''
+    return _sequence([_compile(i, cx, tail and n == len(items) - 1)
+                      for (n, i) in enumerate(items)])
+
+
+def _sequence(items):
+    '''
+    :param items: compiled closures
+    :return: a closure that runs items in order and returns the last value
+    '''
+    if not items:
+        def run(frame):
+            return None
+    elif len(items) == 1:
+        run, = items
+    else:
+        init = tuple(items[:-1])
+        last = items[-1]
+
+        def run(frame):
+            for e in init:
+                e(frame)
+            return last(frame)
+    return run
+
+
+def _compile_static(datum, cx, tail):
+    value = datum.value
+
+    def run(frame):
+        return value
+    return run
+
+
+def _compile_var_ref(datum, cx, tail):
+    return _reader(cx.res.ref(datum), cx.arg_mode)
+
+
+def _compile_set(datum, cx, tail):
+    value_expr = _compile(datum.value_expr, cx)
+    write = _writer(cx.res.ref(datum))
+
+    def run(frame):
+        v = value_expr(frame)
+        write(frame, v)
+        return v
+    return run
+
+
+def _compile_function_def(datum, cx, tail):
+    block = cx.res.block(datum)
+    reuse = cx.arg_mode == STRICT and not block.captured
+    body_cx = cx._replace(func=datum if reuse else None)
+    body = datum.body
+    if type(body) is ExprSeq:
+        # the body shares the function's frame
+        body = _compile_sequence(body.items, body_cx, True)
+    else:
+        body = _compile(body, body_cx, True)
+    nparams = block.nparams
+    unbound = [UNBOUND] * block.nlocals
+    make_arg = ARG_BINDERS[cx.arg_mode]
+    write = _writer(cx.res.ref(datum))
+
+    def run(frame):
+        write(frame, CompiledFunction(datum, frame, nparams, unbound, body,
+                                      make_arg))
+    return run
+
+
+def _recorded(func, profiler):
+    '''
+    :return: a copy of func whose body records each call in profiler (see
+             profiler.Profiler.enter).  A copy is made for each call, as
+             the same function can be called by runs with other profilers.
+    :rtype: CompiledFunction
+    '''
+    body = func.body
+    key = (func.datum.name.value, func.datum.pos)
+
+    def recording(frame):
+        entry = profiler.enter(key)
+        try:
+            return body(frame)
+        finally:
+            profiler.leave(entry)
+    return CompiledFunction(func.datum, func.env, func.nparams, func.unbound,
+                            recording, func.make_arg)
+
+
+def _finishing(code):
+    '''
+    :param code: a closure compiled in tail position
+    :return: a closure that evaluates the same thing, but not in tail
+             position
+    '''
+    def finishing(frame):
+        result = code(frame)
+        while type(result) is TailCall:
+            result = result.func.body(result.frame)
+        return result
+    return finishing
+
+
+def _compile_function_call(datum, cx, tail):
+    name = datum.name
+    ref = cx.res.ref(datum)
+    callee = _reader(ref, cx.arg_mode)
+    arg_exprs = datum.arg_exprs
+    nargs = len(arg_exprs)
+
+    # In tail position, if the name refers to a builtin that returns one of
+    # its arguments, those arguments are in tail position too.  The name
+    # could be rebound at run time, so other callees get arguments that run
+    # any tail calls before returning.
+    builtin = None
+    positions = ()
+    if tail and not ref.chain:
+        builtin = global_builtins.get(name.value)
+        if builtin in tail_positions:
+            positions = tail_positions[builtin](nargs)
+        else:
+            builtin = None
+    codes = []
+    tail_args = []
+    for (i, a) in enumerate(arg_exprs):
+        if i in positions:
+            code = _compile(a, cx, True)
+            tail_args.append(CompiledExpr(code, a))
+            codes.append(_finishing(code))
+        else:
+            codes.append(_compile(a, cx))
+            tail_args.append(CompiledExpr(codes[-1], a))
+    codes = tuple(codes)
+    args = tuple(CompiledExpr(c, a) for (c, a) in zip(codes, arg_exprs))
+    tail_args = tuple(tail_args) if positions else args
+    bind_args = _arg_binder(arg_exprs, codes, cx)
+    pos = datum.pos
+
+    if not tail:
+        def call(frame):
+            func_def = callee(frame)
+            if type(func_def) is CompiledFunction:
+                assert (func_def.nparams == nargs)
+                meter = frame.genv.meter
+                if meter.profiler is not None:
+                    func_def = _recorded(func_def, meter.profiler)
+                meter.fuel -= 1
+                if meter.fuel < 0:
+                    meter.refuel(pos)
+                meter.space -= 1
+                if meter.space < 0:
+                    meter.out_of_space(pos)
+                values = bind_args(frame)
+                values += func_def.unbound
+                result = func_def.body(Frame(values, func_def.env,
+                                             frame.genv))
+                while type(result) is TailCall:
+                    result = result.func.body(result.frame)
+                return result
+            if func_def is None:
+                raise Exception("Undefined function '%s'" % str(name))
+            if (type(func_def) is FunctionType and
+                    func_def in strict_builtins or
+                    type(func_def) is ProfiledFunction and func_def.strict):
+                return func_def(frame, *[c(frame) for c in codes])
+            return func_def(frame, *args)
+        return _numeric_call(ref, codes, call)
+
+    this_func = cx.func
+
+    def run(frame):
+        func_def = callee(frame)
+        if type(func_def) is CompiledFunction:
+            assert (func_def.nparams == nargs)
+            meter = frame.genv.meter
+            if meter.profiler is not None:
+                func_def = _recorded(func_def, meter.profiler)
+            meter.fuel -= 1
+            if meter.fuel < 0:
+                meter.refuel(pos)
+            values = bind_args(frame)
+            values += func_def.unbound
+            if func_def.datum is this_func and func_def.env is frame.parent:
+                # calling itself, and nothing else can see the frame
+                frame.values = values
+                return TailCall(func_def, frame)
+            meter.space -= 1
+            if meter.space < 0:
+                meter.out_of_space(pos)
+            return TailCall(func_def, Frame(values, func_def.env, frame.genv))
+        if func_def is builtin:
+            return func_def(frame, *tail_args)
+        if func_def is None:
+            raise Exception("Undefined function '%s'" % str(name))
+        if (type(func_def) is FunctionType and func_def in strict_builtins or
+                type(func_def) is ProfiledFunction and func_def.strict):
+            return func_def(frame, *[c(frame) for c in codes])
+        return func_def(frame, *args)
+    return _numeric_call(ref, codes, run)
+
+
+def _numeric_call(ref, codes, generic):
+    '''
+    :param ref: the resolved name of the callee of a call
+    :type ref: resolver.Ref
+    :param codes: the compiled arguments of the call
+    :param generic: the compiled call
+    :type generic: (Frame) -> any
+    :return: generic, or, for a call of an arithmetic or comparison builtin
+             with two arguments, a closure that learns the types of the
+             numbers it is called with (see _NUMERIC_OPS)
+    :rtype: (Frame) -> any
+    '''
+    if ref.chain or len(codes) != 2:
+        return generic
+    builtin = global_builtins.get(ref.name.value)
+    ops = _NUMERIC_OPS.get(builtin)
+    if ops is None:
+        return generic
+    callee = _reader(ref, STRICT)
+    first, second = codes
+    # (kind, op, count): the type of number the call is specialized to (if
+    # any), and its operator, and the number of calls seen with two numbers
+    # of the same type, or -1 once the call has seen anything else.  The
+    # state is read once and replaced as a whole, so threads sharing the
+    # call never see a kind without its operator.
+    state = (None, None, 0)
+
+    def run(frame):
+        nonlocal state
+        if callee(frame) is not builtin:
+            return generic(frame)
+        x = first(frame)
+        y = second(frame)
+        t = type(x)
+        kind, op, count = state
+        if t is kind and type(y) is t:
+            return op(x, y)
+        if kind is not None:
+            # a new type: go back to the builtin, for good
+            state = (None, None, -1)
+        elif count >= 0:
+            if type(y) is t and t in ops:
+                count += 1
+                if count == SPECIALIZE_AFTER:
+                    state = (t, ops[t], count)
+                else:
+                    state = (None, None, count)
+            else:
+                state = (None, None, -1)
+        return builtin(frame, x, y)
+    return run
+
+
+def _arg_binder(arg_exprs, codes, cx):
+    '''
+    :return: a closure that makes the parameter values for a call to a
+             compiled function, from the caller's frame
+    :rtype: (Frame) -> list
+    '''
+    if cx.arg_mode == STRICT:
+        def bind(frame):
+            return [c(frame) for c in codes]
+        return bind
+    # Constants don't need to be wrapped up: evaluating them has no effects,
+    # and gives the same value each time.
+    make_arg = ARG_BINDERS[cx.arg_mode]
+    consts = [a.value if type(a) is StaticDatum else None for a in arg_exprs]
+    lazy = [(i, c) for (i, (a, c)) in enumerate(zip(arg_exprs, codes))
+            if type(a) is not StaticDatum]
+    early = [(i, c, _early(arg_exprs[i], cx.res, cx.arg_mode))
+             for (i, c) in lazy]
+    if any(e is not None for (i, c, e) in early):
+        # Nor do the arguments that can be evaluated early (see _early_plan)
+        def bind(frame):
+            values = list(consts)
+            for (i, c, e) in early:
+                v = _LATER if e is None else e(frame)
+                values[i] = make_arg(frame, c) if v is _LATER else v
+            return values
+    elif not lazy:
+        def bind(frame):
+            return list(consts)
+    elif len(lazy) == len(codes):
+        def bind(frame):
+            return [make_arg(frame, c) for c in codes]
+    else:
+        def bind(frame):
+            values = list(consts)
+            for (i, c) in lazy:
+                values[i] = make_arg(frame, c)
+            return values
+    return bind
+
+
+#: What an early argument evaluates to when it has to be evaluated later
+#: after all
+_LATER = object()
+
+
+def _early(datum, res, arg_mode):
+    '''
+    :param res: the names resolved in the unit
+    :type res: resolver.Resolution
+    :param arg_mode: how arguments are passed (one of scope.ARG_MODES)
+    :type arg_mode: str
+    :return: a closure that evaluates datum, an argument, when the call is
+             made (see _early_plan), or None if it can't be
+    :rtype: ((Frame) -> any) or None
+    '''
+    plan = _early_plan(datum, res)
+    return None if plan is None else _planned(plan, arg_mode)
+
+
+def _early_plan(datum, res):
+    '''
+    Plan the evaluation of an argument when the call is made, in place of
+    when the callee uses it.  That is possible for an argument made up of
+    constants, parameters that are never assigned, and calls to the pure
+    builtins: evaluating it has no effects and always gives the same value.
+
+    Binding such an argument as a value also keeps a tail recursive loop
+    from building a chain of arguments that each refer to the last, which
+    would have to be followed every time the last one is used.
+
+    :param res: the names resolved in the unit
+    :type res: resolver.Resolution
+    :return: the plan (a tuple, that can be pickled): ('const', value),
+             ('param', depth, slot) or ('call', ref, name, plans).  None if
+             datum is not that kind of argument.
+    :rtype: tuple or None
+    '''
+    t = type(datum)
+    if t is StaticDatum:
+        return ('const', datum.value)
+    if t is VarRef:
+        ref = res.ref(datum)
+        if (not ref.bound or len(ref.chain) != 1 or
+                ref.name.value in res.assigned):
+            return None
+        return ('param',) + tuple(ref.chain[0])
+    if t is Folded:
+        # the slow form works whatever the builtins are bound to
+        return _early_plan(datum.slow, res)
+    if t is not FunctionCall:
+        return None
+    ref = res.ref(datum)
+    builtin = global_builtins.get(datum.name.value)
+    if ref.chain or builtin not in pure_builtins or \
+            builtin not in strict_builtins:
+        return None
+    plans = tuple(_early_plan(a, res) for a in datum.arg_exprs)
+    if None in plans:
+        return None
+    return ('call', ref, datum.name.value, plans)
+
+
+def _planned(plan, arg_mode):
+    '''
+    :param plan: a plan made by _early_plan
+    :return: a closure that evaluates the argument in the caller's frame, or
+             returns _LATER if a parameter it reads hasn't been evaluated
+             yet, a builtin it calls has been rebound, or the builtin raises
+             an exception (which is left for the callee to raise when it
+             uses the argument)
+    :rtype: (Frame) -> any
+    '''
+    kind = plan[0]
+    if kind == 'const':
+        value = plan[1]
+
+        def run(frame):
+            return value
+        return run
+    if kind == 'param':
+        depth, slot = plan[1:]
+
+        def run(frame):
+            v = _frame_at(frame, depth).values[slot]
+            t = type(v)
+            if t is Thunk or (t is MemoThunk and v.code is not None):
+                return _LATER
+            if t is MemoThunk:
+                return v.force()
+            return v
+        return run
+    ref, name, plans = plan[1:]
+    callee = _reader(ref, arg_mode)
+    builtin = global_builtins[name]
+    args = [_planned(p, arg_mode) for p in plans]
+
+    def run(frame):
+        try:
+            f = callee(frame)
+            if f is not builtin and (type(f) is not ProfiledFunction or
+                                     f.func is not builtin):
+                return _LATER
+            values = []
+            for a in args:
+                v = a(frame)
+                if v is _LATER:
+                    return _LATER
+                values.append(v)
+            # the builtin, or in a profiled run, the builtin wrapped
+            return f(frame, *values)
+        except Exception:
+            return _LATER
+    return run
+
+
+def _compile_expr_seq(datum, cx, tail):
+    block = cx.res.block(datum)
+    if block is not None:
+        # code inside runs in a frame of its own
+        cx = cx._replace(func=None)
+    seq = _compile_sequence(datum.items, cx, tail)
+    if block is None:
+        # defines nothing, so it doesn't need a frame of its own
+        return seq
+    unbound = [UNBOUND] * len(block.names)
+    pos = datum.pos
+
+    def run(frame):
+        meter = frame.genv.meter
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(pos)
+        return seq(Frame(list(unbound), frame, frame.genv))
+    return run
+
+
+def _compile_folded(datum, cx, tail):
+    guards = tuple((_reader(cx.res.ref(ref), cx.arg_mode), builtin)
+                   for (ref, builtin) in datum.guards)
+    fast = _compile(datum.fast, cx, tail)
+    slow = _compile(datum.slow, cx, tail)
+
+    def run(frame):
+        for (read, builtin) in guards:
+            if read(frame) is not builtin:
+                return slow(frame)
+        return fast(frame)
+    return run
+
+
+def _compile_inlined(datum, cx, tail):
+    callee = _reader(cx.res.ref(datum.call), cx.arg_mode)
+    func = datum.func
+    guards = tuple((_reader(cx.res.ref(ref), cx.arg_mode), builtin)
+                   for (ref, builtin) in datum.guards)
+    body = _compile(datum.body, cx, tail)
+    call = _compile(datum.call, cx, tail)
+    pos = datum.pos
+
+    def run(frame):
+        f = callee(frame)
+        meter = frame.genv.meter
+        if (type(f) is not CompiledFunction or f.datum is not func or
+                meter.sampler is not None or meter.profiler is not None):
+            return call(frame)
+        for (read, builtin) in guards:
+            if read(frame) is not builtin:
+                return call(frame)
+        # the call would have used a step and a frame
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(pos)
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(pos)
+        return body(frame)
+    return run
+
+
+def _compile_special_form(datum, cx, tail):
+    callee = _reader(cx.res.ref(datum.call), cx.arg_mode)
+    builtin = datum.builtin
+    args = datum.arg_exprs
+    # Each argument is compiled once: the form and the call it falls back
+    # to share the closures, or nested forms would compile their arguments
+    # twice at each level.
+    if builtin is ifBuiltin:
+        tails = (False, tail, tail)
+    elif builtin is beginBuiltin:
+        tails = tuple(tail and n == len(args) - 1 for n in range(len(args)))
+    else:
+        tails = (False,) * len(args)
+    codes = tuple(_compile(a, cx, t) for (a, t) in zip(args, tails))
+    call = _fallback_call(datum.call, callee, codes, tails)
+
+    if builtin is ifBuiltin:
+        test, then, other = codes
+
+        def run(frame):
+            if callee(frame) is not builtin:
+                return call(frame)
+            if test(frame):
+                return then(frame)
+            return other(frame)
+    elif builtin is whileBuiltin:
+        test = codes[0]
+        body = _sequence(codes[1:])
+        pos = args[0].pos
+
+        def run(frame):
+            if callee(frame) is not builtin:
+                return call(frame)
+            # each iteration is a step (see budget.Meter)
+            meter = frame.genv.meter
+            last_value = None
+            while test(frame):
+                meter.fuel -= 1
+                if meter.fuel < 0:
+                    meter.refuel(pos)
+                last_value = body(frame)
+            return last_value
+    elif builtin is beginBuiltin:
+        seq = _sequence(codes)
+
+        def run(frame):
+            if callee(frame) is not builtin:
+                return call(frame)
+            return seq(frame)
+    elif builtin is andBuiltin:
+        def run(frame):
+            if callee(frame) is not builtin:
+                return call(frame)
+            for c in codes:
+                if not c(frame):
+                    return False
+            return True
+    else:
+        # or
+        def run(frame):
+            if callee(frame) is not builtin:
+                return call(frame)
+            for c in codes:
+                if c(frame):
+                    return True
+            return False
+    return run
+
+
+def _fallback_call(datum, callee, codes, tails):
+    '''
+    :param datum: the call that a special form stands for
+    :type datum: FunctionCall
+    :param callee: reads the function called
+    :param codes: the compiled arguments
+    :param tails: whether each argument was compiled in tail position
+    :return: a closure that makes the call as written, to whatever the name
+             refers to, with the arguments already compiled
+    '''
+    name = datum.name
+    codes = tuple(_finishing(c) if t else c for (c, t) in zip(codes, tails))
+    args = tuple(CompiledExpr(c, a) for (c, a) in zip(codes, datum.arg_exprs))
+
+    def call(frame):
+        func_def = callee(frame)
+        if func_def is None:
+            raise Exception("Undefined function '%s'" % str(name))
+        if (type(func_def) is FunctionType and func_def in strict_builtins or
+                type(func_def) is ProfiledFunction and func_def.strict):
+            return func_def(frame, *[c(frame) for c in codes])
+        return func_def(frame, *args)
+    return call
+
+
+def _compile_list(datum, cx, tail):
+    items = tuple(_compile(i, cx) for i in datum.items)
+    pos = datum.pos
+
+    def run(frame):
+        meter = frame.genv.meter
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(pos)
+        return [i(frame) for i in items]
+    return run
+
+
+_COMPILERS = {
+    StaticDatum: _compile_static,
+    VarRef: _compile_var_ref,
+    Set: _compile_set,
+    FunctionDef: _compile_function_def,
+    FunctionCall: _compile_function_call,
+    ExprSeq: _compile_expr_seq,
+    List: _compile_list,
+    Folded: _compile_folded,
+    Inlined: _compile_inlined,
+    SpecialForm: _compile_special_form,
+}
+
+
+def frame_handlers():
+    '''
+    Read the functions running in compiled code, for sampler.Sampler (see
+    engine.Engine.frame_handlers).  The handlers read the locals of
+    CompiledFunction.__call__, finish, and the call sites made by
+    _compile_function_call and _finishing: keep them in step.
+
+    :return: Python code object -> handler
+    :rtype: dict
+    '''
+    def compiled_function_call(local, s, innermost):
+        s.push_def(local['self'].datum)
+
+    def finish_result(local, s, innermost):
+        # the function called by CompiledFunction.__call__ has been left by
+        # a tail call
+        result = local.get('result')
+        if type(result) is TailCall:
+            s.entries[-1:] = []
+            s.push_def(result.func.datum)
+
+    def call_site(local, s, innermost):
+        result = local.get('result')
+        if type(result) is TailCall:
+            s.push_def(result.func.datum)
+        elif type(local.get('func_def')) is CompiledFunction:
+            s.push_def(local['func_def'].datum)
+
+    def finishing(local, s, innermost):
+        result = local.get('result')
+        if type(result) is TailCall:
+            s.push_def(result.func.datum)
+
+    handlers = {CompiledFunction.__call__.__code__: compiled_function_call,
+                finish.__code__: finish_result}
+    # calls in tail position return a TailCall to a call site
+    for code in _nested(_compile_function_call, 'call'):
+        handlers[code] = call_site
+    for code in _nested(_finishing, 'finishing'):
+        handlers[code] = finishing
+    return handlers
+
+
+def _nested(func, name):
+    '''
+    :return: the code objects of the functions called name that are defined
+             in func
+    :rtype: list[CodeType]
+    '''
+    return [c for c in func.__code__.co_consts
+            if type(c) is CodeType and c.co_name == name]
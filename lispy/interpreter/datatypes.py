@@ -1,6 +1,12 @@
 __author__ = 'Dan Bullok and Ben Lambeth'
 
-from .scope import Scope, ArgExpr, Datum
+from types import FunctionType
+
+from .scope import Scope, Datum, make_arg
+from .profiler import ProfiledFunction
+from ..builtins import strict_builtins
+from ..builtins.builtins import ifBuiltin, whileBuiltin, beginBuiltin, \
+    andBuiltin, orBuiltin
 
 
 '''
@@ -30,17 +36,40 @@ class FunctionDef(Datum):
 
     def __call__(self, parent_scope, *arg_vals):
         assert (len(self._args) == len(arg_vals))
+        meter = parent_scope.meter
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(self.pos)
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(self.pos)
         scope = Scope(self.pos, parent_scope)
+        arg_mode = parent_scope.arg_mode
         for (id, val) in zip(self._args, arg_vals):
             # we store the values of the args - they might not actually be
             # computed.  This allows lazy evaluation of function args
-            scope.create_local(id, ArgExpr(parent_scope, val))
-        return self._body.evaluate(scope)
+            scope.create_local(id, make_arg(arg_mode, parent_scope, val))
+        if meter.profiler is None:
+            return self._body.evaluate(scope)
+        return meter.profiler.call((self._name.value, self.pos),
+                                   self._body.evaluate, scope, ())
         # last_value = None
         # for item in self._body:
         # last_value = item.evaluate(scope)
         # return last_value
 
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def args(self):
+        return self._args
+
+    @property
+    def body(self):
+        return self._body
+
     @property
     def value(self):
         return 'FunctionDef %s (%s) at %s' % (self._name,
@@ -56,12 +85,41 @@ class FunctionCall(Datum):
         super().__init__(pos)
         self._name = name
         self._arg_exprs = arg_exprs
+        # the callee found by the last search, if it may be reused: (cells
+        # of the run, Cell of the name, its version, callee, True if it is a
+        # strict builtin).  The datum can be shared by runs (through the
+        # cache of compiled units) and threads, so the cache is replaced,
+        # never changed.
+        self._cache = None
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def arg_exprs(self):
+        return self._arg_exprs
 
     def evaluate(self, parent_scope):
-        func_def = parent_scope.get(self._name)
+        cache = self._cache
+        if (cache is not None and cache[0] is parent_scope.cells
+                and cache[1].version == cache[2]):
+            func_def = cache[3]
+            is_strict = cache[4]
+        else:
+            func_def, cell, version = parent_scope.lookup(self._name)
+            is_strict = (type(func_def) is FunctionType and
+                         func_def in strict_builtins or
+                         type(func_def) is ProfiledFunction and
+                         func_def.strict)
+            if version is not None:
+                self._cache = (parent_scope.cells, cell, version, func_def,
+                               is_strict)
         if func_def is None:
             raise Exception("Undefined function '%s'" % str(self._name))
-
+        if is_strict:
+            return func_def(parent_scope, *[a.evaluate(parent_scope)
+                                            for a in self._arg_exprs])
         return func_def(parent_scope, *self._arg_exprs)
 
 
@@ -71,12 +129,20 @@ class ExprSeq(Datum):
         self._items = items
 
     def evaluate(self, parent_scope):
+        meter = parent_scope.meter
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(self.pos)
         scope = Scope(self.pos, parent_scope)
         last_value = None
         for e in self._items:
             last_value = e.evaluate(scope)
         return last_value
 
+    @property
+    def items(self):
+        return self._items
+
     @property
     def value(self):
         return [i.value for i in self._items]
@@ -84,6 +150,10 @@ class ExprSeq(Datum):
 
 class List(ExprSeq):
     def evaluate(self, parent_scope):
+        meter = parent_scope.meter
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(self.pos)
         return [i.evaluate(parent_scope) for i in self._items]
 
 
@@ -93,6 +163,14 @@ class Set(Datum):
         self._name = name
         self._value = value
 
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def value_expr(self):
+        return self._value
+
     def evaluate(self, parent_scope):
         v = self._value.evaluate(parent_scope)
         parent_scope.assign(self._name, v)
@@ -135,5 +213,276 @@ class VarRef(Datum):
         assert isinstance(name, Syn)
         self._name = name
 
+    @property
+    def name(self):
+        return self._name
+
     def evaluate(self, parent_scope):
         return parent_scope.get(self._name)
+
+
+class Folded(Datum):
+    '''
+    A call that the optimizer has worked out ahead of time (see
+    optimizer.py): the value of a call to a builtin with constant
+    arguments, or the branch that an if with a constant condition takes.
+
+    The names of the builtins it relies on could be bound to something else
+    when it runs (by another unit, for instance), so they are looked up
+    first.  If they are all still bound to the builtins, the folded form is
+    evaluated.  Otherwise, the call is evaluated as written.
+    '''
+
+    def __init__(self, pos, guards, fast, slow):
+        '''
+        :param guards: the names that must be bound to the builtins, and
+                       the builtins
+        :type guards: tuple[(VarRef, function)]
+        :param fast: what the call comes to, if the guards hold
+        :type fast: Datum
+        :param slow: the call, as written
+        :type slow: FunctionCall
+        '''
+        super().__init__(pos)
+        self._guards = guards
+        self._fast = fast
+        self._slow = slow
+
+    @property
+    def guards(self):
+        return self._guards
+
+    @property
+    def fast(self):
+        return self._fast
+
+    @property
+    def slow(self):
+        return self._slow
+
+    @property
+    def value(self):
+        return self._slow.value
+
+    def evaluate(self, parent_scope):
+        for (ref, builtin) in self._guards:
+            if ref.evaluate(parent_scope) is not builtin:
+                return self._slow.evaluate(parent_scope)
+        return self._fast.evaluate(parent_scope)
+
+
+class Inlined(Datum):
+    '''
+    A call to a small function, with the function's body in its place (see
+    optimizer.py).
+
+    Before the body is evaluated, the name of the function is looked up, to
+    check that it is still bound to the function, and so are the names of
+    the builtins that the body calls.  If any of them is bound to something
+    else, the call is evaluated as written.
+    '''
+
+    def __init__(self, pos, func, guards, body, call):
+        '''
+        :param func: the definition of the function
+        :type func: FunctionDef
+        :param guards: the names that must be bound to the builtins, and
+                       the builtins
+        :type guards: tuple[(VarRef, function)]
+        :param body: the body of the function, with the arguments in place
+                     of the parameters
+        :type body: Datum
+        :param call: the call, as written
+        :type call: FunctionCall
+        '''
+        super().__init__(pos)
+        self._func = func
+        self._guards = guards
+        self._body = body
+        self._call = call
+        # the names to check, and what they must be bound to
+        self._checks = ((call.name, func),) + tuple(
+            (ref.name, builtin) for (ref, builtin) in guards)
+        # (cells of the run, ((Cell, version)...)) when the checks last
+        # passed, if they may be reused (see FunctionCall)
+        self._cache = None
+
+    @property
+    def func(self):
+        return self._func
+
+    @property
+    def guards(self):
+        return self._guards
+
+    @property
+    def body(self):
+        return self._body
+
+    @property
+    def call(self):
+        return self._call
+
+    @property
+    def value(self):
+        return self._call.value
+
+    def evaluate(self, parent_scope):
+        meter = parent_scope.meter
+        if (meter.sampler is not None or meter.profiler is not None or
+                not _holds(self, parent_scope)):
+            return self._call.evaluate(parent_scope)
+        func = self._func
+        # what the call would have used: a step, and the scopes of the call
+        # and of the body
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(func.pos)
+        meter.space -= 1 + (type(func.body) is ExprSeq)
+        if meter.space < 0:
+            meter.out_of_space(func.pos)
+        return self._body.evaluate(parent_scope)
+
+
+class SpecialForm(Datum):
+    '''
+    A call to one of the builtins that control how their arguments are
+    evaluated (see builtins.special_forms), carried out by the evaluator
+    itself rather than by calling the builtin (see optimizer.py).
+
+    The name is looked up first, to check that it still refers to the
+    builtin.  If it doesn't, the call is evaluated as written.
+    '''
+
+    def __init__(self, pos, builtin, call):
+        '''
+        :param builtin: the builtin the call is to
+        :type builtin: function
+        :param call: the call, as written
+        :type call: FunctionCall
+        '''
+        super().__init__(pos)
+        self._builtin = builtin
+        self._call = call
+        self._form = _FORMS[builtin]
+        # (see Inlined)
+        self._checks = ((call.name, builtin),)
+        self._cache = None
+
+    @property
+    def builtin(self):
+        return self._builtin
+
+    @property
+    def call(self):
+        return self._call
+
+    @property
+    def arg_exprs(self):
+        return self._call.arg_exprs
+
+    @property
+    def value(self):
+        return self._call.value
+
+    def evaluate(self, parent_scope):
+        if not _holds(self, parent_scope):
+            return self._call.evaluate(parent_scope)
+        return self._form(parent_scope, self._call.arg_exprs)
+
+
+def _if_form(parent_scope, args):
+    condition, true_expr, false_expr = args
+    if condition.evaluate(parent_scope):
+        return true_expr.evaluate(parent_scope)
+    return false_expr.evaluate(parent_scope)
+
+
+def _while_form(parent_scope, args):
+    cond = args[0]
+    body = args[1:]
+    last_value = None
+    # each iteration is a step (see interpreter.budget)
+    meter = parent_scope.meter
+    while cond.evaluate(parent_scope):
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(cond.pos)
+        for a in body:
+            last_value = a.evaluate(parent_scope)
+    return last_value
+
+
+def _begin_form(parent_scope, args):
+    last_value = None
+    for a in args:
+        last_value = a.evaluate(parent_scope)
+    return last_value
+
+
+def _and_form(parent_scope, args):
+    for a in args:
+        if not a.evaluate(parent_scope):
+            return False
+    return True
+
+
+def _or_form(parent_scope, args):
+    for a in args:
+        if a.evaluate(parent_scope):
+            return True
+    return False
+
+
+# how each special form is evaluated (builtin -> function of the scope and
+# the argument expressions)
+_FORMS = {
+    ifBuiltin: _if_form,
+    whileBuiltin: _while_form,
+    beginBuiltin: _begin_form,
+    andBuiltin: _and_form,
+    orBuiltin: _or_form,
+}
+
+
+def _holds(datum, parent_scope):
+    '''
+    :param datum: an Inlined or SpecialForm
+    :return: True if the names that datum checks are bound to what they
+             must be.  When they are global, the result is remembered
+             until one of them is bound again (see FunctionCall).
+    :rtype: bool
+    '''
+    cache = datum._cache
+    if cache is not None and cache[0] is parent_scope.cells:
+        for (cell, version) in cache[1]:
+            if cell.version != version:
+                break
+        else:
+            return True
+    cells = []
+    for (name, defn) in datum._checks:
+        found, cell, version = parent_scope.lookup(name)
+        if found is not defn:
+            return False
+        if version is None:
+            cells = None
+        elif cells is not None:
+            cells.append((cell, version))
+    if cells is not None:
+        datum._cache = (parent_scope.cells, tuple(cells))
+    return True
+
+
+def frame_handlers():
+    '''
+    Read the functions running in the tree engine, for sampler.Sampler (see
+    engine.Engine.frame_handlers): each call of a function is a frame of
+    FunctionDef.__call__.
+
+    :return: Python code object -> handler
+    :rtype: dict
+    '''
+    def function_def_call(local, s, innermost):
+        s.push_def(local['self'])
+    return {FunctionDef.__call__.__code__: function_def_call}
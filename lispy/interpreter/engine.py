@@ -0,0 +1,234 @@
+'''
+Evaluation engines.  An engine turns the Datum tree built by make_datum into
+code that the interpreter can run.  Whatever an engine's compile method
+returns must have an evaluate(parent_scope) method, and is evaluated in the
+global scope made by the engine's new_global_scope method.
+
+Each engine imports the modules it needs when it is first used, so starting
+an interpreter only loads one engine.
+'''
+
+from .scope import GlobalScope, ARG_MODES, BY_NAME
+from .frame import GlobalEnv
+from ..builtins import global_builtins, interpreter_builtins
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+
+class Engine(object):
+    '''
+    Base class for an evaluation engine.
+    '''
+
+    #: the name used to select this engine (see make_engine)
+    name = None
+
+    #: True if units are optimized (see optimizer.py) before they are
+    #: compiled for this engine
+    optimize = True
+
+    def __init__(self, arg_mode=BY_NAME):
+        '''
+        :param arg_mode: how arguments are passed to functions (one of
+                         scope.ARG_MODES)
+        :type arg_mode: str
+        :raises ValueError: if arg_mode isn't a known argument mode
+        '''
+        if arg_mode not in ARG_MODES:
+            raise ValueError('Unknown argument mode "%s".  Choose one of: %s'
+                             % (arg_mode, ', '.join(ARG_MODES)))
+        self.arg_mode = arg_mode
+
+    def compile(self, datum):
+        '''
+        :param datum: the datum to compile (usually a whole unit)
+        :type datum: datatypes.Datum
+        :return: an object with an evaluate(parent_scope) method
+        '''
+        pass
+
+    def new_global_scope(self, interpreter, base=None):
+        '''
+        :param interpreter: what the scope's load, reload and require
+                            builtins act on: the run of an interpreter that
+                            will run code in the scope
+        :type interpreter: Interpreter or interpreter._Run
+        :param base: the global bindings to start from (name -> value), or
+                     None for just the builtins.  They are shared, not
+                     copied, and never changed.
+        :type base: Mapping or None
+        :return: a new top-level scope, with the builtins defined, that
+                 compiled code is evaluated in.  Its meter attribute is the
+                 budget.Meter that the run's work is counted by.
+        '''
+        pass
+
+    def global_layers(self, scope):
+        '''
+        :param scope: a scope made by new_global_scope
+        :return: a copy of the global bindings made in the scope itself, and
+                 the shared bindings they are layered over (see
+                 new_global_scope).  A name bound in both is bound to the
+                 value in the first.
+        :rtype: (dict, Mapping)
+        '''
+        pass
+
+    def dump(self, compiled):
+        '''
+        :param compiled: a unit compiled by this engine
+        :return: a form of the compiled unit that can be pickled, or None if
+                 this engine's compiled units can't be
+        '''
+        return None
+
+    def load(self, data):
+        '''
+        :param data: what dump returned for a compiled unit
+        :return: the compiled unit
+        '''
+        raise NotImplementedError('%s units cannot be loaded' % self.name)
+
+    @classmethod
+    def frame_handlers(cls):
+        '''
+        How sampler.Sampler reads the LisPy call stack of this engine from
+        the Python frames of a run.  Each handler is called, outermost frame
+        first, with the frame's locals, the sample being taken (see
+        sampler.SampleStack), and whether the frame is the innermost one,
+        and adds the functions running in the frame to the sample.
+
+        :return: Python code object -> handler
+        :rtype: dict[CodeType, (dict, SampleStack, bool) -> None]
+        '''
+        return dict()
+
+
+class TreeEngine(Engine):
+    '''
+    Walks the Datum tree, calling evaluate on each node.  It is kept for
+    differential testing.  Unlike the other engines, it scopes names
+    dynamically, through the scopes of the callers (see Interpreter).
+    '''
+    name = 'tree'
+
+    # Units are walked as written: the optimizer's nodes would only save
+    # the walker a little, as their guards look the builtins up by name
+    # in the scopes, and the work of optimizing would be spent on every
+    # unit loaded.
+    optimize = False
+
+    def compile(self, datum):
+        return datum
+
+    def new_global_scope(self, interpreter, base=None):
+        return GlobalScope(global_builtins if base is None else base,
+                           interpreter_builtins, interpreter, self.arg_mode)
+
+    def global_layers(self, scope):
+        own, shared = scope.bindings.maps
+        return (dict(own), shared)
+
+    @classmethod
+    def frame_handlers(cls):
+        from .datatypes import frame_handlers
+        return frame_handlers()
+
+
+class ClosureEngine(Engine):
+    '''
+    Compiles each unit to a tree of Python closures (see compiler.py) that
+    run against array-backed frames.  Names are resolved lexically at compile
+    time (see resolver.py).
+    '''
+    name = 'closure'
+
+    def compile(self, datum):
+        from .compiler import compile_datum
+        return compile_datum(datum, self.arg_mode)
+
+    def new_global_scope(self, interpreter, base=None):
+        env = GlobalEnv(global_builtins if base is None else base,
+                        interpreter_builtins, interpreter)
+        return env.top_frame()
+
+    def global_layers(self, scope):
+        return (dict(scope.genv), scope.genv.base)
+
+    @classmethod
+    def frame_handlers(cls):
+        from .compiler import frame_handlers
+        return frame_handlers()
+
+
+class StackEngine(ClosureEngine):
+    '''
+    Evaluates each unit with an explicit stack instead of Python recursion
+    (see stack.py), so recursion depth is bounded by memory.  It runs against
+    the same frames and globals as the closure engine.
+    '''
+    name = 'stack'
+
+    def compile(self, datum):
+        from .resolver import resolve
+        from .stack import StackUnit
+        return StackUnit(datum, resolve(datum), self.arg_mode)
+
+    @classmethod
+    def frame_handlers(cls):
+        from .stack import frame_handlers
+        return frame_handlers()
+
+
+class VMEngine(ClosureEngine):
+    '''
+    Compiles each unit to bytecode (see bytecode.py) and runs it on a VM
+    (see vm.py).  Compiled code can be pickled, and it runs against the same
+    frames and globals as the closure engine.
+    '''
+    name = 'vm'
+
+    def compile(self, datum):
+        from .bytecode import compile_code
+        from .vm import VMExpr
+        code = compile_code(datum, self.arg_mode)
+        return VMExpr(code, 0, -1, datum.pos)
+
+    def dump(self, compiled):
+        return compiled.code
+
+    def load(self, data):
+        from .vm import VMExpr
+        return VMExpr(data, 0, -1, data.pos)
+
+    @classmethod
+    def frame_handlers(cls):
+        from .vm import frame_handlers
+        return frame_handlers()
+
+
+#: Available engines (engine name -> engine class)
+ENGINES = {e.name: e for e in (TreeEngine, ClosureEngine, StackEngine,
+                               VMEngine)}
+
+#: The engine used when none is specified
+DEFAULT_ENGINE = ClosureEngine.name
+
+
+def make_engine(name, arg_mode=BY_NAME):
+    '''
+    :param name: the name of the engine
+    :type name: str
+    :param arg_mode: how arguments are passed to functions (one of
+                     scope.ARG_MODES)
+    :type arg_mode: str
+    :return: a new instance of the named engine
+    :rtype: Engine
+    :raises ValueError: if there is no engine with the given name
+    '''
+    try:
+        engine = ENGINES[name]
+    except KeyError:
+        raise ValueError('Unknown engine "%s".  Choose one of: %s' %
+                         (name, ', '.join(sorted(ENGINES))))
+    return engine(arg_mode)
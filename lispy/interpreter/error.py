@@ -75,4 +75,21 @@ class UnitNotFoundError(LispyError):
         self._unit_name = unit_name
 
 
+class BudgetExceededError(LispyError):
+    '''
+    A run has gone over one of the limits of its budget (see
+    budget.Budget).
+    '''
 
+    def __init__(self, pos, limit, message):
+        '''
+        :param pos: where the run was stopped
+        :type pos: TokenPos or None
+        :param limit: the limit that was exceeded: 'steps', 'time' or
+                      'allocations'
+        :type limit: str
+        :param message: the error message
+        :type message: str
+        '''
+        super().__init__(pos, message)
+        self.limit = limit
@@ -0,0 +1,184 @@
+'''
+Runtime environment used by compiled code.
+
+Compiled code does not look names up by walking a chain of Scope dicts.
+The resolver (resolver.py) gives every local variable a slot number in a
+Frame, and global names live in a GlobalEnv.
+'''
+
+from .scope import STRICT, BY_NAME, BY_NEED
+from .budget import Meter
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+
+class _Unbound(object):
+    '''Type of UNBOUND'''
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNBOUND'
+
+
+#: Marks a local slot that has not been assigned yet.
+UNBOUND = _Unbound()
+
+
+class Frame(object):
+    '''
+    The local variables of one function call (or of one ExprSeq that defines
+    names), stored by slot number.
+    '''
+    __slots__ = ('values', 'parent', 'genv')
+
+    def __init__(self, values, parent, genv):
+        '''
+        :param values: the slot values.  Slots that have not been assigned
+                       hold UNBOUND.
+        :type values: list
+        :param parent: the lexically enclosing frame, or None for the
+                       top-level frame
+        :type parent: Frame or None
+        :param genv: the global bindings
+        :type genv: GlobalEnv
+        '''
+        self.values = values
+        self.parent = parent
+        self.genv = genv
+
+    @property
+    def meter(self):
+        '''
+        :return: the meter of the run (see budget.Meter)
+        :rtype: budget.Meter
+        '''
+        return self.genv.meter
+
+    @meter.setter
+    def meter(self, meter):
+        self.genv.meter = meter
+
+
+class Thunk(object):
+    '''
+    An unevaluated function argument (call-by-name).  Forcing it evaluates
+    the argument expression in the caller's frame, every time.
+    '''
+    __slots__ = ('frame', 'code')
+
+    def __init__(self, frame, code):
+        '''
+        :param frame: the frame the argument is evaluated in
+        :type frame: Frame
+        :param code: the compiled argument expression
+        :type code: (Frame) -> any
+        '''
+        self.frame = frame
+        self.code = code
+
+    def force(self):
+        return self.code(self.frame)
+
+
+class Value(object):
+    '''
+    A function argument that has already been evaluated, for builtins that
+    expect to evaluate their arguments themselves.
+    '''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, parent_scope):
+        return self.value
+
+
+class MemoThunk(object):
+    '''
+    An unevaluated function argument that is evaluated the first time it is
+    forced.  The value is remembered for later uses (call-by-need).
+    '''
+    __slots__ = ('frame', 'code', '_value')
+
+    def __init__(self, frame, code):
+        '''
+        :param frame: the frame the argument is evaluated in
+        :type frame: Frame
+        :param code: the compiled argument expression
+        :type code: (Frame) -> any
+        '''
+        self.frame = frame
+        self.code = code
+
+    def force(self):
+        if self.code is not None:
+            self.settle(self.code(self.frame))
+        return self._value
+
+    def settle(self, value):
+        '''
+        Record the value of the argument, when it has been evaluated by
+        something other than force.
+        '''
+        self._value = value
+        # the frame and code aren't needed any more
+        self.code = self.frame = None
+
+
+def _strict_arg(frame, code):
+    return code(frame)
+
+
+#: argument mode (one of scope.ARG_MODES) -> function that binds an argument
+#: for a call, given the caller's frame and the compiled argument expression
+ARG_BINDERS = {STRICT: _strict_arg, BY_NAME: Thunk, BY_NEED: MemoThunk}
+
+
+class GlobalEnv(dict):
+    '''
+    The global bindings (name -> value) of an interpreter.
+
+    The bindings are layered over a dict of builtins (or a Snapshot's
+    frozen bindings) that is shared, rather than copied.  A name that isn't
+    bound in the env itself is looked up in the shared dict, and copied into
+    the env, so the next lookup is as fast as any other.  Bindings are only
+    ever made in the env.
+    '''
+
+    def __init__(self, builtins, interpreter_builtins, interpreter):
+        '''
+        :param builtins: the bindings the env starts with (name -> value).
+                         The dict is never changed.
+        :type builtins: dict[str,function]
+        :param interpreter_builtins: builtins that need the interpreter
+                                     (name -> function that makes the builtin)
+        :type interpreter_builtins: dict[str,function]
+        :param interpreter: the interpreter (or the run of one) that owns
+                            these bindings
+        :type interpreter: Interpreter or interpreter._Run
+        '''
+        super().__init__()
+        #: the shared bindings under the env's own
+        self.base = builtins
+        #: counts the work done by the run the env belongs to (see
+        #: budget.Meter)
+        self.meter = Meter()
+        for id, make_func in interpreter_builtins.items():
+            self[id] = make_func(interpreter)
+
+    def __missing__(self, name):
+        value = self.base[name]
+        self[name] = value
+        return value
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self.base
+
+    def top_frame(self):
+        '''
+        :return: a frame for running top-level (unit) code against these
+                 globals
+        :rtype: Frame
+        '''
+        return Frame([], None, self)
@@ -1,4 +1,10 @@
+import io
+import locale
+import mmap
 import os
+import stat
+import threading
+import time
 from .error import UnitNotFoundError
 
 __author__ = 'Dan Bullok and Ben Lambeth'
@@ -29,6 +35,21 @@ class Loader(object):
         '''
         pass
 
+    def open_unit(self, unit_name, pos=None):
+        '''
+        Open a unit to be read as a stream (see Interpreter.run_stream).
+
+        :param unit_name: the name of the unit to open
+        :type unit_name: str
+        :param pos: the position of the request (see load_unit)
+        :type pos: TokenPos or None
+        :return: a file to read the text of the requested source unit from
+        :rtype: io.TextIOBase
+        :raises UnitNotFoundError: if the requested source unit cannot be
+        found.
+        '''
+        return io.StringIO(self.load_unit(unit_name, pos))
+
 
 class DictLoader(Loader):
     '''
@@ -79,6 +100,14 @@ class FileSysLoader(Loader):
                 return content
         raise UnitNotFoundError(pos, unit_name)
 
+    def open_unit(self, unit_name, pos=None):
+        # the file is read as it is used, rather than all at once
+        for d in self._module_dirs:
+            p = os.path.join(d, unit_name)
+            if os.path.isfile(p):
+                return open(p, 'r')
+        raise UnitNotFoundError(pos, unit_name)
+
     def _load(self, unit_name, root_dir):
         '''
         Attempt to load a unit from a file.  The file name is the unit_name
@@ -93,6 +122,182 @@ class FileSysLoader(Loader):
         '''
         # TODO: Handle file read errors such as permission errors, etc.
         p = os.path.join(root_dir, unit_name)
-        if os.path.exists(p) and os.path.isfile(p):
-            return open(p, 'r').read()
+        if os.path.isfile(p):
+            with open(p, 'r') as f:
+                return f.read()
+        return None
+
+
+class CachedFileSysLoader(FileSysLoader):
+    '''
+    A FileSysLoader that remembers where each unit was found (or that it
+    wasn't found), and the unit's text.  Loading a unit again only takes a
+    stat of its file, to check that its modification time and size are the
+    same, and a stat of each directory searched before the unit's, to check
+    that no unit has been added there that would be found first.  With a ttl,
+    even those checks are skipped for a while after each one, so that units
+    loaded over and over (from a network file system, say) don't wait on the
+    file system at all.
+
+    Like the checks on a .pyc file, these can miss a unit that is changed
+    without its size changing within the resolution of the file system's
+    modification times.
+
+    Files are read through mmap, so a large unit is decoded straight from
+    the page cache, without first being copied into a buffer.
+    '''
+
+    def __init__(self, module_dirs, ttl=0.0):
+        '''
+        :param module_dirs: the directories to search for units
+        :type module_dirs: list[str]
+        :param ttl: the number of seconds after a unit is checked that it is
+                    trusted without being checked again.  With 0 (the
+                    default), it is checked every time it is loaded.
+        :type ttl: float
+        '''
+        super().__init__(module_dirs)
+        self.ttl = ttl
+        self._entries = dict()
+        self._lock = threading.Lock()
+
+    def load_unit(self, unit_name, pos=None):
+        entry = self._entry(unit_name)
+        if entry.path is None:
+            raise UnitNotFoundError(pos, unit_name)
+        return entry.text
+
+    def open_unit(self, unit_name, pos=None):
+        # the path is looked up in the cache, but the text isn't kept
+        entry = self._entry(unit_name)
+        if entry.path is None:
+            raise UnitNotFoundError(pos, unit_name)
+        return open(entry.path, 'r')
+
+    def clear(self):
+        '''
+        Forget every unit, so that each is looked for again.
+        '''
+        with self._lock:
+            self._entries.clear()
+
+    def _entry(self, unit_name):
+        '''
+        :return: the valid entry for a unit, finding the unit again if there
+                 isn't one
+        :rtype: _Entry
+        '''
+        with self._lock:
+            entry = self._entries.get(unit_name)
+        if entry is not None and self._valid(entry):
+            return entry
+        entry = self._find(unit_name)
+        with self._lock:
+            self._entries[unit_name] = entry
+        return entry
+
+    def _valid(self, entry):
+        '''
+        :return: True if nothing has changed that would make loading the
+                 unit give a different result
+        '''
+        now = time.monotonic()
+        if now - entry.checked < self.ttl:
+            return True
+        if entry.path is not None and _stamp(entry.path) != entry.stamp:
+            return False
+        for (d, s) in entry.dir_stamps:
+            if _stamp(d) != s:
+                return False
+        entry.checked = now
+        return True
+
+    def _find(self, unit_name):
+        '''
+        Search the directories for a unit.
+
+        :return: an entry for the unit, with no path if it wasn't found
+        :rtype: _Entry
+        '''
+        now = time.monotonic()
+        dir_stamps = []
+        for root_dir in self._module_dirs:
+            p = os.path.join(root_dir, unit_name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                st = None
+            if st is not None and stat.S_ISREG(st.st_mode):
+                # stamped before it's read, so a change made while it's
+                # being read is seen next time
+                return _Entry(p, (st.st_mtime_ns, st.st_size), _read_text(p),
+                              dir_stamps, now)
+            # the directory the unit would be in: adding the unit there
+            # changes its stamp
+            d = os.path.dirname(p)
+            dir_stamps.append((d, _stamp(d)))
+        return _Entry(None, None, None, dir_stamps, now)
+
+
+class _Entry(object):
+    '''
+    What a CachedFileSysLoader knows about a unit.
+    '''
+    __slots__ = ('path', 'stamp', 'text', 'dir_stamps', 'checked')
+
+    def __init__(self, path, stamp, text, dir_stamps, checked):
+        '''
+        :param path: the unit's file, or None if it wasn't found
+        :type path: str or None
+        :param stamp: the modification time and size of the file
+        :type stamp: (int, int) or None
+        :param text: the text of the unit
+        :type text: str or None
+        :param dir_stamps: the stamps of the directories that the unit
+                           wasn't found in
+        :type dir_stamps: list[(str, (int, int) or None)]
+        :param checked: when the entry was last found to be valid (see
+                        time.monotonic)
+        :type checked: float
+        '''
+        self.path = path
+        self.stamp = stamp
+        self.text = text
+        self.dir_stamps = dir_stamps
+        self.checked = checked
+
+
+def _stamp(path):
+    '''
+    :return: the modification time (in ns) and size of a file or directory,
+             or None if it doesn't exist
+    :rtype: (int, int) or None
+    '''
+    try:
+        st = os.stat(path)
+    except OSError:
         return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_text(path):
+    '''
+    Read a file through mmap.  The text is decoded the same way as a file
+    opened with open(path, 'r'), including the translation of newlines.
+
+    :return: the text of the file
+    :rtype: str
+    '''
+    encoding = locale.getpreferredencoding(False)
+    with open(path, 'rb') as f:
+        try:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # an empty file, or one that can't be mapped
+            text = f.read().decode(encoding)
+        else:
+            with m:
+                text = str(m, encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
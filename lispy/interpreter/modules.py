@@ -0,0 +1,84 @@
+'''
+The units that an interpreter has loaded.
+
+Every unit is run against the interpreter's global bindings, so a unit's
+top-level set and defun forms are seen by every other unit.  The registry
+records, for each unit that has been loaded, the source it was run from, its
+value and the global bindings it made (its exports), so that loading it
+again can be skipped.
+'''
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+# a value no binding has
+_MISSING = object()
+
+
+class Module(object):
+    '''
+    A unit that has been loaded (or is being loaded) by an interpreter.
+    '''
+
+    def __init__(self, name, source_hash):
+        '''
+        :param name: the name of the unit
+        :type name: str
+        :param source_hash: the hash of the text the unit was run from (see
+                            cache.source_hash)
+        :type source_hash: str
+        '''
+        self.name = name
+        self.source_hash = source_hash
+        #: the value of the unit (None until it has been run)
+        self.value = None
+        #: the global bindings the unit made, or changed (name -> value)
+        self.exports = dict()
+        #: False while the unit is being run
+        self.loaded = False
+
+    def __repr__(self):
+        return '<Module %s%s>' % (self.name,
+                                  '' if self.loaded else ' (loading)')
+
+
+class ModuleRegistry(dict):
+    '''
+    The units loaded by an interpreter (unit name -> Module).
+    '''
+
+    def run(self, name, source_hash, bindings, run):
+        '''
+        Run a unit, recording it as a module.  While the unit is running, it
+        is recorded as loading, so that a unit that loads itself (directly
+        or not) isn't run again.  If the unit fails, it is forgotten.
+
+        :param name: the name of the unit
+        :type name: str
+        :param source_hash: the hash of the unit's text
+        :type source_hash: str
+        :param bindings: returns the global bindings that the unit is run
+                         against, as a copy of those made in the scope itself
+                         and the shared bindings under them (see
+                         Engine.global_layers).  They are compared before and
+                         after the unit runs, to find its exports.
+        :type bindings: () -> (dict, Mapping)
+        :param run: runs the unit, returning its value
+        :type run: () -> any
+        :return: the module
+        :rtype: Module
+        '''
+        module = Module(name, source_hash)
+        before, shared = bindings()
+        self[name] = module
+        try:
+            module.value = run()
+        except BaseException:
+            if self.get(name) is module:
+                del self[name]
+            raise
+        # only the scope's own bindings can have changed
+        after, shared = bindings()
+        module.exports = {k: v for (k, v) in after.items()
+                          if before.get(k, shared.get(k, _MISSING)) is not v}
+        module.loaded = True
+        return module
@@ -0,0 +1,471 @@
+'''
+Optimizer pass.
+
+Works out, before a unit is compiled, the parts of it whose values are known
+ahead of time:
+
+    * a call to a pure builtin (see builtins.pure_builtins) whose arguments
+      are all constants is replaced by its value, so (+ 1 (* 2 3)) becomes 7.
+    * an if whose condition is a constant is replaced by the branch it
+      takes.
+    * a begin whose leading arguments are all constants is replaced by its
+      last argument.
+    * a while whose condition is a false constant is replaced by None (its
+      value).
+
+The remaining calls to the builtins that control how their arguments are
+evaluated (see builtins.special_forms) become datatypes.SpecialForms, which
+the engines carry out themselves.
+
+Only names that the unit never binds (with set, defun or as a parameter)
+are taken to be the builtins.  Even so, another unit, or the bindings a
+unit is run with (see snapshot.Snapshot), may bind them to something else.
+So a call is not replaced outright: it becomes a datatypes.Folded (or a
+SpecialForm), which checks that the names are still bound to the builtins
+before it takes the short cut, and evaluates the call as written if they
+aren't.
+
+Then, small functions are inlined: a call to a function defined with defun
+is replaced by the function's body, with the arguments in place of the
+parameters, and folded again.  A function is inlined if:
+
+    * it is defined outside any function, and its name is bound nowhere
+      else in the unit.
+    * its body is a single expression of at most INLINE_SIZE datums, that
+      calls nothing but builtins (so it isn't recursive), binds nothing,
+      and uses no names bound inside functions other than its parameters
+      (so the names mean the same at the call).
+
+and a call to it is inlined if each of its arguments is a constant or a
+parameter of the function the call is in.  Reading one of those has no
+effects and gives the same value each time, so the body gives the same
+value however arguments are passed (see scope.ARG_MODES).  The call
+becomes a datatypes.Inlined, which checks that the name is still bound to a
+function made from the definition, and the builtins the body calls are
+still bound to the builtins, before it evaluates the body.  The inlined call
+still counts as a call towards the run's budget.  Calls aren't inlined while
+a run is sampled (see sampler.py) or profiled (see profiler.py), so that the
+function shows up in the samples, and its calls are recorded.
+
+Each engine evaluates a Folded, an Inlined or a SpecialForm in its own way,
+but gets the same value as it would from the call.  Units run by the tree
+engine aren't optimized (see engine.Engine.optimize), though the nodes can
+still be evaluated by it.
+'''
+
+from collections import Counter
+
+from .datatypes import StaticDatum, VarRef, Set, FunctionDef, FunctionCall, \
+    ExprSeq, List, Folded, Inlined, SpecialForm
+from .frame import Value
+from ..builtins import global_builtins, pure_builtins, strict_builtins, \
+    special_forms
+from ..builtins.builtins import ifBuiltin, beginBuiltin, whileBuiltin
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The largest function body (in datums) that is inlined
+INLINE_SIZE = 16
+
+
+def optimize(datum):
+    '''
+    Fold the parts of datum whose values are known ahead of time, inline
+    calls to small functions, and mark the special forms.
+
+    The tree is walked with an explicit stack, so deeply nested units don't
+    run into Python's recursion limit.  Parts that can't be optimized, and
+    contain nothing that can, are kept as they are.
+
+    :param datum: the datum to optimize (usually a whole unit)
+    :type datum: datatypes.Datum
+    :return: the optimized datum
+    :rtype: datatypes.Datum
+    '''
+    bound, local = _bound_names(datum)
+    builtins = dict((name, builtin)
+                    for (name, builtin) in global_builtins.items()
+                    if name not in bound)
+    datum = _transform(datum, lambda d, children, new:
+                       _rebuild(d, children, new, builtins))
+    datum = _transform(datum, lambda d, children, new:
+                       _special(d, children, new, builtins))
+    # (the functions that are inlined aren't rebuilt after this)
+    functions = _inline_candidates(datum, bound, local, builtins)
+    if functions:
+        datum = _inline(datum, functions, builtins)
+    return datum
+
+
+def _bound_names(datum):
+    '''
+    :return: the number of times each name is bound within datum, and the
+             names that are bound inside functions (including parameters)
+    :rtype: (Counter, set[str])
+    '''
+    bound = Counter()
+    local = set()
+    todo = [(datum, False)]
+    seen = set()
+    while todo:
+        datum, in_function = todo.pop()
+        if datum in seen:
+            continue
+        seen.add(datum)
+        t = type(datum)
+        if t is Set:
+            bound[datum.name.value] += 1
+            if in_function:
+                local.add(datum.name.value)
+        elif t is FunctionDef:
+            bound[datum.name.value] += 1
+            if in_function:
+                local.add(datum.name.value)
+            bound.update(a.value for a in datum.args)
+            local.update(a.value for a in datum.args)
+            todo.append((datum.body, True))
+            continue
+        todo.extend((c, in_function) for c in _children(datum))
+    return bound, local
+
+
+def _children(datum):
+    t = type(datum)
+    if t is Set:
+        return [datum.value_expr]
+    elif t is FunctionDef:
+        return [datum.body]
+    elif t is FunctionCall:
+        return datum.arg_exprs
+    elif t is ExprSeq or t is List:
+        return datum.items
+    elif t is Folded:
+        return [datum.fast, datum.slow]
+    elif t is Inlined:
+        return [datum.body, datum.call]
+    elif t is SpecialForm:
+        return [datum.call]
+    return []
+
+
+def _transform(datum, rebuild):
+    '''
+    Rebuild a tree from the bottom up.  A datum that is in the tree more
+    than once (in the fast and the slow form of a Folded) is rebuilt once.
+
+    :param rebuild: makes the new version of a datum, from the datum, its
+                    children and their new versions
+    :type rebuild: (Datum, list[Datum], list[Datum]) -> Datum
+    :return: the new version of datum
+    :rtype: datatypes.Datum
+    '''
+    # (datum, True if its children have been rebuilt), and the rebuilt
+    # datums that have not yet been used by their parent.
+    todo = [(datum, False)]
+    built = []
+    done = dict()
+    while todo:
+        datum, ready = todo.pop()
+        if datum in done:
+            built.append(done[datum])
+            continue
+        children = _children(datum)
+        if not ready:
+            todo.append((datum, True))
+            todo.extend((c, False) for c in reversed(children))
+            continue
+        if children:
+            new = built[-len(children):]
+            del built[-len(children):]
+        else:
+            new = []
+        built.append(rebuild(datum, children, new))
+        done[datum] = built[-1]
+    return built[0]
+
+
+def _rebuild(datum, children, new, builtins):
+    '''
+    :param children: the children of datum
+    :param new: the children, optimized
+    :param builtins: the builtins that may be folded (name -> builtin)
+    :type builtins: dict[str,function]
+    :return: datum, with its children optimized, and folded if it can be
+    '''
+    t = type(datum)
+    if all(n is c for (n, c) in zip(new, children)):
+        pass
+    elif t is Set:
+        datum = Set(datum.pos, datum.name, new[0])
+    elif t is FunctionDef:
+        datum = FunctionDef(datum.pos, datum.name, datum.args, new[0])
+    elif t is FunctionCall:
+        datum = FunctionCall(datum.pos, datum.name, new)
+    elif t is Folded:
+        fast, slow = new
+        guards = datum.guards
+        if type(fast) is Folded:
+            guards = _unique(guards + fast.guards)
+            fast = fast.fast
+        datum = Folded(datum.pos, guards, fast, slow)
+    elif t is Inlined:
+        datum = Inlined(datum.pos, datum.func, datum.guards, new[0], new[1])
+    elif t is SpecialForm:
+        if type(new[0]) is not FunctionCall:
+            # the call has been folded (in an inlined body)
+            return new[0]
+        datum = SpecialForm(datum.pos, datum.builtin, new[0])
+    else:
+        datum = t(datum.pos, new)
+    if t is not FunctionCall:
+        return datum
+    builtin = builtins.get(datum.name.value)
+    if builtin is None:
+        return datum
+    fold = _FOLDERS.get(builtin, _fold_pure if builtin in pure_builtins
+                        else None)
+    if fold is None:
+        return datum
+    # the datums whose values the result depends on
+    used = fold(datum, builtin)
+    if used is None:
+        return datum
+    fast, args = used
+    guards = [(VarRef(datum.pos, datum.name), builtin)]
+    for a in args:
+        if type(a) is Folded:
+            guards.extend(a.guards)
+    if type(fast) is Folded:
+        # its guards are among those of the arguments
+        fast = fast.fast
+    return Folded(datum.pos, _unique(guards), fast, datum)
+
+
+def _unique(guards):
+    '''
+    :return: the guards, without those for names already guarded
+    :rtype: tuple
+    '''
+    seen = set()
+    unique = []
+    for (ref, b) in guards:
+        if ref.name.value not in seen:
+            seen.add(ref.name.value)
+            unique.append((ref, b))
+    return tuple(unique)
+
+
+def _inline_candidates(datum, bound, local, builtins):
+    '''
+    :return: the functions that may be inlined (name -> FunctionDef)
+    :rtype: dict[str,FunctionDef]
+    '''
+    functions = dict()
+    todo = [datum]
+    seen = set()
+    while todo:
+        datum = todo.pop()
+        if datum in seen:
+            continue
+        seen.add(datum)
+        if type(datum) is FunctionDef:
+            # functions defined inside functions aren't inlined
+            if (bound[datum.name.value] == 1 and
+                    _inline_body(datum, local, builtins) is not None):
+                functions[datum.name.value] = datum
+            continue
+        todo.extend(_children(datum))
+    return functions
+
+
+def _inline_body(func, local, builtins):
+    '''
+    :param func: a function definition
+    :type func: FunctionDef
+    :return: the expression that calls to func may be replaced with, or None
+             if they can't be
+    :rtype: datatypes.Datum or None
+    '''
+    body = func.body
+    if type(body) is ExprSeq:
+        if len(body.items) != 1:
+            return None
+        body, = body.items
+    params = set(a.value for a in func.args)
+    size = 0
+    todo = [body]
+    while todo:
+        datum = todo.pop()
+        size += 1
+        if size > INLINE_SIZE:
+            return None
+        t = type(datum)
+        if t is VarRef:
+            name = datum.name.value
+            if name in local and name not in params:
+                return None
+        elif t is FunctionCall:
+            if datum.name.value not in builtins:
+                return None
+        elif (t is not StaticDatum and t is not List and t is not Folded and
+              t is not SpecialForm):
+            return None
+        todo.extend(_children(datum))
+    return body
+
+
+def _inline(datum, functions, builtins):
+    '''
+    Inline the calls to functions within datum.
+
+    :param functions: the functions that may be inlined (name ->
+                      FunctionDef)
+    :type functions: dict[str,FunctionDef]
+    :rtype: datatypes.Datum
+    '''
+    # the parameters of the function that each call is in
+    params = dict()
+    todo = [(datum, frozenset())]
+    seen = set()
+    while todo:
+        d, names = todo.pop()
+        if d in seen:
+            continue
+        seen.add(d)
+        t = type(d)
+        if t is FunctionDef:
+            names = frozenset(a.value for a in d.args)
+        elif t is FunctionCall and d.name.value in functions:
+            params[d] = names
+        todo.extend((c, names) for c in _children(d))
+
+    def rebuild(d, children, new):
+        call = _rebuild(d, children, new, {})
+        if type(d) is not FunctionCall or d.name.value not in functions:
+            return call
+        func = functions[d.name.value]
+        args = call.arg_exprs
+        if len(args) != len(func.args):
+            return call
+        for a in args:
+            t = type(a)
+            if not (t is StaticDatum or
+                    (t is VarRef and a.name.value in params[d])):
+                return call
+        return _inline_call(call, func, builtins)
+    return _transform(datum, rebuild)
+
+
+def _inline_call(call, func, builtins):
+    '''
+    :return: call, inlined
+    :rtype: Inlined
+    '''
+    body = _inline_body(func, (), builtins)
+    args = dict((p.value, a) for (p, a) in zip(func.args, call.arg_exprs))
+
+    def substitute(d, children, new):
+        if type(d) is VarRef and d.name.value in args:
+            return args[d.name.value]
+        return _rebuild(d, children, new, builtins)
+    guards = []
+    todo = [body]
+    while todo:
+        d = todo.pop()
+        if type(d) is FunctionCall:
+            guards.append((VarRef(call.pos, d.name),
+                           builtins[d.name.value]))
+        todo.extend(_children(d))
+    return Inlined(call.pos, func, _unique(guards),
+                   _transform(body, substitute), call)
+
+
+# the numbers of arguments the special forms can be called with, for those
+# that can't be called with any number (builtin -> nargs -> bool)
+_FORM_ARITIES = {
+    ifBuiltin: lambda nargs: nargs == 3,
+    whileBuiltin: lambda nargs: nargs >= 1,
+}
+
+
+def _special(datum, children, new, builtins):
+    '''
+    :return: datum, with its children rebuilt, as a SpecialForm if it is a
+             call to one
+    '''
+    datum = _rebuild(datum, children, new, {})
+    if type(datum) is not FunctionCall:
+        return datum
+    builtin = builtins.get(datum.name.value)
+    if builtin not in special_forms:
+        return datum
+    arity = _FORM_ARITIES.get(builtin)
+    if arity is not None and not arity(len(datum.arg_exprs)):
+        return datum
+    return SpecialForm(datum.pos, builtin, datum)
+
+
+def _constant(datum):
+    '''
+    :return: True if datum is a constant, or is folded to one
+    :rtype: bool
+    '''
+    t = type(datum)
+    return t is StaticDatum or (t is Folded and
+                                type(datum.fast) is StaticDatum)
+
+
+def _constant_value(datum):
+    if type(datum) is Folded:
+        return datum.fast.value
+    return datum.value
+
+
+# Each of these takes a call to a builtin (whose arguments have been
+# optimized) and the builtin.  It returns None if the call can't be folded.
+# Otherwise, it returns what the call is folded to, and the arguments whose
+# values that depends on.
+
+def _fold_pure(datum, builtin):
+    args = datum.arg_exprs
+    if not args or not all(_constant(a) for a in args):
+        return None
+    values = [_constant_value(a) for a in args]
+    if builtin not in strict_builtins:
+        values = [Value(v) for v in values]
+    try:
+        value = builtin(None, *values)
+    except Exception:
+        # (/ 1 0), for instance: leave it to fail when it runs
+        return None
+    return StaticDatum(datum.pos, value), args
+
+
+def _fold_if(datum, builtin):
+    args = datum.arg_exprs
+    if len(args) != 3 or not _constant(args[0]):
+        return None
+    if _constant_value(args[0]):
+        return args[1], args[:2]
+    return args[2], (args[0], args[2])
+
+
+def _fold_begin(datum, builtin):
+    args = datum.arg_exprs
+    if not args or not all(_constant(a) for a in args[:-1]):
+        return None
+    return args[-1], args
+
+
+def _fold_while(datum, builtin):
+    args = datum.arg_exprs
+    if not args or not _constant(args[0]) or _constant_value(args[0]):
+        return None
+    return StaticDatum(datum.pos, None), args[:1]
+
+
+_FOLDERS = {
+    ifBuiltin: _fold_if,
+    beginBuiltin: _fold_begin,
+    whileBuiltin: _fold_while,
+}
@@ -0,0 +1,323 @@
+'''
+A function profiler for LisPy code.
+
+With Interpreter(profile=True), every call of a function defined in LisPy,
+every call of a builtin (other than the special forms), and every unit that
+is run is timed.  The results
+are kept by the interpreter's Profiler, keyed by the name of the function
+and the position of its definition (builtins are at __BUILTINS__:0:0, and
+units are named <unit>), so hot code can be traced back to the source.
+cProfile, in contrast, only sees the engines' evaluate and __call__ methods.
+
+Each engine records the calls of LisPy functions on its own call and return
+paths, so profiling doesn't change how deep code can recurse.  A function
+that makes a tail call is recorded as returning when it makes it, as it is
+no longer on the engine's stack (except in the tree engine, which doesn't
+eliminate tail calls).  Calls that the optimizer inlined are made as
+written.  The builtins of a profiled run are wrapped (see Profiler.wrap),
+except for the special forms (if, while, begin, and and or), which aren't
+recorded: the engines carry those out themselves.  As the other builtins
+are wrapped, the engines call them rather than work out arithmetic inline.
+Profiled code runs more slowly: compare the times with each other, rather
+than with unprofiled runs.
+
+The results can be printed as a table (see Profiler.print_stats), or read
+by the standard library's pstats module: pstats.Stats(profiler) takes them
+directly, and Profiler.dump_stats writes them to a file in the same format
+as cProfile.
+'''
+import marshal
+import sys
+import threading
+import time
+from types import FunctionType
+
+from .scope import __BUILTIN_POS__
+from ..builtins import strict_builtins, special_forms
+from ..common import TokenPos
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The name given to units in profiles
+UNIT_NAME = '<unit>'
+
+#: The columns a profile can be sorted by (see Profiler.print_stats)
+SORT_KEYS = ('calls', 'tottime', 'cumtime', 'name')
+
+# sort key -> the column of a row of the table (see Profiler.print_stats)
+_COLUMNS = {'calls': 1, 'tottime': 3, 'cumtime': 4}
+
+
+class FunctionStats(object):
+    '''
+    What the profiler has recorded for one function.
+    '''
+    __slots__ = ('calls', 'primitive_calls', 'tottime', 'cumtime',
+                 'callers')
+
+    def __init__(self):
+        #: the number of calls
+        self.calls = 0
+        #: the number of calls that weren't made (directly or not) by the
+        #: function itself
+        self.primitive_calls = 0
+        #: the time spent in the function itself, in seconds, not counting
+        #: the functions it called
+        self.tottime = 0.0
+        #: the time spent in the function, in seconds, counting the
+        #: functions it called.  Recursive calls aren't counted twice.
+        self.cumtime = 0.0
+        #: the same, for the calls made by each caller (key of the caller ->
+        #: [calls, primitive_calls, tottime, cumtime])
+        self.callers = dict()
+
+
+class ProfiledFunction(object):
+    '''
+    A function (or builtin) that records each of its calls in a profiler.
+    It is called like the function: a wrapped strict builtin is strict too
+    (see strict), and is called with the values of the arguments.
+    '''
+    __slots__ = ('func', 'key', 'profiler', 'strict')
+
+    def __init__(self, func, key, profiler):
+        '''
+        :param func: the function
+        :param key: the name of the function, and the position of its
+                    definition
+        :type key: (str, TokenPos)
+        :param profiler: the profiler that records the calls
+        :type profiler: Profiler
+        '''
+        self.func = func
+        self.key = key
+        self.profiler = profiler
+        #: True if func is a strict builtin
+        self.strict = type(func) is FunctionType and func in strict_builtins
+
+    def __call__(self, parent_scope, *args):
+        return self.profiler.call(self.key, self.func, parent_scope, args)
+
+    @property
+    def pos(self):
+        return self.key[1]
+
+    def __repr__(self):
+        return '<profiled %s at %s>' % self.key
+
+
+class Profiler(object):
+    '''
+    Records the calls made by the runs of an interpreter.  Runs in any
+    number of threads can be profiled at once.
+    '''
+
+    def __init__(self, clock=time.perf_counter):
+        '''
+        :param clock: returns the time, in seconds
+        :type clock: () -> float
+        '''
+        self.clock = clock
+        #: what has been recorded for each function (key -> FunctionStats).
+        #: A key is the name of the function and the position of its
+        #: definition.
+        self.functions = dict()
+        self._lock = threading.Lock()
+        # the calls going on in each thread
+        self._local = threading.local()
+        #: the results in the form used by pstats, after create_stats
+        self.stats = dict()
+
+    def wrap(self, func, name, pos):
+        '''
+        :param func: a function, or builtin
+        :param name: the name of the function
+        :type name: str
+        :param pos: the position of the function's definition
+        :type pos: TokenPos
+        :return: a function that records each of its calls and calls func
+        :rtype: ProfiledFunction
+        '''
+        return ProfiledFunction(func, (name, pos), self)
+
+    def wrap_bindings(self, bindings):
+        '''
+        :param bindings: global bindings (name -> value)
+        :type bindings: Mapping
+        :return: the same bindings, with the builtins other than the special
+                 forms wrapped.  The engines record the calls of LisPy
+                 functions themselves.
+        :rtype: dict
+        '''
+        wrapped = dict()
+        for (name, value) in bindings.items():
+            if type(value) is FunctionType and value not in special_forms:
+                value = self.wrap(value, name, __BUILTIN_POS__)
+            wrapped[name] = value
+        return wrapped
+
+    def call(self, key, func, parent_scope, args):
+        '''
+        Call a function, and record the call.
+
+        :param key: the name of the function, and the position of its
+                    definition
+        :type key: (str, TokenPos)
+        :return: func(parent_scope, *args)
+        '''
+        entry = self.enter(key)
+        try:
+            return func(parent_scope, *args)
+        finally:
+            self.leave(entry)
+
+    def enter(self, key):
+        '''
+        Record the start of a call.  The engines call this, and leave, on
+        their own call and return paths.
+
+        :param key: the name of the function, and the position of its
+                    definition
+        :type key: (str, TokenPos)
+        :return: the call, to pass to leave when it returns
+        :rtype: list
+        '''
+        local = self._local
+        calls = getattr(local, 'calls', None)
+        if calls is None:
+            # the calls going on: [key, time spent in callees, caller,
+            # number of calls of the function going on around it, start]
+            calls = local.calls = []
+            # the number of calls of each function going on
+            local.depths = dict()
+        depths = local.depths
+        depth = depths.get(key, 0)
+        depths[key] = depth + 1
+        entry = [key, 0.0, calls[-1][0] if calls else None, depth, 0.0]
+        calls.append(entry)
+        entry[4] = self.clock()
+        return entry
+
+    def leave(self, entry):
+        '''
+        Record the end of a call.  The calls made within it that are still
+        going on end with it: an exception may have left them, in an
+        engine that doesn't keep its calls on Python's stack.
+
+        :param entry: what enter returned for the call
+        :type entry: list
+        '''
+        now = self.clock()
+        local = self._local
+        calls = local.calls
+        depths = local.depths
+        while True:
+            e = calls.pop()
+            (key, inner, caller, depth, start) = e
+            elapsed = now - start
+            if calls:
+                calls[-1][1] += elapsed
+            depths[key] = depth
+            self._record(key, caller, elapsed, elapsed - inner, depth == 0)
+            if e is entry:
+                return
+
+    def _record(self, key, caller, elapsed, own, primitive):
+        with self._lock:
+            stats = self.functions.get(key)
+            if stats is None:
+                stats = self.functions[key] = FunctionStats()
+            stats.calls += 1
+            stats.tottime += own
+            if primitive:
+                stats.primitive_calls += 1
+                stats.cumtime += elapsed
+            if caller is not None:
+                c = stats.callers.get(caller)
+                if c is None:
+                    c = stats.callers[caller] = [0, 0, 0.0, 0.0]
+                c[0] += 1
+                c[2] += own
+                if primitive:
+                    c[1] += 1
+                    c[3] += elapsed
+
+    def clear(self):
+        '''
+        Forget what has been recorded.
+        '''
+        with self._lock:
+            self.functions = dict()
+            self.stats = dict()
+
+    def create_stats(self):
+        '''
+        Convert the results to the form used by pstats (and cProfile), in
+        stats.  Functions are identified by (unit name, line, name).
+        '''
+        with self._lock:
+            self.stats = {
+                _pstats_key(key): (
+                    s.primitive_calls, s.calls, s.tottime, s.cumtime,
+                    {_pstats_key(k): (c[0], c[1], c[2], c[3])
+                     for (k, c) in s.callers.items()})
+                for (key, s) in self.functions.items()}
+
+    def dump_stats(self, filename):
+        '''
+        Write the results to a file that pstats can read.
+
+        :param filename: the name of the file
+        :type filename: str
+        '''
+        self.create_stats()
+        with open(filename, 'wb') as f:
+            marshal.dump(self.stats, f)
+
+    def print_stats(self, sort='cumtime', limit=None, file=None):
+        '''
+        Print the results as a table, a function to a line.
+
+        :param sort: the column to sort by, in descending order (one of
+                     SORT_KEYS; 'name' sorts in ascending order)
+        :type sort: str
+        :param limit: the number of functions to print, or None for all
+        :type limit: int or None
+        :param file: where to print (default: sys.stdout)
+        :type file: io.TextIOBase or None
+        '''
+        if sort not in SORT_KEYS:
+            raise ValueError('Unknown sort key "%s".  Choose one of: %s' %
+                             (sort, ', '.join(SORT_KEYS)))
+        with self._lock:
+            rows = [(key, s.calls, s.primitive_calls, s.tottime, s.cumtime)
+                    for (key, s) in self.functions.items()]
+        if sort == 'name':
+            rows.sort(key=lambda r: (r[0][0], tuple(r[0][1])))
+        else:
+            column = _COLUMNS[sort]
+            rows.sort(key=lambda r: r[column], reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        file = sys.stdout if file is None else file
+        print('%12s %10s %10s  %s' % ('ncalls', 'tottime', 'cumtime',
+                                      'function (position)'), file=file)
+        for (key, calls, primitive, tottime, cumtime) in rows:
+            ncalls = (str(calls) if calls == primitive
+                      else '%d/%d' % (calls, primitive))
+            print('%12s %10.6f %10.6f  %s (%s)' % (ncalls, tottime, cumtime,
+                                                   key[0], key[1]),
+                  file=file)
+
+
+def unit_key(unit_name):
+    '''
+    :return: the key that a unit's runs are recorded under
+    :rtype: (str, TokenPos)
+    '''
+    return (UNIT_NAME, TokenPos(unit_name, 1, 1))
+
+
+def _pstats_key(key):
+    name, pos = key
+    return (pos.unit_name, pos.line, name)
@@ -0,0 +1,252 @@
+'''
+Resolver pass.
+
+Works out, before a unit runs, where every variable lives, so that compiled
+code can fetch a local by (depth, slot) instead of searching scopes by name:
+
+    * every function call gets one Frame, holding the parameters followed
+      by the names that the body binds with set or defun.
+    * an ExprSeq that is not a function body gets a Frame only if it binds
+      names.  One that defines nothing shares its enclosing frame.
+    * any other name is global.
+
+Names are resolved lexically: a function body sees its own frame, the frames
+of the functions and blocks it is written inside, and the globals.  The
+tree-walking engine resolves names through the caller's scopes instead.  The
+two agree as long as a function only uses names that are its own, global,
+or bound by an enclosing function that is also its caller.
+
+Binding follows the usual set rules.  set updates the closest existing
+binding, and creates one in the innermost frame if there is none.  Since a
+local slot may not have been assigned yet, a reference carries every
+candidate slot, from the innermost outward, and the globals are searched if
+none of them is bound.
+'''
+
+from collections import namedtuple
+
+from .datatypes import StaticDatum, VarRef, Set, FunctionDef, FunctionCall, \
+    ExprSeq, List, Folded, Inlined, SpecialForm
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+'''
+A slot address.
+
+Attributes:
+    depth: number of frames to go up from the current frame (0 = current)
+    slot: index of the value within that frame
+'''
+Address = namedtuple('Address', 'depth slot')
+
+'''
+The resolved form of a name used by a VarRef, Set, FunctionDef or
+FunctionCall.
+
+Attributes:
+    name: the identifier (a Syn with type ID)
+    chain: tuple of Address, innermost first, of the slots that may hold the
+        name.  Empty if the name is global.
+    bound: True if the last address in the chain is a parameter, which is
+        always bound, so the globals never need to be searched.
+'''
+Ref = namedtuple('Ref', 'name chain bound')
+
+
+class Block(object):
+    '''
+    The names bound by one Frame.
+    '''
+
+    def __init__(self, parent, params=()):
+        '''
+        :param parent: the enclosing block, or None at the top level
+        :type parent: Block or None
+        :param params: names of the function parameters, if any
+        :type params: list[str]
+        '''
+        self.parent = parent
+        self.names = []
+        self.slots = dict()
+        for p in params:
+            self.declare(p)
+        self.nparams = len(self.names)
+        #: True if a function defined inside this block (which keeps a
+        #: reference to the frame) may outlive a call
+        self.captured = False
+
+    def declare(self, name):
+        '''
+        Give name a slot in this block, if it doesn't have one.
+        '''
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+
+    @property
+    def nlocals(self):
+        '''
+        :return: the number of slots that are not parameters
+        :rtype: int
+        '''
+        return len(self.names) - self.nparams
+
+
+class Resolution(object):
+    '''
+    The result of resolving a unit: a Ref for every node that uses a name and
+    a Block for every FunctionDef and ExprSeq.
+    '''
+
+    def __init__(self):
+        self._refs = dict()
+        self._blocks = dict()
+        #: the names bound with set or defun anywhere in the unit.  A
+        #: parameter whose name isn't among them keeps the value it was
+        #: called with.
+        self.assigned = set()
+
+    def ref(self, datum):
+        '''
+        :param datum: a VarRef, Set, FunctionDef or FunctionCall
+        :return: the resolved name used by datum
+        :rtype: Ref
+        '''
+        return self._refs[datum]
+
+    def block(self, datum):
+        '''
+        :param datum: a FunctionDef or ExprSeq
+        :return: the block for the frame that datum creates, or None if it
+                 creates no frame
+        :rtype: Block or None
+        '''
+        return self._blocks[datum]
+
+
+def resolve(datum):
+    '''
+    Resolve all the names used within datum, which is evaluated at the top
+    level.
+
+    The tree is walked with an explicit stack, so deeply nested units don't
+    run into Python's recursion limit.
+
+    :param datum: the datum to resolve (usually a whole unit)
+    :type datum: datatypes.Datum
+    :rtype: Resolution
+    '''
+    res = Resolution()
+    todo = [(datum, None)]
+    while todo:
+        datum, block = todo.pop()
+        t = type(datum)
+        if t is VarRef:
+            res._refs[datum] = _lookup(datum.name, block)
+        elif t is Set:
+            res._refs[datum] = _lookup(datum.name, block)
+            res.assigned.add(datum.name.value)
+            todo.append((datum.value_expr, block))
+        elif t is FunctionCall:
+            res._refs[datum] = _lookup(datum.name, block)
+            todo.extend((a, block) for a in datum.arg_exprs)
+        elif t is FunctionDef:
+            res._refs[datum] = _lookup(datum.name, block)
+            res.assigned.add(datum.name.value)
+            outer = block
+            while outer is not None:
+                outer.captured = True
+                outer = outer.parent
+            fblock = Block(block, [a.value for a in datum.args])
+            items = _body_items(datum.body)
+            for n in _targets(items):
+                fblock.declare(n)
+            res._blocks[datum] = fblock
+            todo.extend((i, fblock) for i in items)
+        elif t is ExprSeq:
+            names = _targets(datum.items)
+            if names:
+                block = Block(block)
+                for n in names:
+                    block.declare(n)
+                res._blocks[datum] = block
+            else:
+                res._blocks[datum] = None
+            todo.extend((i, block) for i in datum.items)
+        elif t is List:
+            todo.extend((i, block) for i in datum.items)
+        elif t is Folded:
+            # the folded form is made of parts of the call (see optimizer.py)
+            todo.extend((ref, block) for (ref, builtin) in datum.guards)
+            todo.append((datum.slow, block))
+        elif t is Inlined:
+            todo.extend((ref, block) for (ref, builtin) in datum.guards)
+            todo.append((datum.body, block))
+            todo.append((datum.call, block))
+        elif t is SpecialForm:
+            todo.append((datum.call, block))
+    return res
+
+
+def _lookup(name, block):
+    '''
+    :param name: the identifier to look up
+    :type name: Syn
+    :param block: the innermost block where name is used
+    :type block: Block or None
+    :rtype: Ref
+    '''
+    chain = []
+    depth = 0
+    while block is not None:
+        slot = block.slots.get(name.value)
+        if slot is not None:
+            chain.append(Address(depth, slot))
+            if slot < block.nparams:
+                return Ref(name, tuple(chain), True)
+        block = block.parent
+        depth += 1
+    return Ref(name, tuple(chain), False)
+
+
+def _targets(items):
+    '''
+    :param items: the expressions evaluated in a frame
+    :type items: list[datatypes.Datum]
+    :return: the names that the items bind with set or defun, in order, not
+             counting those bound inside function bodies or nested ExprSeqs
+             (which have frames of their own).
+    :rtype: list[str]
+    '''
+    out = []
+    todo = list(reversed(items))
+    while todo:
+        datum = todo.pop()
+        t = type(datum)
+        if t is Set:
+            out.append(datum.name.value)
+            todo.append(datum.value_expr)
+        elif t is FunctionDef:
+            out.append(datum.name.value)
+        elif t is FunctionCall:
+            todo.extend(reversed(datum.arg_exprs))
+        elif t is List:
+            todo.extend(reversed(datum.items))
+        elif t is Folded:
+            todo.append(datum.slow)
+        elif t is Inlined:
+            # the body binds nothing
+            todo.append(datum.call)
+        elif t is SpecialForm:
+            todo.append(datum.call)
+    return out
+
+
+def _body_items(body):
+    '''
+    :return: the items of a function body.  The body of a FunctionDef is an
+             ExprSeq, which shares the function's frame.
+    '''
+    if type(body) is ExprSeq:
+        return body.items
+    return [body]
@@ -0,0 +1,206 @@
+'''
+A sampling profiler for LisPy code.
+
+With Interpreter(sample_interval=...), a thread wakes up every interval
+while units run, and has each running unit take a sample of its LisPy call
+stack: the functions (and units) that are running, named by the name and
+the position of their definition, as in profiler.Profiler.  The samples can
+be written in the collapsed stack format read by flame graph tools (see
+Sampler.write_collapsed), for instance:
+
+    <unit> (main:1:1);fib (fib:2:18);fib (fib:2:18) 12
+
+Unlike profiler.Profiler, sampling costs nothing between samples, so long
+runs can be sampled.  A run doesn't stop where it is to be sampled: the
+sampler takes the run's fuel away (see budget.Meter.preempt), and the run
+takes the sample at its next step, where it checks its budget anyway.  Time
+spent between steps (in a long running builtin, say) is put down to the
+stack at the next step.
+
+Each engine keeps its call stack in its own way: in Python frames (tree and
+closure), in a stack of tasks (stack), or in a stack of activations (vm).
+A sample is read from the Python frames of the thread that takes it, and
+from the locals of the engine's loops in them, by handlers that each engine
+provides (see engine.Engine.frame_handlers).  As each engine eliminates
+tail calls (or not) in its own way, the stacks of the same code can differ
+between engines: a function that was left by a tail call isn't on the
+stack.  A function that is being called at a step is on the stack, unless
+it is being called in tail position.
+
+The interval can't usefully be shorter than sys.getswitchinterval(), as the
+sampler's thread has to wait for the GIL.
+'''
+import collections
+import contextlib
+import threading
+
+from .profiler import unit_key
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+#: The default sampling interval, in seconds
+DEFAULT_INTERVAL = 0.005
+
+
+class Sampler(object):
+    '''
+    Samples the LisPy call stacks of the runs of an interpreter.  Runs in
+    any number of threads can be sampled at once.
+    '''
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        '''
+        :param interval: the time between samples, in seconds
+        :type interval: float
+        '''
+        self.interval = interval
+        #: the number of samples of each stack (stack -> count).  A stack is
+        #: a tuple of the functions running, outermost first, each as its
+        #: name and the position of its definition.
+        self.samples = collections.Counter()
+        self._lock = threading.Lock()
+        # the meters of the runs going on (meter -> number of units running)
+        self._active = dict()
+        self._wakeup = threading.Condition()
+        self._thread = None
+
+    @contextlib.contextmanager
+    def track(self, meter):
+        '''
+        Sample a run while the block runs.  Blocks for the same run may
+        nest.
+
+        :param meter: the meter of the run (see budget.Meter)
+        :type meter: budget.Meter
+        '''
+        with self._wakeup:
+            meter.sampler = self
+            depth = self._active.get(meter, 0)
+            self._active[meter] = depth + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='lispy-sampler',
+                                                daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+        try:
+            yield
+        finally:
+            with self._wakeup:
+                if depth:
+                    self._active[meter] = depth
+                else:
+                    del self._active[meter]
+
+    def _run(self):
+        with self._wakeup:
+            while True:
+                if not self._active:
+                    self._wakeup.wait()
+                    continue
+                self._wakeup.wait(self.interval)
+                for meter in self._active:
+                    meter.preempt()
+
+    def sample(self, frame, count=1):
+        '''
+        Take a sample of the LisPy call stack.  Called by budget.Meter, in
+        the thread of the run.
+
+        :param frame: the Python frame of the engine that is taking a step
+        :type frame: frame
+        :param count: the number of intervals the sample stands for
+        :type count: int
+        '''
+        frames = []
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.f_back
+        handlers = _frame_handlers()
+        stack = SampleStack()
+        innermost = frames[0]
+        for frame in reversed(frames):
+            handler = handlers.get(frame.f_code)
+            if handler is not None:
+                handler(frame.f_locals, stack, frame is innermost)
+        with self._lock:
+            self.samples[tuple(stack.entries)] += count
+
+    def clear(self):
+        '''
+        Forget the samples that have been taken.
+        '''
+        with self._lock:
+            self.samples = collections.Counter()
+
+    def collapsed(self):
+        '''
+        :return: the samples in the collapsed stack format, a stack to a
+                 line, sorted
+        :rtype: list[str]
+        '''
+        with self._lock:
+            samples = list(self.samples.items())
+        lines = ['%s %d' % (';'.join('%s (%s)' % e for e in stack), count)
+                 for (stack, count) in samples if stack]
+        lines.sort()
+        return lines
+
+    def write_collapsed(self, file):
+        '''
+        Write the samples in the collapsed stack format (see collapsed).
+
+        :param file: the name of the file, or a file opened in text mode
+        :type file: str or io.TextIOBase
+        '''
+        if isinstance(file, str):
+            with open(file, 'w') as f:
+                self.write_collapsed(f)
+            return
+        for line in self.collapsed():
+            print(line, file=file)
+
+
+class SampleStack(object):
+    '''
+    A sample being taken: the entries (name, position of the definition)
+    found so far, outermost first.  The engines' frame handlers add to it
+    (see engine.Engine.frame_handlers).
+    '''
+    __slots__ = ('entries', 'top')
+
+    def __init__(self):
+        self.entries = []
+        # stack engine: the function and frame of the last task read
+        self.top = None
+
+    def push_def(self, datum):
+        self.entries.append((datum.name.value, datum.pos))
+
+    def push_code(self, code):
+        self.entries.append((code.name, code.pos))
+
+
+# Python code object -> (locals, SampleStack, innermost) -> None, that
+# reads the entries in a frame of the code
+_handlers = None
+
+
+def _frame_handlers():
+    global _handlers
+    if _handlers is None:
+        _handlers = _make_frame_handlers()
+    return _handlers
+
+
+def _make_frame_handlers():
+    from . import _Run, Interpreter
+    from .engine import ENGINES
+
+    def unit(local, s, innermost):
+        s.entries.append(unit_key(local['unit_name']))
+    handlers = {_Run.load_unit.__code__: unit,
+                Interpreter.run_stream.__code__: unit}
+    for engine in ENGINES.values():
+        handlers.update(engine.frame_handlers())
+    return handlers
@@ -1,13 +1,80 @@
-from collections import namedtuple
+from collections import namedtuple, ChainMap
 from .error import VarNameNotFoundError
+from .budget import Meter
 from ..common import TokenPos, Syn
 
 __author__ = 'Dan Bullok and Ben Lambeth'
 
+#: Ways of passing arguments to functions
+STRICT = 'strict'  # evaluate each argument once, before the call
+BY_NAME = 'name'  # evaluate an argument each time the function uses it
+BY_NEED = 'need'  # evaluate an argument the first time the function uses it
+ARG_MODES = (STRICT, BY_NAME, BY_NEED)
+
 ArgExpr = namedtuple('ArgExpr', 'parent_scope expr')
 ArgExpr.evaluate = lambda s: s.expr.evaluate(s.parent_scope)
 
 
+class MemoArgExpr(object):
+    '''
+    An argument that is evaluated the first time it is used.  The value is
+    remembered for later uses (call-by-need).
+    '''
+    __slots__ = ('parent_scope', 'expr', '_value')
+
+    def __init__(self, parent_scope, expr):
+        self.parent_scope = parent_scope
+        self.expr = expr
+
+    def evaluate(self):
+        if self.expr is not None:
+            self._value = self.expr.evaluate(self.parent_scope)
+            # the scope and expression aren't needed any more
+            self.expr = self.parent_scope = None
+        return self._value
+
+
+def make_arg(arg_mode, parent_scope, expr):
+    '''
+    Bind a function argument according to an argument passing mode.
+
+    :param arg_mode: one of ARG_MODES
+    :type arg_mode: str
+    :param parent_scope: the caller's scope
+    :type parent_scope: Scope
+    :param expr: the argument expression
+    :return: the definition to bind to the parameter
+    '''
+    if arg_mode == BY_NAME:
+        return ArgExpr(parent_scope, expr)
+    if arg_mode == BY_NEED:
+        return MemoArgExpr(parent_scope, expr)
+    return expr.evaluate(parent_scope)
+
+
+class Cell(object):
+    '''
+    The version of the global binding of a name, in one run.  Call sites
+    (see datatypes.FunctionCall) remember the function a name is bound to,
+    and the version of its cell, so that they can skip the search through
+    the scopes while the version stays the same.
+
+    The version changes each time the name is bound in the global scope.
+    Once the name has been bound in any other scope, a search may find that
+    binding instead, for as long as the scope lasts, so the version becomes
+    None for good, and the name is searched for on every call.
+    '''
+    __slots__ = ('version',)
+
+    def __init__(self, version):
+        '''
+        :param version: the version of the binding, or None if it can't be
+                        remembered
+        :type version: int or None
+        '''
+        self.version = version
+
+
 class Scope(object):
     '''
     Represents scope.  Contains definitions bound to identifiers.
@@ -24,6 +91,13 @@ class Scope(object):
         assert (parent is None) or isinstance(parent, Scope)
         self._defns = dict()
         self._parent = parent
+        #: how function calls made within this scope pass their arguments
+        self.arg_mode = BY_NAME if parent is None else parent.arg_mode
+        #: counts the work done by the run (see budget.Meter)
+        self.meter = Meter() if parent is None else parent.meter
+        #: the Cell of each global name whose binding may be remembered
+        #: (name -> Cell), shared by every scope of the run
+        self.cells = dict() if parent is None else parent.cells
 
     @property
     def parent(self):
@@ -34,6 +108,15 @@ class Scope(object):
         '''
         return self._parent
 
+    @property
+    def bindings(self):
+        '''
+        :return: the definitions bound in this scope itself (name ->
+                 definition)
+        :rtype: dict
+        '''
+        return self._defns
+
     def get(self, id):
         '''
         Retrieve the definition of an identifier.  Look in the local scope,
@@ -42,28 +125,77 @@ class Scope(object):
         :param id: identifier to look up.
         :type id: Syn (id.value must be a str)
         :return: the definition of the given identifier
-        :rtype: datatypes.Datum or ArgExpr
+        :rtype: datatypes.Datum or ArgExpr or MemoArgExpr
         :throws VarNameNotFoundError: if identifier is not found in this
         or any ancestor scope
         '''
         assert isinstance(id, Syn)
-        defn = None
-        if self._parent is not None:
-            if id.value in self._defns:
-                defn = self._defns[id.value]
-            else:
-                return self._parent.get(id)
-        else:
-            if id.value in self._defns:
-                defn = self._defns[id.value]
-            else:
-                raise VarNameNotFoundError(id.pos, id.value)
-        if isinstance(defn, ArgExpr):
+        scope = self.find(id.value)
+        if scope is None:
+            raise VarNameNotFoundError(id.pos, id.value)
+        defn = scope._defns[id.value]
+        if isinstance(defn, (ArgExpr, MemoArgExpr)):
             # handle lazy arg evaluation
-            return defn.expr.evaluate(defn.parent_scope)
+            return defn.evaluate()
         else:
             return defn
 
+    def lookup(self, id):
+        '''
+        Retrieve the definition of an identifier, as get does, and what a
+        call site needs to remember it.
+
+        :param id: identifier to look up.
+        :type id: Syn (id.value must be a str)
+        :return: the definition, and the cell of the name and its version if
+                 the definition is global and may be remembered (otherwise,
+                 None and None)
+        :rtype: (any, Cell or None, int or None)
+        :throws VarNameNotFoundError: if identifier is not found in this
+        or any ancestor scope
+        '''
+        name = id.value
+        scope = self.find(name)
+        if scope is None or scope._parent is not None:
+            return self.get(id), None, None
+        cell = self.cells.get(name)
+        if cell is None:
+            # never bound outside the global scope, or it would have a cell
+            cell = self.cells[name] = Cell(0)
+        return scope._defns[name], cell, cell.version
+
+    def _bind(self, scope, name, defn):
+        '''
+        Bind name to defn in scope (this scope or an ancestor), and update the
+        name's cell.
+        '''
+        scope._defns[name] = defn
+        cell = self.cells.get(name)
+        if scope._parent is None:
+            if cell is not None and cell.version is not None:
+                cell.version += 1
+        elif cell is None:
+            self.cells[name] = Cell(None)
+        elif cell.version is not None:
+            cell.version = None
+
+    def find(self, name):
+        '''
+        Find the scope that binds a name: this scope or the closest ancestor.
+
+        :param name: the name to look for
+        :type name: str
+        :return: the scope that binds name, or None if name is not bound in
+                 this scope or any ancestor scope
+        :rtype: Scope or None
+        '''
+        scope = self
+        while scope is not None:
+            if name in scope._defns:
+                return scope
+            scope = scope._parent
+        return None
+
     def assign(self, id, defn):
         '''
         Assign a definition to an identifier.
@@ -83,16 +215,10 @@ class Scope(object):
         assert (isinstance(id, Syn))
         assert (is_valid_defn(defn))
 
-        if id.value in self._defns:
-            self._defns[id.value] = defn
-            return
-        try:
-            dummy = self.get(id)
-        except VarNameNotFoundError as e:
-            self._defns[id.value] = defn
-        else:
-            # id has been defined in a parent.
-            self._parent.assign(id, defn)
+        scope = self.find(id.value)
+        if scope is None:
+            scope = self
+        self._bind(scope, id.value, defn)
 
     def create_local(self, id, defn):
         '''
@@ -111,7 +237,7 @@ class Scope(object):
             raise Exception(
                 "Can't create a variable that has already been defined: %s" %
                 id)
-        self._defns[id.value] = defn
+        self._bind(self, id.value, defn)
 
 
 '''
@@ -121,21 +247,25 @@ __BUILTIN_POS__ = TokenPos('__BUILTINS__', 0, 0)
 
 
 class GlobalScope(Scope):
-    '''A top level global Scope
+    '''A top level global Scope.  Its definitions are layered over a dict
+    of builtins (or a Snapshot's frozen bindings) that is shared, rather
+    than copied: definitions made in the scope go in a layer of its own.
     '''
 
-    def __init__(self, builtins, interpreter_builtins, interpreter):
+    def __init__(self, builtins, interpreter_builtins, interpreter,
+                 arg_mode=BY_NAME):
         '''
-        :param builtins:
+        :param builtins: the definitions the scope starts with.  The dict
+                         is never changed.
         :type builtins: dict[str,function]
+        :param arg_mode: how function arguments are passed (see ARG_MODES)
+        :type arg_mode: str
         :return:
         :rtype:
         '''
         super().__init__(__BUILTIN_POS__)
-        # a fake position
-        for id, f in builtins.items():
-            # create an ID to use for binding.
-            self.create_local(Syn('ID', id, __BUILTIN_POS__), f)
+        self.arg_mode = arg_mode
+        self._defns = ChainMap(dict(), builtins)
         for id, make_func in interpreter_builtins.items():
             # create an ID to use for binding.
             bulitin_func = make_func(interpreter)
@@ -176,7 +306,8 @@ class Datum(object):
         return str(self.value)
 
 
-VALID_DEFNS = (Datum, int, float, str, bool, complex, ArgExpr)
+VALID_DEFNS = (Datum, int, float, str, bool, complex, list, type(None),
+               ArgExpr, MemoArgExpr)
 
 
 def is_evaluatable(obj):
@@ -0,0 +1,58 @@
+'''
+Frozen global environments.
+
+Running a prelude (a unit that defines what other units use) before each of
+many small units repeats the same work every time.  Instead, the prelude can
+be run once, and a Snapshot taken of the global environment it leaves (see
+Interpreter.snapshot).  Each run started from the snapshot gets a global
+environment of its own, layered over the snapshot's frozen bindings: names
+are looked up in the snapshot until the run binds them itself, and the
+snapshot is never changed.  Starting a run takes the same time however much
+the prelude defined.
+'''
+from types import MappingProxyType
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+
+class Snapshot(object):
+    '''
+    The global bindings and loaded modules of an interpreter, frozen.  A
+    snapshot can be shared by any number of interpreters, in any number of
+    threads, as long as they use the engine and argument mode it was taken
+    with.
+    '''
+
+    def __init__(self, engine_name, arg_mode, bindings, modules):
+        '''
+        :param engine_name: the name of the engine the bindings were made by
+        :type engine_name: str
+        :param arg_mode: the argument mode of the engine
+        :type arg_mode: str
+        :param bindings: the global bindings (name -> value).  The snapshot
+                         takes the dict over: it must not be changed.
+        :type bindings: dict
+        :param modules: the modules that had been loaded (unit name ->
+                        modules.Module)
+        :type modules: dict
+        '''
+        self.engine_name = engine_name
+        self.arg_mode = arg_mode
+        #: the global bindings (a read-only view)
+        self.bindings = MappingProxyType(bindings)
+        #: the loaded modules (a read-only view)
+        self.modules = MappingProxyType(modules)
+
+    def check(self, engine):
+        '''
+        :param engine: an engine that is to run from the snapshot
+        :type engine: engine.Engine
+        :raises ValueError: if the engine can't use the snapshot's bindings
+        '''
+        if (engine.name, engine.arg_mode) != (self.engine_name,
+                                              self.arg_mode):
+            raise ValueError(
+                'The snapshot was taken with the %s engine, in %s mode, and '
+                'cannot be used with the %s engine, in %s mode' %
+                (self.engine_name, self.arg_mode, engine.name,
+                 engine.arg_mode))
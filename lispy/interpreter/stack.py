@@ -0,0 +1,605 @@
+'''
+Explicit-stack evaluator.
+
+Evaluates the Datum tree with a stack of pending tasks and a stack of
+values, instead of Python recursion.  A lispy call, a nested expression or
+an argument being evaluated pushes tasks, not Python frames, so the depth of
+recursion a program can use is bounded by memory rather than by
+sys.getrecursionlimit().
+
+Code runs against the same Frames, globals and resolved names as compiled
+code (see compiler.py), and gives the same results.  The special forms (if,
+begin, while, and, or) are carried out by the machine itself, and the
+arguments of strict builtins (see builtins.strict) are evaluated by the
+machine before the builtin is called.  Other builtins are called as usual,
+and evaluating their arguments runs a nested machine.
+'''
+
+from types import FunctionType
+
+from .frame import Frame, Thunk, MemoThunk, UNBOUND, ARG_BINDERS
+from .profiler import ProfiledFunction
+from .compiler import _frame_at, _reader, _writer, _early, _LATER
+from .scope import STRICT, Datum
+from .error import VarNameNotFoundError
+from .datatypes import StaticDatum, VarRef, Set, FunctionDef, FunctionCall, \
+    ExprSeq, List, Folded, Inlined, SpecialForm
+from ..builtins import strict_builtins
+from ..builtins.builtins import ifBuiltin, beginBuiltin, whileBuiltin, \
+    orBuiltin, andBuiltin
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+# Task codes.  Each task is a tuple starting with its code.
+_EVAL = 0  # (_EVAL, datum, frame, unit): push the value of datum
+_DROP = 1  # (_DROP,): discard the top value
+_SET = 2  # (_SET, write, frame): bind the top value (it stays on the stack)
+_CALL = 3  # (_CALL, datum, frame, unit): call the function on the stack
+_ENTER = 4  # (_ENTER, func, nargs, frame): call func with the top values
+_MEMO = 5  # (_MEMO, thunk, values, slot): remember the top value in thunk
+_IF = 6  # (_IF, arg_exprs, frame, unit): pick a branch by the top value
+_WHILE = 7  # (_WHILE, arg_exprs, frame, unit, last): test the condition
+_WHILE_TEST = 8  # (_WHILE_TEST, arg_exprs, frame, unit, last)
+_WHILE_LOOP = 9  # (_WHILE_LOOP, arg_exprs, frame, unit): body finished
+_APPLY = 10  # (_APPLY, builtin, nargs, frame): call with the top values
+# (_SHORT, stop, arg_exprs, i, frame, unit): the top value is that of
+# argument i - 1 of an and (stop is False) or an or (stop is True)
+_SHORT = 11
+_LIST = 12  # (_LIST, n): make a list of the top n values
+_CONST = 13  # (_CONST, value): push value
+# (_LEAVE, entry, profiler): a profiled call has returned (see _push_body)
+_LEAVE = 14
+
+
+class StackExpr(object):
+    '''
+    An expression of a unit evaluated by the stack machine.  It has an
+    evaluate(parent_scope) method, for builtins, and can be used as the code
+    of a Thunk.  Thunks whose code is a StackExpr are evaluated by the
+    machine that needs them rather than by a nested one.
+    '''
+    __slots__ = ('datum', 'unit')
+
+    def __init__(self, datum, unit):
+        self.datum = datum
+        self.unit = unit
+
+    def evaluate(self, parent_scope):
+        return _execute([(_EVAL, self.datum, parent_scope, self.unit)])
+
+    __call__ = evaluate
+
+    @property
+    def pos(self):
+        return self.datum.pos
+
+    @property
+    def value(self):
+        return self.datum.value
+
+
+class StackFunction(object):
+    '''
+    A function defined by code run on the stack machine.  It can be called
+    like a FunctionDef, with the caller's frame and the unevaluated
+    arguments.
+    '''
+    __slots__ = ('datum', 'env', 'unit')
+
+    def __init__(self, datum, env, unit):
+        '''
+        :param datum: the function definition
+        :type datum: FunctionDef
+        :param env: the frame the function was defined in
+        :type env: Frame
+        :param unit: the unit the function is defined in
+        :type unit: StackUnit
+        '''
+        self.datum = datum
+        self.env = env
+        self.unit = unit
+
+    def __call__(self, parent_scope, *arg_vals):
+        block = self.unit.res.block(self.datum)
+        assert (block.nparams == len(arg_vals))
+        meter = parent_scope.genv.meter
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(self.datum.pos)
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(self.datum.pos)
+        make_arg = ARG_BINDERS[self.unit.arg_mode]
+        values = [make_arg(parent_scope,
+                           a if type(a) is StackExpr else a.evaluate)
+                  for a in arg_vals]
+        values += [UNBOUND] * block.nlocals
+        frame = Frame(values, self.env, parent_scope.genv)
+        tasks = []
+        _push_body(tasks, self, frame)
+        return _execute(tasks)
+
+    @property
+    def pos(self):
+        return self.datum.pos
+
+    @property
+    def value(self):
+        return self.datum.value
+
+
+class StackUnit(object):
+    '''
+    A unit compiled for the stack machine: the Datum tree, its resolved
+    names and how arguments are passed.
+    '''
+
+    def __init__(self, datum, res, arg_mode):
+        '''
+        :param datum: the unit
+        :type datum: datatypes.Datum
+        :param res: the resolved names of the unit
+        :type res: resolver.Resolution
+        :param arg_mode: how arguments are passed (one of scope.ARG_MODES)
+        :type arg_mode: str
+        '''
+        self.datum = datum
+        self.res = res
+        self.arg_mode = arg_mode
+        self._exprs = dict()
+        self._writers = dict()
+        self._readers = dict()
+        self._early = dict()
+        self._owners = None
+
+    def evaluate(self, parent_scope):
+        return _execute([(_EVAL, self.datum, parent_scope, self)])
+
+    def expr(self, datum):
+        '''
+        :return: the StackExpr for an expression of this unit
+        :rtype: StackExpr
+        '''
+        e = self._exprs.get(datum)
+        if e is None:
+            e = self._exprs[datum] = StackExpr(datum, self)
+        return e
+
+    def writer(self, datum):
+        '''
+        :param datum: a Set or FunctionDef of this unit
+        :return: a function that binds a value to the name datum sets
+        :rtype: (Frame, any) -> None
+        '''
+        w = self._writers.get(datum)
+        if w is None:
+            w = self._writers[datum] = _writer(self.res.ref(datum))
+        return w
+
+    def reader(self, datum):
+        '''
+        :param datum: a FunctionCall of this unit
+        :return: a function that fetches the value of the name datum calls,
+                 as it is (an argument that hasn't been evaluated is left as
+                 it is)
+        :rtype: (Frame) -> any
+        '''
+        r = self._readers.get(datum)
+        if r is None:
+            r = self._readers[datum] = _reader(self.res.ref(datum), STRICT)
+        return r
+
+    def early(self, datum):
+        '''
+        :param datum: an argument of a call in this unit
+        :return: a closure that evaluates it when the call is made (see
+                 compiler._early_plan), or None if it can't be
+        :rtype: ((Frame) -> any) or None
+        '''
+        if datum not in self._early:
+            self._early[datum] = _early(datum, self.res, self.arg_mode)
+        return self._early[datum]
+
+    def owner(self, datum):
+        '''
+        :param datum: an expression of this unit
+        :return: the innermost function definition that datum is in, or None
+                 if it is in the unit's top-level code
+        :rtype: FunctionDef or None
+        '''
+        owners = self._owners
+        if owners is None:
+            # only sampling (see sampler.py) asks, so build the map then
+            owners = dict()
+            todo = [(self.datum, None)]
+            while todo:
+                d, owner = todo.pop()
+                if d in owners:
+                    # a part of both forms of a Folded
+                    continue
+                owners[d] = owner
+                t = type(d)
+                if t is FunctionDef:
+                    todo.append((d.body, d))
+                elif t is FunctionCall:
+                    todo.extend((a, owner) for a in d.arg_exprs)
+                elif t is Set:
+                    todo.append((d.value_expr, owner))
+                elif t is ExprSeq or t is List:
+                    todo.extend((i, owner) for i in d.items)
+                elif t is Folded:
+                    todo.append((d.fast, owner))
+                    todo.append((d.slow, owner))
+                elif t is Inlined:
+                    todo.append((d.body, owner))
+                    todo.append((d.call, owner))
+                elif t is SpecialForm:
+                    todo.append((d.call, owner))
+            self._owners = owners
+        return owners.get(datum)
+
+
+def _body_items(body):
+    if type(body) is ExprSeq:
+        return body.items
+    return [body]
+
+
+def _guards_hold(guards, genv):
+    '''
+    :param guards: the guards of a Folded or Inlined
+    :param genv: the globals
+    :type genv: GlobalEnv
+    :return: True if the names of the guards are bound to their builtins.
+             The names are global (see optimizer.py).
+    :rtype: bool
+    '''
+    for (ref, builtin) in guards:
+        if genv.get(ref.name.value) is not builtin:
+            return False
+    return True
+
+
+def _push_seq(tasks, items, frame, unit):
+    '''
+    Push the tasks that evaluate items in order, leaving the last value.
+    '''
+    if not items:
+        tasks.append((_CONST, None))
+        return
+    for (i, item) in enumerate(reversed(items)):
+        if i:
+            tasks.append((_DROP,))
+        tasks.append((_EVAL, item, frame, unit))
+
+
+def _push_body(tasks, func, frame):
+    '''
+    Push the tasks that run the body of func in frame, the frame of a call.
+    In a profiled run, the call is recorded until a _LEAVE task, pushed
+    first.  If the next task is the _LEAVE of the caller, the call is a tail
+    call, and the caller is left now: it has nothing else to do.
+    '''
+    profiler = frame.genv.meter.profiler
+    if profiler is not None:
+        if tasks and tasks[-1][0] == _LEAVE:
+            profiler.leave(tasks.pop()[1])
+        key = (func.datum.name.value, func.datum.pos)
+        tasks.append((_LEAVE, profiler.enter(key), profiler))
+    _push_seq(tasks, _body_items(func.datum.body), frame, func.unit)
+
+
+def _push_read(tasks, values, ref, frame):
+    '''
+    Push the value bound to a resolved name, or the tasks that evaluate it
+    if it is an argument that hasn't been evaluated yet.
+    '''
+    slot_values = None
+    slot = None
+    for depth, slot in ref.chain:
+        slot_values = _frame_at(frame, depth).values
+        v = slot_values[slot]
+        if v is not UNBOUND:
+            break
+    else:
+        name = ref.name.value
+        try:
+            v = frame.genv[name]
+        except KeyError:
+            raise VarNameNotFoundError(ref.name.pos, name)
+        values.append(v)
+        return
+    t = type(v)
+    if t is Thunk:
+        if type(v.code) is StackExpr:
+            tasks.append((_EVAL, v.code.datum, v.frame, v.code.unit))
+        else:
+            values.append(v.force())
+    elif t is MemoThunk:
+        if type(v.code) is StackExpr:
+            tasks.append((_MEMO, v, slot_values, slot))
+            tasks.append((_EVAL, v.code.datum, v.frame, v.code.unit))
+        else:
+            v = slot_values[slot] = v.force()
+            values.append(v)
+    else:
+        values.append(v)
+
+
+def _call(tasks, values, func, datum, frame, unit):
+    '''
+    Push the tasks for a call to func, from a FunctionCall.
+    '''
+    args = datum.arg_exprs
+    nargs = len(args)
+    if type(func) is StackFunction:
+        fblock = func.unit.res.block(func.datum)
+        assert (fblock.nparams == nargs)
+        meter = frame.genv.meter
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(datum.pos)
+        # the frame of the call
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(datum.pos)
+        if unit.arg_mode == STRICT:
+            tasks.append((_ENTER, func, nargs, frame))
+            for a in reversed(args):
+                tasks.append((_EVAL, a, frame, unit))
+            return
+        make_arg = ARG_BINDERS[unit.arg_mode]
+        arg_values = []
+        for a in args:
+            if type(a) is StaticDatum:
+                arg_values.append(a.value)
+                continue
+            early = unit.early(a)
+            v = _LATER if early is None else early(frame)
+            arg_values.append(make_arg(frame, unit.expr(a))
+                              if v is _LATER else v)
+        arg_values += [UNBOUND] * fblock.nlocals
+        _push_body(tasks, func, Frame(arg_values, func.env, frame.genv))
+    elif func is ifBuiltin and nargs == 3:
+        tasks.append((_IF, args, frame, unit))
+        tasks.append((_EVAL, args[0], frame, unit))
+    elif func is beginBuiltin:
+        _push_seq(tasks, args, frame, unit)
+    elif func is whileBuiltin and nargs >= 1:
+        tasks.append((_WHILE, args, frame, unit, None))
+    elif (type(func) is FunctionType and func in strict_builtins or
+          type(func) is ProfiledFunction and func.strict):
+        tasks.append((_APPLY, func, nargs, frame))
+        for a in reversed(args):
+            tasks.append((_EVAL, a, frame, unit))
+    elif func is andBuiltin or func is orBuiltin:
+        stop = func is orBuiltin
+        if nargs:
+            tasks.append((_SHORT, stop, args, 1, frame, unit))
+            tasks.append((_EVAL, args[0], frame, unit))
+        else:
+            values.append(not stop)
+    elif func is None:
+        raise Exception("Undefined function '%s'" % str(datum.name))
+    else:
+        values.append(func(frame, *[unit.expr(a) for a in args]))
+
+
+def _execute(tasks):
+    '''
+    Run the machine until there are no tasks left.
+
+    :param tasks: the initial tasks
+    :type tasks: list[tuple]
+    :return: the value left on the stack
+    '''
+    values = []
+    push = values.append
+    pop = values.pop
+    while tasks:
+        task = tasks.pop()
+        code = task[0]
+        if code == _EVAL:
+            (code, datum, frame, unit) = task
+            t = type(datum)
+            if t is StaticDatum:
+                push(datum.value)
+            elif t is VarRef:
+                _push_read(tasks, values, unit.res.ref(datum), frame)
+            elif t is FunctionCall:
+                tasks.append((_CALL, datum, frame, unit))
+                _push_read(tasks, values, unit.res.ref(datum), frame)
+            elif t is Set:
+                tasks.append((_SET, unit.writer(datum), frame))
+                tasks.append((_EVAL, datum.value_expr, frame, unit))
+            elif t is FunctionDef:
+                unit.writer(datum)(frame, StackFunction(datum, frame, unit))
+                push(None)
+            elif t is ExprSeq:
+                block = unit.res.block(datum)
+                if block is not None:
+                    meter = frame.genv.meter
+                    meter.space -= 1
+                    if meter.space < 0:
+                        meter.out_of_space(datum.pos)
+                    frame = Frame([UNBOUND] * len(block.names), frame,
+                                  frame.genv)
+                _push_seq(tasks, datum.items, frame, unit)
+            elif t is List:
+                meter = frame.genv.meter
+                meter.space -= 1
+                if meter.space < 0:
+                    meter.out_of_space(datum.pos)
+                tasks.append((_LIST, len(datum.items)))
+                for i in reversed(datum.items):
+                    tasks.append((_EVAL, i, frame, unit))
+            elif t is Folded:
+                if _guards_hold(datum.guards, frame.genv):
+                    datum = datum.fast
+                else:
+                    datum = datum.slow
+                tasks.append((_EVAL, datum, frame, unit))
+            elif t is SpecialForm:
+                # carried out by _call, if the name refers to the builtin
+                tasks.append((_EVAL, datum.call, frame, unit))
+            elif t is Inlined:
+                f = unit.reader(datum.call)(frame)
+                meter = frame.genv.meter
+                if (type(f) is StackFunction and f.datum is datum.func and
+                        meter.sampler is None and meter.profiler is None and
+                        _guards_hold(datum.guards, frame.genv)):
+                    # the call would have used a step and a frame
+                    meter.fuel -= 1
+                    if meter.fuel < 0:
+                        meter.refuel(datum.pos)
+                    meter.space -= 1
+                    if meter.space < 0:
+                        meter.out_of_space(datum.pos)
+                    datum = datum.body
+                else:
+                    datum = datum.call
+                tasks.append((_EVAL, datum, frame, unit))
+            else:
+                push(datum.evaluate(frame))
+        elif code == _CALL:
+            (code, datum, frame, unit) = task
+            _call(tasks, values, pop(), datum, frame, unit)
+        elif code == _DROP:
+            pop()
+        elif code == _SET:
+            task[1](task[2], values[-1])
+        elif code == _IF:
+            (code, args, frame, unit) = task
+            tasks.append((_EVAL, args[1] if pop() else args[2], frame, unit))
+        elif code == _APPLY:
+            (code, func, nargs, frame) = task
+            if nargs:
+                args = values[-nargs:]
+                del values[-nargs:]
+            else:
+                args = []
+            push(func(frame, *args))
+        elif code == _SHORT:
+            (code, stop, args, i, frame, unit) = task
+            if (not pop()) is not stop:
+                push(stop)
+            elif i == len(args):
+                push(not stop)
+            else:
+                tasks.append((_SHORT, stop, args, i + 1, frame, unit))
+                tasks.append((_EVAL, args[i], frame, unit))
+        elif code == _ENTER:
+            (code, func, nargs, frame) = task
+            fblock = func.unit.res.block(func.datum)
+            if nargs:
+                arg_values = values[-nargs:]
+                del values[-nargs:]
+            else:
+                arg_values = []
+            arg_values += [UNBOUND] * fblock.nlocals
+            _push_body(tasks, func, Frame(arg_values, func.env, frame.genv))
+        elif code == _MEMO:
+            (code, thunk, slot_values, slot) = task
+            v = values[-1]
+            thunk.settle(v)
+            slot_values[slot] = v
+        elif code == _WHILE:
+            (code, args, frame, unit, last) = task
+            tasks.append((_WHILE_TEST, args, frame, unit, last))
+            tasks.append((_EVAL, args[0], frame, unit))
+        elif code == _WHILE_TEST:
+            (code, args, frame, unit, last) = task
+            if pop():
+                meter = frame.genv.meter
+                meter.fuel -= 1
+                if meter.fuel < 0:
+                    meter.refuel(args[0].pos)
+                if len(args) > 1:
+                    tasks.append((_WHILE_LOOP, args, frame, unit))
+                    _push_seq(tasks, args[1:], frame, unit)
+                else:
+                    tasks.append((_WHILE, args, frame, unit, last))
+            else:
+                push(last)
+        elif code == _WHILE_LOOP:
+            (code, args, frame, unit) = task
+            tasks.append((_WHILE, args, frame, unit, pop()))
+        elif code == _CONST:
+            push(task[1])
+        elif code == _LEAVE:
+            task[2].leave(task[1])
+        elif code == _LIST:
+            n = task[1]
+            if n:
+                items = values[-n:]
+                del values[-n:]
+                push(items)
+            else:
+                push([])
+    return values[-1]
+
+
+def frame_handlers():
+    '''
+    Read the functions running in the stack engine, for sampler.Sampler
+    (see engine.Engine.frame_handlers), from the tasks of _execute.  The
+    handlers read the locals of _execute, _call and StackFunction.__call__:
+    keep them in step.
+
+    :return: Python code object -> handler
+    :rtype: dict
+    '''
+    def execute_tasks(local, s, innermost):
+        tasks = list(local.get('tasks', ()))
+        task = local.get('task')
+        if task is not None:
+            tasks.append(task)
+        for task in tasks:
+            _read_task(task, s)
+
+    def stack_call(local, s, innermost):
+        if innermost and type(local['func']) is StackFunction:
+            s.push_def(local['func'].datum)
+
+    def stack_function_call(local, s, innermost):
+        # otherwise, the tasks of the body show the function
+        if innermost:
+            s.push_def(local['self'].datum)
+
+    return {_execute.__code__: execute_tasks,
+            _call.__code__: stack_call,
+            StackFunction.__call__.__code__: stack_function_call}
+
+
+def _read_task(task, s):
+    '''
+    Read the function that a task belongs to.  Tasks from the same call of
+    a function are next to each other.
+    '''
+    unit = frame = datum = None
+    for x in task[1:]:
+        t = type(x)
+        if t is StackUnit:
+            unit = x
+        elif t is Frame:
+            frame = x
+        elif datum is None:
+            if isinstance(x, Datum):
+                datum = x
+            elif (t is list or t is tuple) and x and isinstance(x[0],
+                                                                 Datum):
+                datum = x[0]
+    if unit is None or frame is None or datum is None:
+        return
+    owner = unit.owner(datum)
+    top = s.top
+    if top is not None and top[0] is owner:
+        # a frame of a block in the same call?
+        f = frame
+        while f is not None and f is not top[1]:
+            f = f.parent
+        if f is not None:
+            return
+    s.top = (owner, frame)
+    if owner is not None:
+        s.push_def(owner)
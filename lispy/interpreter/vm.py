@@ -0,0 +1,445 @@
+'''
+Bytecode VM.
+
+Runs the Code made by the bytecode compiler (see bytecode.py) against the
+same frames and globals as the closure engine (see frame.py).
+
+The VM is a single loop over the instruction array, with an operand stack and
+a stack of suspended activations.  Calls from lispy functions to lispy
+functions, and thunks forced by reading a parameter, push an activation
+rather than calling back into Python, so neither uses the Python stack.
+Calls in tail position replace the current activation.
+
+Builtins are called as usual, with the caller's frame and objects that have
+an evaluate(parent_scope) method.  Evaluating one of those runs the
+argument's code in a new loop.
+'''
+
+from collections import namedtuple
+from types import FunctionType
+
+from .bytecode import CONST, LOAD_FAST, LOAD_REF, LOAD_GLOBAL, STORE_FAST, \
+    STORE_REF, STORE_GLOBAL, DUP, POP, JUMP, JUMP_IF_FALSE, END_ARG, RETURN, \
+    MAKE_FUNCTION, PUSH_FRAME, POP_FRAME, BUILD_LIST, SELECT_CALL, MAKE_ARGS, \
+    CALL, TAIL_CALL, CALL_OTHER, GUARD, COMPARE, EVALUATE, ADD, SUBTRACT, \
+    MULTIPLY, LOOP, INLINED, CallSite, Guard
+from .compiler import _reader, _writer, _planned, _LATER
+from .frame import Frame, Thunk, MemoThunk, UNBOUND, ARG_BINDERS
+from .profiler import ProfiledFunction
+from .error import VarNameNotFoundError
+from ..builtins import global_builtins, strict_builtins
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+'''
+The run time tables of a Code object, built the first time it runs.
+
+Attributes:
+    names: the identifier of each entry in Code.refs
+    readers: a closure that fetches the value of each entry in Code.refs
+    writers: a closure that binds each entry in Code.refs
+    table: for each constant in the pool, what the VM needs for it at run
+        time: a pair (VMExpr for each argument, (static, value, early,
+        VMExpr) for each argument, where early is the closure that evaluates
+        it when the call is made, or None) for a CallSite, the builtin for a
+        Guard, and the operator for the name of a comparison.
+    make_arg: binds an argument (see frame.ARG_BINDERS)
+'''
+_Linked = namedtuple('_Linked', 'names readers writers table make_arg')
+
+#: name of a comparison builtin -> its operator
+_COMPARE_OPS = {name: f.op for (name, f) in global_builtins.items()
+                if hasattr(f, 'op')}
+
+
+class VMExpr(object):
+    '''
+    A stretch of compiled code that evaluates one expression: a whole unit,
+    or an argument of a call.  Builtins get their arguments as VMExprs, and
+    thunks hold them.
+    '''
+    __slots__ = ('code', 'start', 'stop', 'pos')
+
+    def __init__(self, code, start, stop, pos):
+        '''
+        :param code: the code that contains the expression
+        :type code: bytecode.Code
+        :param start: index of the first instruction
+        :type start: int
+        :param stop: index just past the END_ARG that ends the expression, or
+                     -1 to run until the code returns
+        :type stop: int
+        :param pos: the position of the expression in the source
+        :type pos: TokenPos
+        '''
+        self.code = code
+        self.start = start
+        self.stop = stop
+        self.pos = pos
+
+    def evaluate(self, parent_scope):
+        return execute(self.code, self.start, self.stop, parent_scope)
+
+    # thunks call their code with the frame
+    __call__ = evaluate
+
+
+class VMFunction(object):
+    '''
+    A function defined by compiled code: the Code for its body together with
+    the frame it was defined in.
+
+    It can be called like a FunctionDef, with the caller's frame and the
+    unevaluated arguments.  The VM skips that and runs the body itself.
+    '''
+    __slots__ = ('code', 'env')
+
+    def __init__(self, code, env):
+        '''
+        :param code: the body of the function
+        :type code: bytecode.Code
+        :param env: the frame the function was defined in
+        :type env: Frame
+        '''
+        self.code = code
+        self.env = env
+
+    def __call__(self, parent_scope, *arg_vals):
+        code = self.code
+        assert (code.nparams == len(arg_vals))
+        meter = parent_scope.genv.meter
+        meter.fuel -= 1
+        if meter.fuel < 0:
+            meter.refuel(code.pos)
+        meter.space -= 1
+        if meter.space < 0:
+            meter.out_of_space(code.pos)
+        make_arg = ARG_BINDERS[code.arg_mode]
+        values = [make_arg(parent_scope,
+                           a if type(a) is VMExpr else a.evaluate)
+                  for a in arg_vals]
+        values += [UNBOUND] * code.nlocals
+        entry = None
+        if meter.profiler is not None:
+            entry = meter.profiler.enter((code.name, code.pos))
+        return execute(code, 0, -1, Frame(values, self.env, parent_scope.genv),
+                       entry)
+
+    @property
+    def pos(self):
+        return self.code.pos
+
+
+def link(code):
+    '''
+    Build the run time tables of code.
+
+    :type code: bytecode.Code
+    :rtype: _Linked
+    '''
+    table = []
+    for c in code.consts:
+        t = type(c)
+        if t is CallSite:
+            exprs = tuple(VMExpr(code, a.start, a.stop, a.pos)
+                          for a in c.args)
+            args = []
+            for (a, e) in zip(c.args, exprs):
+                early = a.early
+                if early is not None:
+                    early = _planned(early, code.arg_mode)
+                args.append((a.static, a.value, early, e))
+            table.append((exprs, tuple(args)))
+        elif t is Guard:
+            table.append(global_builtins[c.name])
+        elif t is str:
+            table.append(_COMPARE_OPS.get(c))
+        else:
+            table.append(None)
+    refs = code.refs
+    code.linked = _Linked(tuple(r.name.value for r in refs),
+                          tuple(_reader(r, code.arg_mode) for r in refs),
+                          tuple(_writer(r) for r in refs),
+                          tuple(table),
+                          ARG_BINDERS[code.arg_mode])
+    return code.linked
+
+
+def execute(code, pc, stop, frame, entry=None):
+    '''
+    Run compiled code.
+
+    :param code: the code to run
+    :type code: bytecode.Code
+    :param pc: index of the first instruction to run
+    :type pc: int
+    :param stop: stop after the END_ARG just before this index, or -1 to run
+                 until the code returns
+    :type stop: int
+    :param frame: the frame to run the code in
+    :type frame: Frame
+    :param entry: the call of the function whose body the code is, if it is
+                  recorded by a profiler (see profiler.Profiler.enter)
+    :type entry: list or None
+    :return: the value of the code
+    '''
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    # suspended activations: (code, pc, frame, stop, memo)
+    calls = []
+    # (thunk, values, slot) if the current activation is evaluating a
+    # MemoThunk read from values[slot], so the value gets remembered
+    memo = None
+    ops = code.ops
+    consts = code.consts
+    lk = code.linked or link(code)
+    # counts the run's steps and allocations (see budget.Meter)
+    meter = frame.genv.meter
+    # in a profiled run, the calls being recorded: (the number of suspended
+    # activations when the callee's body started, entry).  A call ends when
+    # its body returns, or makes a tail call.
+    profiled = [] if entry is None else [(0, entry)]
+    while True:
+        op = ops[pc]
+        arg = ops[pc + 1]
+        pc += 2
+        if op == LOAD_FAST:
+            v = frame.values[arg]
+            t = type(v)
+            if t is Thunk or t is MemoThunk:
+                thunk_code = v.code
+                if type(thunk_code) is VMExpr:
+                    # evaluate the argument right here
+                    calls.append((code, pc, frame, stop, memo))
+                    memo = (v, frame.values, arg) if t is MemoThunk else None
+                    code = thunk_code.code
+                    ops = code.ops
+                    consts = code.consts
+                    lk = code.linked or link(code)
+                    pc = thunk_code.start
+                    stop = thunk_code.stop
+                    frame = v.frame
+                    continue
+                if t is Thunk:
+                    v = v.force()
+                else:
+                    v = frame.values[arg] = v.force()
+            push(v)
+        elif op == CONST:
+            push(consts[arg])
+        elif op == END_ARG:
+            if pc != stop:
+                continue
+            v = stack[-1]
+            if memo is not None:
+                thunk, values, slot = memo
+                thunk.settle(v)
+                values[slot] = v
+            if not calls:
+                return v
+            code, pc, frame, stop, memo = calls.pop()
+            ops = code.ops
+            consts = code.consts
+            lk = code.linked
+        elif op == LOAD_GLOBAL:
+            try:
+                push(frame.genv[lk.names[arg]])
+            except KeyError:
+                raise VarNameNotFoundError(code.refs[arg].name.pos,
+                                           lk.names[arg])
+        elif op == SELECT_CALL:
+            f = stack[-1]
+            t = type(f)
+            if t is VMFunction:
+                thunks = consts[arg].thunks
+                if thunks >= 0:
+                    pc = thunks
+            elif ((t is not FunctionType or f not in strict_builtins) and
+                  (t is not ProfiledFunction or not f.strict)):
+                pc = consts[arg].other
+        elif op == CALL or op == TAIL_CALL:
+            base = len(stack) - arg
+            f = stack[base - 1]
+            if type(f) is VMFunction:
+                f_code = f.code
+                assert (f_code.nparams == arg)
+                meter.fuel -= 1
+                if meter.fuel < 0:
+                    meter.refuel(code.positions[pc - 2])
+                meter.space -= 1
+                if meter.space < 0:
+                    meter.out_of_space(code.positions[pc - 2])
+                values = stack[base:]
+                del stack[base - 1:]
+                if f_code.nlocals:
+                    values += [UNBOUND] * f_code.nlocals
+                if op == CALL:
+                    calls.append((code, pc, frame, stop, memo))
+                    memo = None
+                if meter.profiler is not None:
+                    if op == TAIL_CALL:
+                        # the caller has nothing else to do
+                        _leave(profiled, len(calls), meter.profiler)
+                    profiled.append((len(calls), meter.profiler.enter(
+                        (f_code.name, f_code.pos))))
+                code = f_code
+                ops = code.ops
+                consts = code.consts
+                lk = code.linked or link(code)
+                frame = Frame(values, f.env, frame.genv)
+                pc = 0
+                stop = -1
+            else:
+                # a strict builtin
+                args = stack[base:]
+                del stack[base - 1:]
+                push(f(frame, *args))
+        elif op == GUARD:
+            if stack[-1] is lk.table[arg]:
+                pop()
+            else:
+                pc = consts[arg].other
+        elif op == INLINED:
+            f = stack[-1]
+            if (type(f) is VMFunction and f.code is consts[arg].code and
+                    meter.sampler is None and meter.profiler is None):
+                # the call would have used a step and a frame
+                pop()
+                meter.fuel -= 1
+                if meter.fuel < 0:
+                    meter.refuel(code.positions[pc - 2])
+                meter.space -= 1
+                if meter.space < 0:
+                    meter.out_of_space(code.positions[pc - 2])
+            else:
+                pc = consts[arg].other
+        elif op == COMPARE:
+            v = pop()
+            stack[-1] = True if lk.table[arg](v, stack[-1]) else False
+        elif op == ADD:
+            # the same as the builtin, which sums from 0
+            v = pop()
+            stack[-1] = 0 + stack[-1] + v
+        elif op == SUBTRACT:
+            v = pop()
+            stack[-1] = stack[-1] - v
+        elif op == MULTIPLY:
+            v = pop()
+            stack[-1] = 1 * stack[-1] * v
+        elif op == JUMP_IF_FALSE:
+            if not pop():
+                pc = arg
+        elif op == JUMP:
+            pc = arg
+        elif op == LOOP:
+            meter.fuel -= 1
+            if meter.fuel < 0:
+                meter.refuel(code.positions[pc - 2])
+            pc = arg
+        elif op == RETURN:
+            v = stack[-1]
+            if profiled:
+                _leave(profiled, len(calls), meter.profiler)
+            if memo is not None:
+                thunk, values, slot = memo
+                thunk.settle(v)
+                values[slot] = v
+            if not calls:
+                return v
+            code, pc, frame, stop, memo = calls.pop()
+            ops = code.ops
+            consts = code.consts
+            lk = code.linked
+        elif op == POP:
+            pop()
+        elif op == MAKE_ARGS:
+            make_arg = lk.make_arg
+            for (static, value, early, expr) in lk.table[arg][1]:
+                if static:
+                    push(value)
+                    continue
+                v = _LATER if early is None else early(frame)
+                push(make_arg(frame, expr) if v is _LATER else v)
+        elif op == CALL_OTHER:
+            f = pop()
+            if f is None:
+                raise Exception("Undefined function '%s'" %
+                                str(consts[arg].name))
+            if (type(f) is FunctionType and f in strict_builtins or
+                    type(f) is ProfiledFunction and f.strict):
+                # an inline builtin's name bound to a strict builtin
+                push(f(frame, *[e.evaluate(frame)
+                                for e in lk.table[arg][0]]))
+            else:
+                push(f(frame, *lk.table[arg][0]))
+        elif op == LOAD_REF:
+            push(lk.readers[arg](frame))
+        elif op == DUP:
+            push(stack[-1])
+        elif op == STORE_REF:
+            lk.writers[arg](frame, pop())
+        elif op == STORE_GLOBAL:
+            frame.genv[lk.names[arg]] = pop()
+        elif op == STORE_FAST:
+            frame.values[arg] = pop()
+        elif op == MAKE_FUNCTION:
+            push(VMFunction(consts[arg], frame))
+        elif op == PUSH_FRAME:
+            meter.space -= 1
+            if meter.space < 0:
+                meter.out_of_space(code.positions[pc - 2])
+            frame = Frame([UNBOUND] * arg, frame, frame.genv)
+        elif op == POP_FRAME:
+            frame = frame.parent
+        elif op == BUILD_LIST:
+            meter.space -= 1
+            if meter.space < 0:
+                meter.out_of_space(code.positions[pc - 2])
+            base = len(stack) - arg
+            items = stack[base:]
+            del stack[base:]
+            push(items)
+        elif op == EVALUATE:
+            push(consts[arg].evaluate(frame))
+        else:
+            raise ValueError('Bad opcode %d at %d in %r' % (op, pc - 2, code))
+
+
+def _leave(profiled, depth, profiler):
+    '''
+    Record the end of the calls whose bodies started with depth suspended
+    activations (see execute).
+    '''
+    while profiled and profiled[-1][0] == depth:
+        profiler.leave(profiled.pop()[1])
+
+
+def frame_handlers():
+    '''
+    Read the functions running in the VM, for sampler.Sampler (see
+    engine.Engine.frame_handlers), from the activations of execute.  The
+    handlers read the locals of execute and VMFunction.__call__: keep them
+    in step.
+
+    :return: Python code object -> handler
+    :rtype: dict
+    '''
+    def execute_code(local, s, innermost):
+        for (code, pc, frame, stop, memo) in local['calls']:
+            # skip the activations that evaluate arguments
+            if stop == -1 and code.name is not None:
+                s.push_code(code)
+        code = local['code']
+        if local['stop'] == -1 and code.name is not None:
+            s.push_code(code)
+        if (innermost and local.get('op') == CALL
+                and type(local.get('f')) is VMFunction):
+            s.push_code(local['f'].code)
+
+    def vm_function_call(local, s, innermost):
+        if innermost:
+            s.push_code(local['self'].code)
+
+    return {execute.__code__: execute_code,
+            VMFunction.__call__.__code__: vm_function_call}
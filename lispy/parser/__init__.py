@@ -1,3 +1,82 @@
 __author__ = 'Dan Bullok and Ben Lambeth'
-from .parser import LispyParser
-from .parser import LineTracker
+'''
+The LisPy parser.
+
+There are two parser backends, which produce the same syntax tree: 'ply'
+(parser.LispyParser) is generated from the grammar by ply, and 'reader'
+(reader.Reader) is written by hand, and reads faster.
+
+Importing this package is cheap: the parser module, and ply with it, is only
+imported when one of its names is first used.
+'''
+import hashlib
+import importlib
+import importlib.util
+import marshal
+
+_PARSER_NAMES = ('LispyParser', 'LineTracker', 'shared_parser',
+                 'write_tables')
+
+#: The names of the parser backends
+PARSERS = ('ply', 'reader')
+
+#: The parser backend used when none is specified
+DEFAULT_PARSER = 'ply'
+
+_grammar_version = None
+_reader = None
+
+
+def grammar_version():
+    '''
+    :return: a digest of the source of the parser backends, which hold the
+             token patterns, the grammar rules and the code that builds the
+             syntax tree (or of their compiled code, if the package was
+             installed without sources).  It changes whenever the parsers'
+             output might, so anything derived from parser output (such as
+             cached units) can be invalidated.  The backends aren't
+             imported.
+    :rtype: str
+    '''
+    global _grammar_version
+    if _grammar_version is None:
+        digest = hashlib.sha1()
+        for module in ('parser', 'reader'):
+            name = __name__ + '.' + module
+            loader = importlib.util.find_spec(name).loader
+            source = loader.get_source(name)
+            if source is None:
+                digest.update(marshal.dumps(loader.get_code(name)))
+            else:
+                digest.update(source.encode('utf-8'))
+        _grammar_version = digest.hexdigest()
+    return _grammar_version
+
+
+def get_parser(name=DEFAULT_PARSER):
+    '''
+    :param name: the name of the parser backend (one of PARSERS)
+    :type name: str
+    :return: the parser of the named backend that is shared by the whole
+             process.  Its parse method takes a unit name and the unit's
+             text, and returns the syntax tree.
+    :raises ValueError: if there is no backend with the given name
+    '''
+    global _reader
+    if name == 'ply':
+        return __getattr__('shared_parser')()
+    elif name == 'reader':
+        if _reader is None:
+            from .reader import Reader
+            _reader = Reader()
+        return _reader
+    raise ValueError('Unknown parser "%s".  Choose one of: %s' %
+                     (name, ', '.join(PARSERS)))
+
+
+def __getattr__(name):
+    if name in _PARSER_NAMES:
+        parser = importlib.import_module(__name__ + '.parser')
+        return getattr(parser, name)
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__,
+                                                               name))
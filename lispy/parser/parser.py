@@ -1,13 +1,13 @@
 __author__ = 'Dan Bullok and Ben Lambeth'
 
-import pprint
+import copy
+import importlib
+import threading
 
 from ply import lex, yacc
 
 from ..common import TokenPos, Syn
-
-
-P = pprint.PrettyPrinter(indent=4)
+from . import grammar_version
 
 
 class LineTracker(object):
@@ -18,7 +18,8 @@ class LineTracker(object):
 
     def __init__(self, unit_name):
         self._unit_name = unit_name
-        self._last_line_offset = 0
+        # character offset of the start of the current line
+        self._line_offset = 0
         self._line = 0
 
 
@@ -31,7 +32,7 @@ class LineTracker(object):
                             newline.
         :type char_offset: int
         """
-        self._last_line_offset = char_offset
+        self._line_offset = char_offset + 1
         self._line += 1
 
     def get_pos(self, char_offset):
@@ -49,28 +50,119 @@ class LineTracker(object):
         :rtype: TokenPos
         """
 
-        assert (char_offset >= self._last_line_offset)
+        assert (char_offset >= self._line_offset)
         return TokenPos(self._unit_name,
-                        self._last_line_offset + 1,
-                        char_offset - self._last_line_offset + 1)
+                        self._line + 1,
+                        char_offset - self._line_offset + 1)
+
+
+def _table_modules():
+    '''
+    :return: the names of the lexer and parser table modules for the current
+             grammar.  The names include the grammar version, so tables built
+             for an older grammar are never used.
+    :rtype: (str, str)
+    '''
+    version = grammar_version()[:16]
+    return ('lispy.parser.lextab_' + version,
+            'lispy.parser.parsetab_' + version)
+
+
+def _tables_built():
+    '''
+    :return: True if the table modules for the current grammar exist
+    '''
+    try:
+        for name in _table_modules():
+            importlib.import_module(name)
+    except ImportError:
+        return False
+    return True
+
+
+def write_tables(outputdir):
+    '''
+    Generate the lexer and parser tables, and write them as modules in
+    outputdir.  This is done when the package is built (see setup.py), so
+    that parsers can load the tables instead of generating them.
+
+    :param outputdir: the directory of the lispy.parser package to write the
+                      tables into
+    :type outputdir: str
+    '''
+    lextab, parsetab = _table_modules()
+    # yacc puts the tables in the package of the grammar unless the module
+    # name is unqualified
+    parsetab = parsetab.split('.')[-1]
+    LispyParser(lex_kwargs=dict(optimize=1, lextab=lextab,
+                                outputdir=outputdir),
+                yacc_kwargs=dict(optimize=1, tabmodule=parsetab,
+                                 outputdir=outputdir, write_tables=True),
+                tables=False)
+
+
+_shared_parser = None
+_shared_parser_lock = threading.Lock()
+
+
+def shared_parser():
+    '''
+    :return: the LispyParser shared by the whole process.  It is made the
+             first time it is needed.
+    :rtype: LispyParser
+    '''
+    global _shared_parser
+    if _shared_parser is None:
+        with _shared_parser_lock:
+            if _shared_parser is None:
+                _shared_parser = LispyParser()
+    return _shared_parser
 
 
 class LispyParser(object):
     '''
     Parser for LisPy code.
+
+    Making a parser is expensive, unless the lexer and parser tables have
+    been built with the package (see write_tables).  Use shared_parser
+    rather than making a new one.
+
+    A parser is reentrant: each call to parse works on its own clones of the
+    lexer and the LR parser, which share the tables but none of the state of
+    a parse.  So one parser can parse any number of units at once, in any
+    number of threads, and nothing is kept once a parse is done, unless
+    keep_trees is set.
     '''
-    def __init__(self, lex_kwargs=None, yacc_kwargs=None):
+    def __init__(self, lex_kwargs=None, yacc_kwargs=None, tables=True,
+                 keep_trees=False):
         '''
         :param lex_kwargs: kwargs to pass to lex
         :type lex_kwargs: dict
         :param yacc_kwargs: kwargs to pass to yacc
         :type yacc_kwargs: dict
+        :param tables: if True, load the lexer and parser tables built with
+                       the package, if there are any.  Tables are never
+                       written.
+        :type tables: bool
+        :param keep_trees: if True, the last syntax tree parsed for each unit
+                           is kept in trees.  By default, the parser keeps
+                           nothing.
+        :type keep_trees: bool
         '''
-        lex_kwargs = lex_kwargs if lex_kwargs else dict()
-        yacc_kwargs = yacc_kwargs if yacc_kwargs else dict()
+        lex_kwargs = dict(lex_kwargs) if lex_kwargs else dict()
+        yacc_kwargs = dict(yacc_kwargs) if yacc_kwargs else dict()
+        if tables and _tables_built():
+            lextab, parsetab = _table_modules()
+            lex_kwargs = dict(dict(optimize=1, lextab=lextab), **lex_kwargs)
+            yacc_kwargs = dict(dict(optimize=1, tabmodule=parsetab),
+                               **yacc_kwargs)
+        yacc_kwargs.setdefault('debug', False)
+        yacc_kwargs.setdefault('write_tables', False)
         self._lexer = lex.lex(module=self, **lex_kwargs)
         self._parser = yacc.yacc(module=self, **yacc_kwargs)
-        self._files = dict()
+        #: the last syntax tree parsed for each unit (unit name -> Syn), if
+        #: keep_trees was set, or None
+        self.trees = dict() if keep_trees else None
 
     def parse(self, unit_name, input_text):
         '''
@@ -82,16 +174,21 @@ class LispyParser(object):
         :param input_text: the source text to parse
         :type input_text: str
         :return: abstract syntax tree
-        :rtchype: Syn
+        :rtype: Syn
         '''
-        self._tracker = LineTracker(unit_name)
-        result = self._parser.parse(input_text, lexer=self._lexer)
-        self._files[unit_name] = result
-        return result
+        lexer = self._lexer.clone()
+        # the tracker goes with the lexer, where the token rules can find it
+        lexer.tracker = LineTracker(unit_name)
+        # the LR parser keeps the state of a parse in its attributes
+        tree = copy.copy(self._parser).parse(input_text, lexer=lexer)
+        if self.trees is not None:
+            self.trees[unit_name] = tree
+        return tree
 
     def get_syn(self, tok, s_type, s_value):
         '''
-        Create a Syn from a token.  Determines the current TokenPos.
+        Create a Syn from a token.  Determines the TokenPos of the start of
+        the token.
 
         :param tok: token
         :type tok: LexToken
@@ -102,7 +199,7 @@ class LispyParser(object):
         :return: A Syn containing the token and its position
         :rtype: Syn
         '''
-        return Syn(s_type, s_value, self._tracker.get_pos(self._lexer.lexpos))
+        return Syn(s_type, s_value, tok.lexer.tracker.get_pos(tok.lexpos))
 
     tokens = (
         'STRING',
@@ -128,10 +225,10 @@ class LispyParser(object):
         # this is a bit awkward - we have to send individual newlines to the
         # tracker.  This should handle a regex that matches more than just
         # newlines  (not sure if that will ever be necessary).
-        char_idx = self._lexer.lexpos
+        char_idx = t.lexpos
         for n in t.value:
             if n == '\n':
-                self._tracker.inc_line(char_idx)
+                t.lexer.tracker.inc_line(char_idx)
             char_idx += 1
         t.lexer.lineno += t.value.count("\n")
 
@@ -143,7 +240,12 @@ class LispyParser(object):
 
     def t_STRING(self, t):
         r'"([^"]|(\\")|\\)*"'
-        t.value = self.get_syn(t, 'STRING', t.value[1:-1])
+        text = t.value
+        t.value = self.get_syn(t, 'STRING', text[1:-1])
+        # a string can span lines
+        for (i, c) in enumerate(text):
+            if c == '\n':
+                t.lexer.tracker.inc_line(t.lexpos + i)
         return t
 
 
@@ -230,14 +332,18 @@ class LispyParser(object):
         p[0] = Syn('FUNC_CALL', {'name': p[2], 'arg_exprs': p[3]}, p[2].pos)
 
 
+    # The sequence rules are left recursive, so a long sequence is built by
+    # appending to one list, rather than copying it at each element.
+
     def p_ids(self, p):
         '''ids : ID
-               | ID ids
+               | ids ID
         '''
         if len(p) == 2:
             p[0] = [p[1]]
         else:
-            p[0] = [p[1]] + p[2]
+            p[0] = p[1]
+            p[0].append(p[2])
 
 
     def p_atom(self, p):
@@ -252,12 +358,13 @@ class LispyParser(object):
 
     def p_exprseq(self, p):
         '''exprseq : expr
-                   | expr exprseq
+                   | exprseq expr
         '''
         if len(p) == 2:
             p[0] = Syn('EXPRSEQ', [p[1]], p[1].pos)
         else:
-            p[0] = Syn('EXPRSEQ', [p[1]] + p[2].value, p[1].pos)
+            p[0] = p[1]
+            p[0].value.append(p[2])
 
 
     def p_list(self, p):
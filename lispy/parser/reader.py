@@ -0,0 +1,279 @@
+'''
+A hand-written reader for LisPy code.
+
+The reader is an alternative to the ply parser (see parser.LispyParser) that
+produces the same syntax tree.  The whole unit is tokenized by one master
+regular expression, and the S-expressions are assembled with an explicit
+stack as the tokens go by, so the unit is read in a single pass, and deep
+nesting doesn't run into Python's recursion limit.  It doesn't need ply, or
+any tables, so it's cheap to make.
+
+The reader can also stream a unit made of a sequence of top-level forms from
+a file, or from any iterable of chunks of text, yielding each form as soon as
+it has been read (see Reader.read_forms).
+'''
+import re
+
+from ..common import TokenPos, Syn
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+# The token patterns, in the order that ply tries them: the lexer's function
+# rules in the order they are defined, then its string rules, longest first.
+# Anything else, but a space or tab, is illegal.
+_TOKENS = (
+    ('NEWLINE', r'\n[\n \t]*'),
+    ('STRING', r'"(?:[^"]|(?:\\")|\\)*"'),
+    ('BOOL', r'\#[tf]'),
+    ('FLOAT', r'-?[0-9]+\.[0-9]*(?:[eE](?:-?[0-9]+))?'),
+    ('INT', r'-?[0-9]+'),
+    ('ID', r'[-+]|(?:[a-zA-Z_!$%*/:<=>?~^][a-zA-Z_!$%^*/:<=>?~0-9.+\-^]*)'),
+    ('COMMENT', r';[^\n]'),
+    ('LPAREN', r'\('),
+    ('RPAREN', r'\)'),
+    ('SQUOTE', r"'"),
+    ('ILLEGAL', r'[^ \t]'),
+)
+
+# Spaces and tabs are skipped before each token, rather than being matched
+# as tokens of their own, and a newline takes the blank lines and
+# indentation after it, so there are fewer matches.
+_token_re = re.compile(r'[ \t]*(?:%s)' % '|'.join('(?P<%s>%s)' % t
+                                                  for t in _TOKENS))
+
+# words that are read as keywords rather than IDs
+_KEYWORDS = ('defun', 'set')
+
+# The kinds of open list.  A defun's or a set's list is a FORM once its
+# keyword has been read, and a defun's parameter list is a PARAMS list.
+_LIST, _FORM, _PARAMS = range(3)
+
+# the characters that no token but a string goes past
+_DELIMITERS = ' \t\n()'
+
+#: The number of characters read from a file at once (see
+#: Reader.read_forms)
+CHUNK_SIZE = 1 << 20
+
+# makes a namedtuple without going through its (Python) constructor
+_new = tuple.__new__
+
+
+class Reader(object):
+    '''
+    Reader for LisPy code.  A reader has no state of its own, so one reader
+    can be used from any number of threads at once.
+    '''
+
+    def parse(self, unit_name, input_text):
+        '''
+        Read input_text.
+
+        :param unit_name: the name of the translation unit (used to record
+                          position information).
+        :type unit_name: str
+        :param input_text: the source text to read
+        :type input_text: str
+        :return: abstract syntax tree
+        :rtype: Syn
+        :raises SyntaxError: if the text isn't a single expression
+        '''
+        forms = self.read_forms(unit_name, input_text)
+        result = next(forms, None)
+        if result is None:
+            raise SyntaxError('%s: no expression' % unit_name)
+        for extra in forms:
+            _error(extra.pos, extra.type)
+        return result
+
+    def read_forms(self, unit_name, source, chunk_size=CHUNK_SIZE):
+        '''
+        Read a sequence of top-level expressions (forms), yielding each one
+        as soon as it has been read.  The source is read a chunk at a time,
+        so only the form being read, and the chunk it's in, are held in
+        memory: a unit of any size can be read, as long as it's made of
+        many forms.
+
+        :param unit_name: the name of the translation unit (used to record
+                          position information).
+        :type unit_name: str
+        :param source: the source text, a file (opened in text mode) to read
+                       it from, or an iterable of chunks of it
+        :type source: str or io.TextIOBase or iterable[str]
+        :param chunk_size: the number of characters read from a file at once
+        :type chunk_size: int
+        :return: the syntax tree of each form, in order
+        :rtype: iterator[Syn]
+        :raises SyntaxError: if the text isn't a sequence of expressions
+        '''
+        line = 1
+        # the offset of the start of the line in buf (negative once the
+        # line's start has been dropped from buf)
+        line_start = 0
+        # the lists that are open, outermost first.  Each is [kind, position
+        # of the open paren or keyword, keyword, items].  top is the
+        # innermost, or None at the top level.
+        stack = []
+        top = None
+        # the text that hasn't been read yet
+        buf = ''
+        chunks = iter(_chunks(source, chunk_size))
+        more = True
+        while more:
+            chunk = next(chunks, None)
+            if chunk is None:
+                more = False
+                stop = len(buf)
+            else:
+                buf += chunk
+                # Only tokens up to the last delimiter are read until the
+                # next chunk comes: a token running to the end of buf might
+                # go on in the next chunk.  A string can span delimiters, so
+                # that is handled below.
+                stop = max(buf.rfind(c) for c in _DELIMITERS) + 1
+            for m in _token_re.finditer(buf, 0, stop):
+                kind = m.lastgroup
+                text = m.group(kind)
+                if kind == 'NEWLINE':
+                    line += text.count('\n')
+                    line_start = m.end() - len(text) + text.rfind('\n') + 1
+                    continue
+                if kind == 'COMMENT':
+                    continue
+                start = m.end() - len(text)
+                pos = _new(TokenPos, (unit_name, line,
+                                      start - line_start + 1))
+                if kind == 'ID':
+                    if text in _KEYWORDS:
+                        if top is None or top[0] != _LIST or top[3]:
+                            _error(pos, text)
+                        top[0] = _FORM
+                        top[1] = pos
+                        top[2] = text
+                        continue
+                    value = _new(Syn, ('ID', text, pos))
+                elif kind == 'LPAREN':
+                    if top is None or top[0] == _LIST:
+                        top = [_LIST, pos, None, []]
+                    elif top[0] == _PARAMS:
+                        _error(pos, text)
+                    elif top[2] == 'defun' and len(top[3]) == 1:
+                        top = [_PARAMS, pos, None, []]
+                    else:
+                        top = [_LIST, pos, None, []]
+                    stack.append(top)
+                    continue
+                elif kind == 'RPAREN':
+                    if top is None:
+                        _error(pos, text)
+                    value = _close(top, pos)
+                    closed = top[0]
+                    stack.pop()
+                    top = stack[-1] if stack else None
+                    if closed == _PARAMS:
+                        # the defun's parameter list is added as it is
+                        top[3].append(value)
+                        continue
+                elif kind == 'INT':
+                    value = _new(Syn, ('INT', int(text), pos))
+                elif kind == 'FLOAT':
+                    value = _new(Syn, ('FLOAT', float(text), pos))
+                elif kind == 'STRING':
+                    value = _new(Syn, ('STRING', text[1:-1], pos))
+                    newlines = text.count('\n')
+                    if newlines:
+                        line += newlines
+                        line_start = start + text.rfind('\n') + 1
+                elif kind == 'BOOL':
+                    value = _new(Syn, ('BOOL', text == '#t', pos))
+                elif kind == 'SQUOTE':
+                    _error(pos, text)
+                elif text == '"' and more:
+                    # a string that isn't closed yet: read it again, with
+                    # the next chunk
+                    stop = start
+                    break
+                else:
+                    print("Illegal character '%s'" % text)
+                    continue
+                if top is None:
+                    yield value
+                elif top[0] == _LIST:
+                    top[3].append(value)
+                else:
+                    _add(top, value, pos)
+            buf = buf[stop:]
+            line_start -= stop
+        if top is not None:
+            _error(top[1], 'end of input: unclosed list')
+
+
+def _chunks(source, chunk_size):
+    '''
+    :return: the chunks of text in a source (see Reader.read_forms)
+    :rtype: iterable[str]
+    '''
+    if isinstance(source, str):
+        return (source,)
+    if hasattr(source, 'read'):
+        return iter(lambda: source.read(chunk_size), '')
+    return source
+
+
+def _error(pos, what):
+    raise SyntaxError('%s: unexpected %s' % (pos, what))
+
+
+def _add(top, value, pos):
+    '''
+    Add an expression to a defun's or set's list, or to a parameter list,
+    checking that it can go there.
+    '''
+    kind, _, keyword, items = top
+    if kind == _PARAMS:
+        ok = value.type == 'ID'
+    elif not items:
+        ok = value.type == 'ID'
+    elif keyword == 'defun':
+        # a defun's parameter list comes after its name (see Reader.parse)
+        ok = len(items) > 1
+    else:
+        # a set has a single value
+        ok = len(items) == 1
+    if not ok:
+        _error(pos, value.type)
+    items.append(value)
+
+
+def _close(top, pos):
+    '''
+    :return: the expression for a list that has been closed, or the IDs in
+             a defun's parameter list
+    :rtype: Syn or list[Syn]
+    '''
+    kind, start, keyword, items = top
+    if kind == _PARAMS:
+        if not items:
+            _error(pos, ')')
+        return items
+    if kind == _FORM:
+        if keyword == 'defun':
+            if len(items) < 3:
+                _error(pos, ')')
+            body = items[2:]
+            return Syn('DEFUN', {'name': items[0], 'args': items[1],
+                                 'body': Syn('EXPRSEQ', body, body[0].pos)},
+                       start)
+        if len(items) != 2:
+            _error(pos, ')')
+        return Syn('SET', {'name': items[0], 'value': items[1]}, start)
+    if not items:
+        return Syn('LIST', items, start)
+    first = items[0]
+    if first.type == 'ID' and len(items) > 1:
+        args = items[1:]
+        return Syn('FUNC_CALL',
+                   {'name': first, 'arg_exprs': Syn('EXPRSEQ', args,
+                                                    args[0].pos)},
+                   first.pos)
+    return Syn('LIST', items, first.pos)
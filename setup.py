@@ -1,4 +1,29 @@
+import os
+
 from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+class BuildWithTables(build_py):
+    '''
+    Also generate the lexer and parser tables, so that the parser loads them
+    instead of generating them every time a process starts.
+    '''
+
+    def run(self):
+        build_py.run(self)
+        try:
+            from lispy.parser import write_tables
+        except ImportError as e:
+            # the parser will generate its tables when it is first used
+            self.warn('not generating parser tables: %s' % e)
+            return
+        if getattr(self, 'editable_mode', False):
+            outputdir = self.get_package_dir('lispy.parser')
+        else:
+            outputdir = os.path.join(self.build_lib, 'lispy', 'parser')
+        write_tables(outputdir)
+
 
 setup(
     name='lispy',
@@ -11,6 +36,7 @@ setup(
     author_email='dan@codeviking.com, lambethben@gmail.com',
     description='Model lisp-ish interpreter',
     test_suite='nose.collector',
-    tests_require=['nose']
-
+    tests_require=['nose'],
+    install_requires=['ply'],
+    cmdclass={'build_py': BuildWithTables},
 )
@@ -0,0 +1,130 @@
+import asyncio
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from lispy.aio import async_builtin, CHECK_INTERVAL
+from lispy.builtins import global_builtins
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+
+# each fetch takes this long
+DELAY = 0.2
+
+LOOPS = 5 * CHECK_INTERVAL
+
+UNITS = {
+    'sum': '''(begin (set i 0) (set total 0)
+                     (while (!= i %d) (set total (+ total i))
+                                      (set i (+ i 1)))
+                     total)''' % LOOPS,
+    'fetch': '''(+ (fetch 1 2) 1)''',
+    'spin': '''(while #t 0)''',
+    'again': '''(set total (+ total 1))''',
+}
+
+
+@async_builtin
+async def fetchBuiltin(*values):
+    await asyncio.sleep(DELAY)
+    return sum(values)
+
+
+async def plainFetch(*values):
+    await asyncio.sleep(0)
+    return sum(values)
+
+
+BUILTINS = dict(global_builtins, fetch=fetchBuiltin)
+
+
+class TestAsync(unittest.TestCase):
+    def test_run(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None)
+                value = asyncio.run(interpreter.run_module_async('sum'))
+                self.assertEqual(value, sum(range(LOOPS)))
+                value = asyncio.run(interpreter.evaluate_async('again'))
+                self.assertEqual(value, sum(range(LOOPS)) + 1)
+
+    def test_loops_yield(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None)
+                ticks = []
+
+                async def tick():
+                    while True:
+                        ticks.append(None)
+                        await asyncio.sleep(0)
+
+                async def main():
+                    ticker = asyncio.ensure_future(tick())
+                    await asyncio.sleep(0)
+                    del ticks[:]
+                    try:
+                        return await interpreter.run_module_async('sum')
+                    finally:
+                        ticker.cancel()
+
+                asyncio.run(main())
+                # the loop went round at each checkpoint, at least
+                self.assertGreaterEqual(len(ticks),
+                                        LOOPS // CHECK_INTERVAL - 1)
+
+    def test_async_builtins_overlap(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          builtins=BUILTINS, cache=None)
+
+                async def main():
+                    return await asyncio.gather(
+                        *[interpreter.run_module_async('fetch')
+                          for i in range(4)])
+
+                start = time.perf_counter()
+                self.assertEqual(asyncio.run(main()), [4] * 4)
+                self.assertLess(time.perf_counter() - start, 3 * DELAY)
+
+    def test_async_builtin_without_loop(self):
+        interpreter = Interpreter(DictLoader(UNITS), builtins=BUILTINS,
+                                  cache=None)
+        self.assertEqual(interpreter.run_module('fetch'), 4)
+
+    def test_coroutine_functions_are_wrapped(self):
+        builtins = dict(global_builtins, fetch=plainFetch)
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          builtins=builtins, cache=None)
+                self.assertEqual(interpreter.run_module('fetch'), 4)
+                value = asyncio.run(interpreter.run_module_async('fetch'))
+                self.assertEqual(value, 4)
+
+    def test_cancel(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None)
+
+                async def main():
+                    # one worker thread: the next unit only runs if the
+                    # spinning one has stopped
+                    asyncio.get_running_loop().set_default_executor(
+                        ThreadPoolExecutor(1))
+                    with self.assertRaises(asyncio.TimeoutError):
+                        await asyncio.wait_for(
+                            interpreter.run_module_async('spin'), 0.1)
+                    return await asyncio.wait_for(
+                        interpreter.run_module_async('sum'), 10)
+
+                self.assertEqual(asyncio.run(main()), sum(range(LOOPS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
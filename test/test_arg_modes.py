@@ -0,0 +1,79 @@
+import unittest
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.scope import Scope, MemoArgExpr, ARG_MODES
+from lispy.interpreter.frame import MemoThunk
+from lispy.common import TokenPos
+
+from .test_sources import TEST_RESULT
+from .util import run_printed
+
+dummy_pos = TokenPos('TEST', 0, 0)
+
+
+class Counter(object):
+    def __init__(self):
+        self.count = 0
+
+    def evaluate(self, scope=None):
+        self.count += 1
+        return self.count
+
+
+class TestArgModes(unittest.TestCase):
+    def test_unknown_mode(self):
+        self.assertRaises(ValueError, Interpreter, DictLoader({}),
+                          arg_mode='by-magic')
+
+    def test_results(self):
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                for (source, result) in TEST_RESULT:
+                    if isinstance(source, str):
+                        source = {'main': source}
+                    interp = Interpreter(DictLoader(source), engine=engine,
+                                         arg_mode=arg_mode)
+                    self.assertEqual(interp.run_module('main'), result)
+
+    def test_evaluation_count(self):
+        used_twice = '((defun f (x) (+ x x)) (f (print 2)))'
+        unused = '((defun g (x) 0) (g (print 2)))'
+        for engine in ENGINES:
+            self.assertEqual(run_printed(used_twice, engine, 'name'),
+                             ([None, 4], ['2', '2']))
+            self.assertEqual(run_printed(used_twice, engine, 'need'),
+                             ([None, 4], ['2']))
+            self.assertEqual(run_printed(used_twice, engine, 'strict'),
+                             ([None, 4], ['2']))
+            self.assertEqual(run_printed(unused, engine, 'need'),
+                             ([None, 0], []))
+            self.assertEqual(run_printed(unused, engine, 'strict'),
+                             ([None, 0], ['2']))
+
+    def test_nested_calls(self):
+        # each level doubles the number of uses of the argument
+        source = '((defun d (x) (+ x x)) %s(print 1)%s)' % ('(d ' * 10,
+                                                             ')' * 10)
+        for engine in ENGINES:
+            self.assertEqual(run_printed(source, engine, 'need'),
+                             ([None, 1024], ['1']))
+
+
+class TestMemo(unittest.TestCase):
+    def test_memo_arg_expr(self):
+        counter = Counter()
+        arg = MemoArgExpr(Scope(dummy_pos), counter)
+        self.assertEqual([arg.evaluate(), arg.evaluate()], [1, 1])
+        self.assertEqual(counter.count, 1)
+
+    def test_memo_thunk(self):
+        counter = Counter()
+        thunk = MemoThunk(None, counter.evaluate)
+        self.assertEqual([thunk.force(), thunk.force()], [1, 1])
+        self.assertEqual(counter.count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
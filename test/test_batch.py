@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lispy.batch import run_batch, BatchResult
+
+UNITS = {
+    'prelude': '(begin (set base 100) (defun sq (x) (* x x)))',
+    'leak': '(set base 0)',
+    'fn': '(begin (defun g (x) x) g)',
+}
+
+
+class TestBatch(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        for (name, text) in UNITS.items():
+            with open(os.path.join(cls.dir, name), 'w') as f:
+                f.write(text)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def run_batch(self, jobs, **kwargs):
+        return list(run_batch(jobs, [self.dir], processes=2, chunksize=3,
+                              **kwargs))
+
+    def test_ordered(self):
+        jobs = [('u%d' % i, '(+ base (sq %d))' % i) for i in range(20)]
+        self.assertEqual(self.run_batch(jobs, prelude='prelude'),
+                         [BatchResult('u%d' % i, 100 + i * i, None)
+                          for i in range(20)])
+
+    def test_unordered(self):
+        jobs = [('u%d' % i, '(sq %d)' % i) for i in range(20)]
+        results = self.run_batch(jobs, prelude='prelude', ordered=False,
+                                 engine='vm', parser='reader')
+        self.assertEqual(sorted(r.value for r in results),
+                         [i * i for i in range(20)])
+
+    def test_isolated(self):
+        # each unit starts from the prelude's snapshot
+        jobs = ['leak', ('u', 'base')] * 4
+        results = self.run_batch(jobs, prelude='prelude')
+        self.assertEqual([r.value for r in results], [0, 100] * 4)
+
+    def test_errors(self):
+        results = self.run_batch(['fn', 'missing', ('bad', '(f 1')])
+        self.assertEqual(results[0].unit, 'fn')
+        self.assertIsInstance(results[0].value, str)
+        self.assertIsNone(results[0].error)
+        self.assertIn('missing', results[1].error)
+        self.assertIsNotNone(results[2].error)
+
+    def test_prelude_error(self):
+        results = self.run_batch([('u', '1')], prelude='missing')
+        self.assertIn('prelude missing failed', results[0].error)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import time
+import unittest
+
+from lispy.common import TokenPos
+from lispy.interpreter import Interpreter
+from lispy.interpreter.budget import Budget, Meter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.error import BudgetExceededError, LispyError
+from lispy.interpreter.loader import DictLoader
+
+UNITS = {
+    # ten steps
+    'loop': '''(begin (set i 0)
+                      (while (!= i 10) (set i (+ i 1)))
+                      i)''',
+    # eleven steps
+    'count': '''(begin (defun down (n) (if (= n 0) 0 (down (- n 1))))
+                       (down 10))''',
+    'spin': '''(while #t 0)''',
+    'recurse': '''(begin (defun f (n) (f n)) (f 1))''',
+    'lists': '''(while #t (1 2))''',
+}
+
+
+class TestBudget(unittest.TestCase):
+    def run_unit(self, engine, unit_name, **limits):
+        interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                  cache=None, budget=Budget(**limits))
+        return interpreter.run_module(unit_name)
+
+    def assertExceeds(self, limit, engine, unit_name, **limits):
+        with self.assertRaises(BudgetExceededError) as cm:
+            self.run_unit(engine, unit_name, **limits)
+        self.assertIsInstance(cm.exception, LispyError)
+        self.assertEqual(cm.exception.limit, limit)
+        self.assertIsInstance(cm.exception.pos, TokenPos)
+        self.assertEqual(cm.exception.pos.unit_name, unit_name)
+
+    def test_steps(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(self.run_unit(engine, 'loop', max_steps=10),
+                                 10)
+                self.assertExceeds('steps', engine, 'loop', max_steps=9)
+                self.assertEqual(
+                    self.run_unit(engine, 'count', max_steps=11), 0)
+                self.assertExceeds('steps', engine, 'count', max_steps=10)
+                self.assertExceeds('steps', engine, 'spin', max_steps=5000)
+
+    def test_time(self):
+        for engine in ENGINES:
+            # the tree engine doesn't eliminate tail calls
+            units = ('spin',) if engine == 'tree' else ('spin', 'recurse')
+            for unit_name in units:
+                with self.subTest(engine=engine, unit=unit_name):
+                    start = time.monotonic()
+                    self.assertExceeds('time', engine, unit_name,
+                                       time_limit=0.05)
+                    self.assertLess(time.monotonic() - start, 5)
+
+    def test_allocations(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                self.assertExceeds('allocations', engine, 'lists',
+                                   max_allocations=100)
+                self.assertExceeds('allocations', engine, 'count',
+                                   max_allocations=5)
+
+    def test_runs_have_their_own_meters(self):
+        interpreter = Interpreter(DictLoader(UNITS), cache=None,
+                                  budget=Budget(max_steps=10))
+        for i in range(3):
+            self.assertEqual(interpreter.run_module('loop'), 10)
+
+    def test_meter(self):
+        meter = Meter(Budget(max_steps=2000))
+        for i in range(1500):
+            meter.fuel -= 1
+            if meter.fuel < 0:
+                meter.refuel(None)
+        self.assertEqual(meter.steps, 1500)
+        meter.space -= 3
+        self.assertEqual(meter.allocations, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
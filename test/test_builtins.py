@@ -0,0 +1,70 @@
+import unittest
+
+from lispy.builtins import global_builtins, strict
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.scope import ARG_MODES
+from lispy.interpreter.snapshot import Snapshot
+
+UNITS = {
+    'logic': '''((and 1 2) (and 1 0) (and 1) (or 0 1) (or 0 0) (or 0)
+                 (or 1 0 0) (and 1 1 0))''',
+    'short': '''(begin (defun f (x) (or x (undefined)))
+                       (set n 0)
+                       (or (set n 1) (set n 2))
+                       ((and 0 (undefined)) (or 1 (undefined)) (f 1) n))''',
+    'record': '''(begin (defun f (x) (record x (+ x 1)))
+                        ((record 0) (record 1 "two") (f (* 2 3))))''',
+    'myif': '(defun if (a b c) c)',
+    'rebound': '''(begin (defun g (n) (if n 2 3))
+                         (load "myif")
+                         ((if 1 2 3) (g 1)))''',
+}
+
+
+@strict
+def recordBuiltin(parent_scope, *values):
+    return list(values)
+
+
+class TestBuiltins(unittest.TestCase):
+    def run_unit(self, unit_name, **kwargs):
+        results = []
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode, **kwargs):
+                    interpreter = Interpreter(DictLoader(UNITS),
+                                              engine=engine,
+                                              arg_mode=arg_mode, cache=None,
+                                              **kwargs)
+                    snapshot = Snapshot(interpreter.engine.name, arg_mode,
+                                        dict(global_builtins,
+                                             record=recordBuiltin), dict())
+                    results.append(interpreter.run_module(unit_name,
+                                                          snapshot))
+        return results
+
+    def assertRuns(self, unit_name, expected, **kwargs):
+        for value in self.run_unit(unit_name, **kwargs):
+            self.assertEqual(value, expected)
+
+    def test_and_or(self):
+        self.assertRuns('logic', [True, False, True, True, False, False,
+                                  True, False])
+
+    def test_short_circuit(self):
+        self.assertRuns('short', [False, True, True, 1])
+
+    def test_strict(self):
+        expected = [[0], [1, 'two'], [6, 7]]
+        self.assertRuns('record', expected)
+        # wrapped by the profiler
+        self.assertRuns('record', expected, profile=True)
+
+    def test_special_form_rebound(self):
+        self.assertRuns('rebound', [3, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
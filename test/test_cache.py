@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from lispy.interpreter import Interpreter, cache
+from lispy.interpreter.cache import UnitCache
+from lispy.interpreter.loader import DictLoader
+
+LIB = '''(begin
+           (defun double (x) (* x 2))
+           (double 21))'''
+
+
+def run(units, unit_cache, engine='closure', unit='main'):
+    return Interpreter(DictLoader(units), engine=engine,
+                       cache=unit_cache).run_module(unit)
+
+
+class TestMemoryCache(unittest.TestCase):
+    def test_hit(self):
+        c = UnitCache()
+        self.assertEqual(run({'main': LIB}, c), 42)
+        self.assertEqual(run({'main': LIB}, c), 42)
+        self.assertEqual((c.misses, c.hits), (1, 1))
+
+    def test_changed_source(self):
+        c = UnitCache()
+        run({'main': LIB}, c)
+        self.assertEqual(run({'main': LIB.replace('21', '5')}, c), 10)
+        self.assertEqual((c.misses, c.hits), (2, 0))
+
+    def test_engines_kept_apart(self):
+        c = UnitCache()
+        for engine in ('tree', 'closure', 'vm'):
+            self.assertEqual(run({'main': LIB}, c, engine), 42)
+        self.assertEqual(c.misses, 3)
+
+    def test_load(self):
+        c = UnitCache()
+        units = {'main': '((load "lib") (reload "lib"))', 'lib': LIB}
+        self.assertEqual(run(units, c), [42, 42])
+        self.assertEqual((c.misses, c.hits), (2, 1))
+
+    def test_lru(self):
+        c = UnitCache(maxsize=1)
+        units = {'a': LIB, 'b': LIB}
+        for unit in ('a', 'b', 'a'):
+            run(units, c, unit=unit)
+        self.assertEqual(c.misses, 3)
+        run(units, c, unit='a')
+        self.assertEqual(c.hits, 1)
+
+    def test_no_cache(self):
+        self.assertEqual(run({'main': LIB}, None), 42)
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = os.path.join(tempfile.mkdtemp(), 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.dir))
+
+    def test_hit(self):
+        for engine in ('closure', 'vm'):
+            self.assertEqual(run({'main': LIB}, UnitCache(directory=self.dir),
+                                 engine), 42)
+            c = UnitCache(directory=self.dir)
+            self.assertEqual(run({'main': LIB}, c, engine), 42)
+            self.assertEqual((c.misses, c.disk_hits), (0, 1))
+
+    def test_changed_source(self):
+        run({'main': LIB}, UnitCache(directory=self.dir))
+        c = UnitCache(directory=self.dir)
+        self.assertEqual(run({'main': LIB.replace('21', '5')}, c), 10)
+        self.assertEqual((c.misses, c.disk_hits), (1, 0))
+
+    def test_version(self):
+        run({'main': LIB}, UnitCache(directory=self.dir), 'vm')
+        c = UnitCache(directory=self.dir)
+        with mock.patch.object(cache, '__version__', 'next'):
+            self.assertEqual(run({'main': LIB}, c, 'vm'), 42)
+        self.assertEqual((c.misses, c.disk_hits), (1, 0))
+
+    def test_damaged_file(self):
+        run({'main': LIB}, UnitCache(directory=self.dir))
+        for name in os.listdir(self.dir):
+            with open(os.path.join(self.dir, name), 'wb') as f:
+                f.write(b'\x80\x04garbage')
+        c = UnitCache(directory=self.dir)
+        self.assertEqual(run({'main': LIB}, c), 42)
+        self.assertEqual(c.misses, 1)
+        c = UnitCache(directory=self.dir)
+        run({'main': LIB}, c)
+        self.assertEqual(c.disk_hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -130,6 +130,46 @@ class TestFunctionCall(unittest.TestCase):
             funcCall = FunctionCall(dummy_pos, ID(x), [])
             self.assertEqual(funcCall.evaluate(scope), x)
 
+    def test_cache(self):
+        def makeDef(x):
+            return FuncExpression(lambda scope, *args: x)
+
+        scope = Scope(dummy_pos)
+        child = Scope(dummy_pos, scope)
+        scope.assign(ID('f'), makeDef(1))
+        funcCall = FunctionCall(dummy_pos, ID('f'), [])
+        self.assertEqual(funcCall.evaluate(child), 1)
+        cell = scope.cells['f']
+        self.assertEqual(cell.version, 0)
+        self.assertEqual(funcCall.evaluate(child), 1)
+
+        # rebinding the global changes the version
+        child.assign(ID('f'), makeDef(2))
+        self.assertEqual(cell.version, 1)
+        self.assertEqual(funcCall.evaluate(child), 2)
+
+        # a local binding stops the name being remembered
+        child.create_local(ID('f'), makeDef(3))
+        self.assertIsNone(cell.version)
+        self.assertEqual(funcCall.evaluate(child), 3)
+        self.assertEqual(funcCall.evaluate(scope), 2)
+
+        # another run has cells of its own
+        other = Scope(dummy_pos)
+        other.assign(ID('f'), makeDef(4))
+        self.assertEqual(funcCall.evaluate(other), 4)
+        self.assertEqual(other.cells['f'].version, 0)
+
+    def test_shadowed_before_cached(self):
+        scope = Scope(dummy_pos)
+        child = Scope(dummy_pos, scope)
+        child.create_local(ID('g'), FuncExpression(lambda scope: 'local'))
+        scope.assign(ID('g'), FuncExpression(lambda scope: 'global'))
+        funcCall = FunctionCall(dummy_pos, ID('g'), [])
+        self.assertEqual(funcCall.evaluate(scope), 'global')
+        self.assertEqual(funcCall.evaluate(child), 'local')
+        self.assertIsNone(scope.cells['g'].version)
+
 
 class TestSet(unittest.TestCase):
     def test_evaluate(self):
@@ -0,0 +1,121 @@
+import unittest
+
+from lispy.interpreter import make_datum
+from lispy.builtins import global_builtins
+from lispy.interpreter.compiler import compile_datum, CompiledExpr, \
+    SPECIALIZE_AFTER
+from lispy.interpreter.engine import make_engine, ENGINES
+from lispy.interpreter.frame import GlobalEnv
+from lispy.interpreter.datatypes import StaticDatum, FunctionCall
+from lispy.common import Syn, TokenPos
+from lispy.parser import LispyParser
+
+from .test_sources import TEST_RESULT
+from .util import run
+
+dummy_pos = TokenPos('TEST', 0, 0)
+
+#: extra programs used to compare the engines against each other
+EXTRA_SOURCES = (
+    '''(begin (set i 0) (set total 0)
+              (while (!= i 10) (set total (+ total i)) (set i (+ i 1)))
+              total)''',
+    '''((defun f (x) (set y (* x 2)) (+ y x))
+        (f 3)
+        (set y 1)
+        (f 4)
+        y)''',
+    '''((defun twice (x) (+ x x))
+        (twice (twice (twice 1.5))))''',
+    '''(begin (defun inc (n) (set counter (+ counter n)))
+              (set counter 0)
+              (inc 2) (inc 3) counter)''',
+)
+
+
+class TestEngines(unittest.TestCase):
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, make_engine, 'no-such-engine')
+
+    def test_results(self):
+        for engine in ENGINES:
+            for (source, result) in TEST_RESULT:
+                self.assertEqual(run(source, engine), result)
+
+    def test_differential(self):
+        for source in EXTRA_SOURCES:
+            expected = run(source, 'tree')
+            for engine in ENGINES:
+                self.assertEqual(run(source, engine), expected)
+
+
+class TestCompiledExpr(unittest.TestCase):
+    def test_builtin_args(self):
+        # builtins receive CompiledExprs and call evaluate on them
+        seen = []
+
+        def builtin(scope, *args):
+            seen.extend(args)
+            return [a.evaluate(scope) for a in args]
+
+        frame = GlobalEnv({'b': builtin}, {}, None).top_frame()
+        call = FunctionCall(dummy_pos, Syn('ID', 'b', dummy_pos),
+                            [StaticDatum(dummy_pos, 1),
+                             StaticDatum(dummy_pos, 'two')])
+        code = compile_datum(call)
+        self.assertEqual(code.evaluate(frame), [1, 'two'])
+        self.assertTrue(all(isinstance(a, CompiledExpr) for a in seen))
+        self.assertEqual([a.value for a in seen], [1, 'two'])
+
+    def test_compiled_once(self):
+        ast = LispyParser().parse('main', '((defun f (x) (+ x 1)) (f 1))')
+        code = compile_datum(make_datum(ast))
+        plus = lambda s, *a: sum(x.evaluate(s) for x in a)
+        for i in range(3):
+            frame = GlobalEnv({'+': plus}, {}, None).top_frame()
+            self.assertEqual(code.evaluate(frame), [None, 2])
+
+
+class TestTypeFeedback(unittest.TestCase):
+    def call(self, code, x, y, builtins=global_builtins):
+        frame = GlobalEnv(dict(builtins, x=x, y=y), {}, None).top_frame()
+        return code.evaluate(frame)
+
+    def check(self, name, pairs):
+        code = compile_datum(make_datum(LispyParser().parse(
+            'main', '(%s x y)' % name)))
+        builtin = global_builtins[name]
+        for (x, y) in pairs:
+            expected = builtin(None, x, y)
+            result = self.call(code, x, y)
+            self.assertEqual((type(result), result), (type(expected),
+                                                      expected))
+
+    def test_specialized(self):
+        ints = [(i, 3) for i in range(-5, SPECIALIZE_AFTER + 5)]
+        floats = [(i / 2, 1.5) for i in range(-5, SPECIALIZE_AFTER + 5)]
+        for name in ('+', '-', '*', '/', '=', '!=', '<', '>', '<=', '>='):
+            with self.subTest(name=name):
+                # a new type deoptimizes the call
+                self.check(name, ints + floats + [(1, 2.5), (True, 2)])
+                self.check(name, floats + ints)
+
+    def test_negative_zero(self):
+        code = compile_datum(make_datum(LispyParser().parse('main',
+                                                            '(+ x y)')))
+        for i in range(SPECIALIZE_AFTER + 1):
+            self.call(code, 1.0, 2.0)
+        self.assertEqual(str(self.call(code, -0.0, -0.0)), '0.0')
+
+    def test_rebound(self):
+        code = compile_datum(make_datum(LispyParser().parse('main',
+                                                            '(+ x y)')))
+        for i in range(SPECIALIZE_AFTER + 1):
+            self.assertEqual(self.call(code, i, 1), i + 1)
+        minus = lambda s, a, b: a.evaluate(s) - b.evaluate(s)
+        self.assertEqual(self.call(code, 5, 1, {'+': minus}), 4)
+        self.assertEqual(self.call(code, 5, 1), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
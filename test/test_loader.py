@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.error import UnitNotFoundError
+from lispy.interpreter.loader import FileSysLoader, CachedFileSysLoader
+
+
+class LoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.dirs = [os.path.join(self.root, d) for d in ('a', 'b')]
+        for d in self.dirs:
+            os.mkdir(d)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, d, name, text, mtime_ns=None):
+        path = os.path.join(self.dirs[d], name)
+        with open(path, 'w') as f:
+            f.write(text)
+        if mtime_ns is not None:
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+        return path
+
+
+class TestFileSysLoader(LoaderTest):
+    def test_closes_file(self):
+        self.write(1, 'unit', '(f 1)')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', ResourceWarning)
+            self.assertEqual(FileSysLoader(self.dirs).load_unit('unit'),
+                             '(f 1)')
+
+
+class TestCachedFileSysLoader(LoaderTest):
+    def test_load(self):
+        self.write(1, 'unit', '(f 1)\r\n(g "é")')
+        loader = CachedFileSysLoader(self.dirs)
+        self.assertEqual(loader.load_unit('unit'), '(f 1)\n(g "é")')
+        self.write(1, 'empty', '')
+        self.assertEqual(loader.load_unit('empty'), '')
+        with loader.open_unit('unit') as f:
+            self.assertEqual(f.read(), '(f 1)\n(g "é")')
+
+    def test_changed(self):
+        self.write(1, 'unit', '(f 1)', 10 ** 18)
+        loader = CachedFileSysLoader(self.dirs)
+        self.assertEqual(loader.load_unit('unit'), '(f 1)')
+        self.write(1, 'unit', '(f 2)', 10 ** 18)
+        # the same modification time and size: it's assumed not to change
+        self.assertEqual(loader.load_unit('unit'), '(f 1)')
+        self.write(1, 'unit', '(f 3)', 10 ** 18 + 1)
+        self.assertEqual(loader.load_unit('unit'), '(f 3)')
+        self.write(1, 'unit', '(f 33)', 10 ** 18 + 1)
+        self.assertEqual(loader.load_unit('unit'), '(f 33)')
+
+    def test_shadowed(self):
+        self.write(1, 'unit', '(f 1)')
+        loader = CachedFileSysLoader(self.dirs)
+        self.assertEqual(loader.load_unit('unit'), '(f 1)')
+        self.write(0, 'unit', '(f 0)')
+        self.assertEqual(loader.load_unit('unit'), '(f 0)')
+        os.remove(os.path.join(self.dirs[0], 'unit'))
+        self.assertEqual(loader.load_unit('unit'), '(f 1)')
+
+    def test_not_found(self):
+        loader = CachedFileSysLoader(self.dirs)
+        self.assertRaises(UnitNotFoundError, loader.load_unit, 'unit')
+        self.assertRaises(UnitNotFoundError, loader.open_unit, 'unit')
+        self.write(1, 'unit', '(f 1)')
+        self.assertEqual(loader.load_unit('unit'), '(f 1)')
+
+    def test_stats(self):
+        self.write(1, 'unit', '(f 1)')
+        for (ttl, stats) in ((0, 2), (3600, 0)):
+            loader = CachedFileSysLoader(self.dirs, ttl)
+            loader.load_unit('unit')
+            with mock.patch('os.stat', wraps=os.stat) as stat, \
+                    mock.patch('builtins.open') as open_:
+                for i in range(5):
+                    loader.load_unit('unit')
+            # the unit's file and the directory before it are stat'd
+            self.assertEqual(stat.call_count, 5 * stats)
+            open_.assert_not_called()
+
+    def test_interpreter(self):
+        self.write(0, 'main', '((load "lib") (load "lib"))')
+        self.write(1, 'lib', '(defun double (x) (* x 2))\n')
+        loader = CachedFileSysLoader(self.dirs)
+        self.assertEqual(Interpreter(loader, cache=None).run_module('main'),
+                         [None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
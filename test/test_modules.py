@@ -0,0 +1,100 @@
+import unittest
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.error import LispyError
+from lispy.interpreter.loader import DictLoader
+
+# counts the times it is run
+LIB = '''(begin
+           (set runs (+ runs 1))
+           (defun double (x) (* x 2))
+           runs)'''
+
+
+class CountingLoader(DictLoader):
+    def __init__(self, units):
+        super().__init__(units)
+        self.loads = 0
+
+    def load_unit(self, unit_name, pos=None):
+        self.loads += 1
+        return super().load_unit(unit_name, pos)
+
+
+def run(main, engine, units=None):
+    units = dict(units or {'lib': LIB}, main=main)
+    loader = CountingLoader(units)
+    interpreter = Interpreter(loader, engine=engine, cache=None)
+    return interpreter.run_module('main'), interpreter, loader
+
+
+class TestModules(unittest.TestCase):
+    def test_load_once(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result, interpreter, loader = run(
+                    '''(begin (set runs 0)
+                              (load "lib") (load "lib" "lib")
+                              (double runs))''', engine)
+                self.assertEqual(result, 2)
+                self.assertEqual(loader.loads, 4)
+                module = interpreter.modules['lib']
+                self.assertTrue(module.loaded)
+                self.assertEqual(module.value, 1)
+                self.assertEqual(sorted(module.exports), ['double', 'runs'])
+
+    def test_reload(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result, interpreter, loader = run(
+                    '''(begin (set runs 0)
+                              (load "lib") (reload "lib") (load "lib")
+                              runs)''', engine)
+                self.assertEqual(result, 2)
+
+    def test_require(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result, interpreter, loader = run(
+                    '''(begin (set runs 0)
+                              (require "lib") (require "lib")
+                              (+ runs (load "lib")))''', engine)
+                self.assertEqual(result, 2)
+                # main, lib, then lib again for the load
+                self.assertEqual(loader.loads, 3)
+
+    def test_changed_source(self):
+        result, interpreter, loader = run(
+            '''(begin (set runs 0) (load "lib") runs)''', 'closure')
+        loader._units['lib'] = LIB.replace('runs)', '(+ runs 10))')
+        self.assertEqual(interpreter.require_unit('lib'), 1)
+        self.assertEqual(interpreter.load_unit('lib'), 12)
+        self.assertEqual(interpreter.load_unit('lib'), 12)
+
+    def test_cycle(self):
+        units = {'a': '(begin (load "b") (set a 1))',
+                 'b': '(begin (load "a") (load "main") (set b 2))'}
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                result, interpreter, loader = run(
+                    '(begin (load "a") (+ a b))', engine, units)
+                self.assertEqual(result, 3)
+                self.assertEqual(sorted(interpreter.modules),
+                                 ['a', 'b', 'main'])
+
+    def test_failure(self):
+        result, interpreter, loader = run('(set runs 0)', 'closure',
+                                          {'bad': '(begin (f) (g 1))'})
+        self.assertRaises(LispyError, interpreter.load_unit, 'bad')
+        self.assertNotIn('bad', interpreter.modules)
+
+    def test_run_module_resets(self):
+        result, interpreter, loader = run('(begin (set runs 0) (load "lib"))',
+                                          'closure')
+        self.assertEqual(result, 1)
+        self.assertEqual(interpreter.run_module('main'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
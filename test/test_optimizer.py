@@ -0,0 +1,344 @@
+import unittest
+from unittest import mock
+
+from lispy.builtins import global_builtins
+from lispy.builtins.builtins import ifBuiltin, whileBuiltin, beginBuiltin, \
+    andBuiltin, orBuiltin
+from lispy.interpreter import Interpreter, make_datum
+from lispy.interpreter.budget import Budget
+from lispy.interpreter.datatypes import StaticDatum, VarRef, FunctionCall, \
+    FunctionDef, Folded, Inlined, SpecialForm
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.error import BudgetExceededError
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.optimizer import optimize
+from lispy.interpreter.scope import ARG_MODES
+from lispy.interpreter.snapshot import Snapshot
+from lispy.parser import LispyParser
+
+UNITS = {
+    'arith': '(begin (set x (+ 1 (* 2 3))) (- x (/ 9 (+ 1 2))))',
+    'if': '(begin (defun f (n) (if (= 2 2) (+ n 1) (undefined n))) (f 4))',
+    'begin': '(begin 1 "two" (set y 3) (* y 2))',
+    'while': '(begin (set n 5) (while (= 1 2) (set n 6)) n)',
+    'rebound': '(begin (defun + (a b) 0) (+ 1 2))',
+    'zero': '(begin (if (= 0 1) (/ 1 0) 7))',
+    'plus': '(+ 1 2)',
+    'other': '(begin (load "minus") (+ 1 2))',
+    'minus': '(begin (defun + (a b) (- a b)) 0)',
+    'square': '''(begin (defun sq (x) (* x x))
+                         (defun f (n) (+ (sq n) (sq 3)))
+                         (f 4))''',
+    'redefined': '''(begin (defun sq (x) (* x x))
+                            (defun f (n) (sq n))
+                            (load "cube")
+                            (f 2))''',
+    'cube': '(defun sq (x) (* x (* x x)))',
+    'pick': '''(begin (defun pick (x) (if x 1 2))
+                       (defun f (n) (+ (pick n) (pick 0)))
+                       (f 5))''',
+}
+
+
+def parse(source):
+    return make_datum(LispyParser().parse('main', source))
+
+
+def minusBuiltin(parent_scope, a, b):
+    return a.evaluate(parent_scope) - b.evaluate(parent_scope)
+
+
+class TestOptimize(unittest.TestCase):
+    def test_pure(self):
+        folded = optimize(parse('(+ 1 (* 2 3))'))
+        self.assertIs(type(folded), Folded)
+        self.assertIs(type(folded.fast), StaticDatum)
+        self.assertEqual(folded.fast.value, 7)
+        self.assertEqual([(r.name.value, b) for (r, b) in folded.guards],
+                         [('+', global_builtins['+']),
+                          ('*', global_builtins['*'])])
+        # the call as written, with its argument folded
+        self.assertIs(type(folded.slow), FunctionCall)
+        self.assertIs(type(folded.slow.arg_exprs[1]), Folded)
+
+    def test_if(self):
+        folded = optimize(parse('(if (= 2 2) x (y 1))'))
+        self.assertIs(type(folded.fast), VarRef)
+        self.assertEqual(folded.fast.name.value, 'x')
+        folded = optimize(parse('(if 0 x (y 1))'))
+        self.assertIs(type(folded.fast), FunctionCall)
+        self.assertEqual([r.name.value for (r, b) in folded.guards], ['if'])
+
+    def test_begin_and_while(self):
+        self.assertEqual(optimize(parse('(begin 1 2 (+ 1 2))')).fast.value,
+                         3)
+        folded = optimize(parse('(while (= 1 2) (print 1))'))
+        self.assertIs(type(folded.fast), StaticDatum)
+        self.assertIsNone(folded.fast.value)
+        # the condition isn't constant: left as it is
+        datum = parse('(while x (print 1))')
+        self.assertIs(optimize(datum).call, datum)
+
+    def test_not_folded(self):
+        for source in ('(+ 1 x)', '(/ 1 0)', '(print 1)',
+                       '(begin (set begin 1) (begin 1 2))'):
+            with self.subTest(source=source):
+                datum = parse(source)
+                self.assertIs(optimize(datum), datum)
+        # a special form, but nothing folded
+        datum = parse('(begin (defun f (if) (if 1 2 3)) 0)')
+        self.assertIs(optimize(datum).call, datum)
+
+    def test_special_forms(self):
+        for (source, builtin) in (('(if x 1 2)', ifBuiltin),
+                                  ('(while x 1)', whileBuiltin),
+                                  ('(begin (print 1) x)', beginBuiltin),
+                                  ('(and x y)', andBuiltin),
+                                  ('(or x y)', orBuiltin)):
+            with self.subTest(source=source):
+                datum = parse(source)
+                form = optimize(datum)
+                self.assertIs(type(form), SpecialForm)
+                self.assertIs(form.builtin, builtin)
+                self.assertIs(form.call, datum)
+        # not a number of arguments the builtin takes
+        datum = parse('(if x 1)')
+        self.assertIs(optimize(datum), datum)
+
+    def test_nested(self):
+        unit = optimize(parse('(defun f (n) (+ n (* 2 3)))'))
+        self.assertIs(type(unit), FunctionDef)
+        call, = unit.body.items
+        self.assertIs(type(call), FunctionCall)
+        self.assertEqual(call.arg_exprs[1].fast.value, 6)
+
+    def test_engines(self):
+        # the tree engine walks units as written
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(
+                    DictLoader({'main': '(if 1 (+ 1 2) 0)'}), engine=engine,
+                    cache=None)
+                with mock.patch('lispy.interpreter.optimize',
+                                wraps=optimize) as optimizer:
+                    self.assertEqual(interpreter.run_module('main'), 3)
+                self.assertEqual(optimizer.called, engine != 'tree')
+
+
+class TestInline(unittest.TestCase):
+    def calls(self, source):
+        '''
+        :return: the calls in the body of the last function of source
+        '''
+        begin = optimize(parse(source))
+        call, = begin.arg_exprs[-1].body.items
+        return call
+
+    def test_inlined(self):
+        call = self.calls('''(begin (defun sq (x) (* x x))
+                                    (defun f (n) (sq n)))''')
+        self.assertIs(type(call), Inlined)
+        self.assertEqual(call.func.name.value, 'sq')
+        self.assertEqual([(r.name.value, b) for (r, b) in call.guards],
+                         [('*', global_builtins['*'])])
+        self.assertIs(type(call.call), FunctionCall)
+        # the argument in place of the parameter
+        self.assertEqual([a.name.value for a in call.body.arg_exprs],
+                         ['n', 'n'])
+
+    def test_folded_again(self):
+        call = self.calls('''(begin (defun sq (x) (* x x))
+                                    (defun f (n) (sq 3)))''')
+        self.assertIs(type(call.body), Folded)
+        self.assertEqual(call.body.fast.value, 9)
+
+    def test_special_form_body(self):
+        call = self.calls('''(begin (defun pick (x) (if x 1 2))
+                                    (defun f (n) (pick n)))''')
+        self.assertIs(type(call), Inlined)
+        self.assertIs(type(call.body), SpecialForm)
+        call = self.calls('''(begin (defun pick (x) (if x 1 2))
+                                    (defun f (n) (pick 0)))''')
+        self.assertEqual(call.body.fast.value, 2)
+
+    def test_not_inlined(self):
+        for source in (
+                # an argument that isn't a constant or a parameter
+                '''(begin (defun sq (x) (* x x))
+                          (defun f (n) (sq (+ n 1))))''',
+                # recursive
+                '''(begin (defun sq (x) (if x (sq 0) 1))
+                          (defun f (n) (sq n)))''',
+                # bound twice
+                '''(begin (defun sq (x) (* x x))
+                          (set sq 0)
+                          (defun f (n) (sq n)))''',
+                # too big
+                '''(begin (defun sq (x) (+ (* x (* x (* x (* x x))))
+                                             (* x (* x (* x (* x x))))))
+                          (defun f (n) (sq n)))''',
+                # more than one expression
+                '''(begin (defun sq (x) (print x) (* x x))
+                          (defun f (n) (sq n)))''',
+                # a name bound by the caller
+                '''(begin (defun sq (x) (* x n))
+                          (defun f (n) (sq n)))'''):
+            with self.subTest(source=source):
+                self.assertIs(type(self.calls(source)), FunctionCall)
+
+    def test_rebound_builtin(self):
+        unit = optimize(parse('(begin (defun + (a b) 0) (+ 1 2))'))
+        call = unit.arg_exprs[1]
+        self.assertIs(type(call), Inlined)
+        self.assertEqual(call.body.value, 0)
+        self.assertEqual(call.guards, ())
+
+
+class TestInlinedRuns(unittest.TestCase):
+    def least(self, engine, arg_mode, unit_name, limit):
+        '''
+        :return: the least value of limit that unit_name runs within
+        '''
+        for n in range(100):
+            interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                      arg_mode=arg_mode, cache=None,
+                                      budget=Budget(**{limit: n}))
+            try:
+                interpreter.run_module(unit_name)
+            except BudgetExceededError:
+                continue
+            return n
+
+    def test_engines_agree(self):
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          arg_mode=arg_mode, cache=None)
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    self.assertEqual(interpreter.run_module('square'), 25)
+                    self.assertEqual(interpreter.run_module('pick'), 3)
+                    # the function is defined again by another unit
+                    self.assertEqual(interpreter.run_module('redefined'), 8)
+
+    def test_budget(self):
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                for limit in ('max_steps', 'max_allocations'):
+                    with self.subTest(engine=engine, arg_mode=arg_mode,
+                                      limit=limit):
+                        inlined = self.least(engine, arg_mode, 'square',
+                                             limit)
+                        with mock.patch(
+                                'lispy.interpreter.optimizer.INLINE_SIZE', 0):
+                            called = self.least(engine, arg_mode, 'square',
+                                                limit)
+                        self.assertIsNotNone(inlined)
+                        self.assertEqual(inlined, called)
+
+
+class TestFoldedRuns(unittest.TestCase):
+    def test_engines_agree(self):
+        expected = dict(arith=4, begin=6, zero=7, rebound=0, plus=3,
+                        other=-1)
+        expected['if'] = 5
+        expected['while'] = 5
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          arg_mode=arg_mode, cache=None)
+                for (name, value) in sorted(expected.items()):
+                    with self.subTest(engine=engine, arg_mode=arg_mode,
+                                      unit=name):
+                        self.assertEqual(interpreter.run_module(name), value)
+
+    def test_deep_nesting(self):
+        source = nested_forms(40, FOLDED)
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    interpreter = Interpreter(DictLoader({'main': source}),
+                                              engine=engine,
+                                              arg_mode=arg_mode, cache=None)
+                    self.assertEqual(interpreter.run_module('main'), 40)
+                    # when + is something else, nested calls of the slow
+                    # forms are made as written
+                    snapshot = Snapshot(interpreter.engine.name, arg_mode,
+                                        dict(global_builtins, **{
+                                            '+': minusBuiltin}), dict())
+                    self.assertEqual(interpreter.run_module('main',
+                                                            snapshot), 0)
+
+    def test_compiled_once(self):
+        # the fast form of a Folded is made of parts of its slow form
+        counts = [count_compiled(nested_forms(depth, FOLDED))
+                  for depth in (5, 10)]
+        self.assertLess(counts[1], 3 * counts[0])
+
+    def test_rebound_by_snapshot(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine)
+                self.assertEqual(interpreter.run_module('plus'), 3)
+                snapshot = Snapshot(interpreter.engine.name, 'name',
+                                    dict(global_builtins, **{
+                                        '+': minusBuiltin}), dict())
+                # the same compiled unit, from the cache
+                self.assertEqual(interpreter.run_module('plus', snapshot),
+                                 -1)
+
+
+
+#: forms that the optimizer keeps as special forms, and forms that it folds
+#: (each with a place for the next level, that is one less than the form)
+SPECIAL = ('(if n (+ 1 %s) 0)', '(begin (set m n) (+ 1 %s))',
+           '(if (and n m) (+ 1 %s) 0)', '(if (or m n) (+ 1 %s) 0)',
+           '(begin (while (= n 0) 0) (+ 1 %s))')
+FOLDED = ('(if 1 (+ 1 %s) 0)', '(begin 0 (+ 1 %s))',
+          '(if (and 1 2) (+ 1 %s) 0)', '(if (or 0 1) (+ 1 %s) 0)',
+          '(begin (while 0 0) (+ 1 %s))')
+
+
+def nested_forms(depth, forms):
+    '''
+    :return: the source of a unit with depth levels of nested forms, that
+             evaluates to depth
+    '''
+    source = '(- n 1)'
+    for i in range(depth):
+        source = forms[i % len(forms)] % source
+    return '(begin (set n 1) (set m 1) %s)' % source
+
+
+def count_compiled(source):
+    '''
+    :return: the number of datums the closure compiler compiles in source
+    '''
+    from lispy.interpreter import compiler
+    unit = optimize(parse(source))
+    with mock.patch.object(compiler, '_compile',
+                           wraps=compiler._compile) as compile_:
+        compiler.compile_datum(unit)
+    return compile_.call_count
+
+
+class TestSpecialFormRuns(unittest.TestCase):
+    def test_deep_nesting(self):
+        source = nested_forms(60, SPECIAL)
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    interpreter = Interpreter(DictLoader({'main': source}),
+                                              engine=engine,
+                                              arg_mode=arg_mode, cache=None)
+                    self.assertEqual(interpreter.run_module('main'), 60)
+
+    def test_compiled_once(self):
+        # each expression is compiled once, not once more for the call
+        # that each enclosing form falls back to
+        counts = [count_compiled(nested_forms(depth, SPECIAL))
+                  for depth in (5, 10)]
+        self.assertLess(counts[1], 3 * counts[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
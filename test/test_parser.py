@@ -0,0 +1,98 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+import lispy.parser
+from lispy.parser import LispyParser, shared_parser, write_tables
+from lispy.parser.parser import _tables_built, _table_modules
+
+SOURCE = '''(begin
+              (defun f (x y) (+ x y))
+              (set z "text")
+              (f 1 2.5))'''
+
+PARSER_DIR = os.path.dirname(lispy.parser.__file__)
+
+
+class TestSharedParser(unittest.TestCase):
+    def test_shared(self):
+        self.assertIs(shared_parser(), shared_parser())
+
+    def test_threads(self):
+        sources = ['(f %s)' % ' '.join(str(j) for j in range(i, i + 200))
+                   for i in range(8)]
+        expected = [LispyParser().parse('u%d' % i, s)
+                    for (i, s) in enumerate(sources)]
+        results = [None] * len(sources)
+
+        def parse(i):
+            for n in range(10):
+                results[i] = shared_parser().parse('u%d' % i, sources[i])
+
+        threads = [threading.Thread(target=parse, args=(i,))
+                   for i in range(len(sources))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, expected)
+
+    def test_nothing_written(self):
+        before = sorted(os.listdir(PARSER_DIR))
+        LispyParser()
+        self.assertEqual(sorted(os.listdir(PARSER_DIR)), before)
+
+    def test_lazy_import(self):
+        # nothing imports ply until a unit is parsed
+        code = ('import sys, lispy.interpreter, lispy.parser; '
+                'print("ply" in sys.modules)')
+        root = os.path.dirname(os.path.dirname(PARSER_DIR))
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(out.split(), [b'False'])
+
+    def test_without_sources(self):
+        # installed with only the compiled modules
+        root = os.path.dirname(os.path.dirname(PARSER_DIR))
+        with tempfile.TemporaryDirectory() as tmp:
+            package = os.path.join(tmp, 'lispy')
+            shutil.copytree(os.path.join(root, 'lispy'), package,
+                            ignore=shutil.ignore_patterns('__pycache__'))
+            subprocess.check_call([sys.executable, '-m', 'compileall', '-q',
+                                   '-b', package])
+            for (path, dirs, files) in os.walk(package):
+                for f in files:
+                    if f.endswith('.py'):
+                        os.remove(os.path.join(path, f))
+            code = ('from lispy.interpreter import Interpreter; '
+                    'from lispy.interpreter.loader import DictLoader; '
+                    'print(Interpreter(DictLoader({"u": "(+ 1 2)"}), '
+                    'cache=None).run_module("u"))')
+            out = subprocess.check_output([sys.executable, '-c', code],
+                                          cwd=tmp, stderr=subprocess.DEVNULL)
+        self.assertEqual(out.split(), [b'3'])
+
+
+class TestTables(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        lispy.parser.__path__.append(self.dir)
+
+    def tearDown(self):
+        lispy.parser.__path__.remove(self.dir)
+        for name in _table_modules():
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.dir)
+
+    def test_write_and_load(self):
+        write_tables(self.dir)
+        self.assertTrue(_tables_built())
+        self.assertEqual(LispyParser().parse('main', SOURCE),
+                         LispyParser(tables=False).parse('main', SOURCE))
+
+
+if __name__ == '__main__':
+    unittest.main()
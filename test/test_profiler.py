@@ -0,0 +1,143 @@
+import io
+import os
+import pstats
+import tempfile
+import unittest
+
+from lispy.common import TokenPos
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.profiler import Profiler, UNIT_NAME
+from lispy.interpreter.scope import __BUILTIN_POS__
+
+UNITS = {
+    'fib': '''(begin
+                (defun fib (n)
+                  (if (= n 0) 0 (if (= n 1) 1
+                                    (+ (fib (- n 1)) (fib (- n 2))))))
+                (fib 10))''',
+    'count': '''(begin
+                  (defun count (n) (if (= n 0) 0 (+ 1 (count (- n 1)))))
+                  (count 50))''',
+    'loop': '''(begin
+                 (defun loop (n) (if (= n 0) 0 (loop (- n 1))))
+                 (loop 10000))''',
+}
+
+FIB_POS = TokenPos('fib', 2, 18)
+
+ARG_MODES = ('strict', 'name', 'need')
+
+
+class TestProfiler(unittest.TestCase):
+    def profile(self, engine, unit_name='fib', result=55, arg_mode='name'):
+        interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                  arg_mode=arg_mode, cache=None,
+                                  profile=True)
+        self.assertEqual(interpreter.run_module(unit_name), result)
+        return interpreter.profiler
+
+    def test_calls(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                functions = self.profile(engine).functions
+                fib = functions[('fib', FIB_POS)]
+                self.assertEqual(fib.calls, 177)
+                self.assertEqual(fib.primitive_calls, 1)
+                self.assertGreaterEqual(fib.cumtime, fib.tottime)
+                # + gets the values of its arguments, which fib works out
+                self.assertEqual(fib.callers[('fib', FIB_POS)][0], 176)
+                self.assertEqual(functions[('+', __BUILTIN_POS__)].calls,
+                                 88)
+                unit = functions[(UNIT_NAME, TokenPos('fib', 1, 1))]
+                self.assertEqual(unit.calls, 1)
+                self.assertGreaterEqual(unit.cumtime, fib.cumtime)
+
+    def test_recursion(self):
+        # the calls are recorded by the engines, without going through
+        # Python for each one
+        count_pos = TokenPos('count', 2, 20)
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    functions = self.profile(engine, 'count', 50,
+                                             arg_mode).functions
+                    count = functions[('count', count_pos)]
+                    self.assertEqual(count.calls, 51)
+                    self.assertEqual(count.primitive_calls, 1)
+                    self.assertEqual(
+                        functions[('+', __BUILTIN_POS__)].calls, 50)
+                    # special forms aren't recorded
+                    self.assertNotIn(('if', __BUILTIN_POS__), functions)
+
+    def test_tail_calls(self):
+        # a function is left when it makes a tail call
+        loop_pos = TokenPos('loop', 2, 19)
+        for engine in ENGINES:
+            if engine == 'tree':
+                # doesn't eliminate tail calls
+                continue
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    functions = self.profile(engine, 'loop', 0,
+                                             arg_mode).functions
+                    loop = functions[('loop', loop_pos)]
+                    self.assertEqual(loop.calls, 10001)
+                    self.assertEqual(loop.primitive_calls, 10001)
+
+    def test_not_profiled(self):
+        interpreter = Interpreter(DictLoader(UNITS), cache=None)
+        self.assertIsNone(interpreter.profiler)
+        self.assertEqual(interpreter.run_module('fib'), 55)
+
+    def test_pstats(self):
+        profiler = self.profile('closure')
+        stats = pstats.Stats(profiler)
+        self.assertEqual(stats.stats[('fib', 2, 'fib')][:2], (1, 177))
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'fib.prof')
+            profiler.dump_stats(filename)
+            self.assertEqual(pstats.Stats(filename).stats, stats.stats)
+
+    def test_print_stats(self):
+        profiler = self.profile('vm')
+        out = io.StringIO()
+        profiler.print_stats(sort='name', limit=2, file=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn('ncalls', lines[0])
+        self.assertTrue(lines[1].endswith('+ (__BUILTINS__:0:0)'))
+        self.assertEqual(lines[2].split()[0], '176')
+        out = io.StringIO()
+        profiler.print_stats(sort='cumtime', file=out)
+        cumtimes = [float(line.split()[2])
+                    for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual(cumtimes, sorted(cumtimes, reverse=True))
+        with self.assertRaises(ValueError):
+            profiler.print_stats(sort='size', file=out)
+
+    def test_clock(self):
+        ticks = iter(range(1000000))
+        profiler = Profiler(clock=lambda: next(ticks))
+        outer = profiler.wrap(lambda scope: inner(scope), 'outer', None)
+        inner = profiler.wrap(lambda scope: None, 'inner', None)
+        outer(None)
+        stats = profiler.functions
+        self.assertEqual(stats[('inner', None)].tottime, 1)
+        self.assertEqual(stats[('outer', None)].tottime, 2)
+        self.assertEqual(stats[('outer', None)].cumtime, 3)
+
+    def test_runs_add_up(self):
+        interpreter = Interpreter(DictLoader(UNITS), cache=None,
+                                  profile=True)
+        for i in range(2):
+            interpreter.run_module('fib')
+        self.assertEqual(
+            interpreter.profiler.functions[('fib', FIB_POS)].calls, 354)
+        interpreter.profiler.clear()
+        self.assertEqual(interpreter.profiler.functions, dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import io
+import unittest
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.engine import ENGINES
+from lispy.parser import LispyParser, get_parser
+from lispy.parser.reader import Reader
+
+from .test_sources import TEST_RESULT
+
+# sources whose syntax trees are compared, beyond those in TEST_RESULT
+SOURCES = (
+    '42',
+    '-7',
+    '"a string"',
+    '(f)',
+    '(1 f x)',
+    '(f g h)',
+    '((f 1) (g))',
+    '(set x (defun f (a b c) a (b c)))',
+    '(x-1 +1 -1.5 1.5e-3 - + a.b <=? #t #f)',
+    '("two\nlines" x)',
+    '(f\n\n\n  x\n\t y)',
+    '(f ;x y)',
+    '(f 1.2.3)',
+)
+
+# sources that are not a single expression
+BAD_SOURCES = (
+    '',
+    '(',
+    ')',
+    '(f))',
+    '1 2',
+    "'(1 2)",
+    'defun',
+    '(f set)',
+    '(set 1 2)',
+    '(set x)',
+    '(set x 1 2)',
+    '(defun f x 1)',
+    '(defun f () 1)',
+    '(defun f (x))',
+    '(defun f (x (y)) 1)',
+    '(defun (f) (x) 1)',
+)
+
+
+def all_sources():
+    for (source, result) in TEST_RESULT:
+        if isinstance(source, dict):
+            yield from source.values()
+        else:
+            yield source
+    yield from SOURCES
+
+
+class TestReader(unittest.TestCase):
+    def test_same_tree(self):
+        ply = LispyParser()
+        for source in all_sources():
+            with self.subTest(source=source):
+                self.assertEqual(Reader().parse('main', source),
+                                 ply.parse('main', source))
+
+    def test_positions(self):
+        tree = Reader().parse('u', '(f\n\n  "a\nb" x)')
+        self.assertEqual(str(tree.value['name'].pos), 'u:1:2')
+        string, x = tree.value['arg_exprs'].value
+        self.assertEqual(str(string.pos), 'u:3:3')
+        self.assertEqual(str(x.pos), 'u:4:4')
+
+    def test_empty_list(self):
+        self.assertEqual(Reader().parse('u', ' ()'),
+                         ('LIST', [], ('u', 1, 2)))
+
+    def test_deep(self):
+        depth = 100000
+        tree = Reader().parse('u', '(' * depth + '1' + ')' * depth)
+        for i in range(depth):
+            (tree,) = tree.value
+        self.assertEqual(tree.value, 1)
+
+    def test_errors(self):
+        for source in BAD_SOURCES:
+            with self.subTest(source=source):
+                self.assertRaises(SyntaxError, Reader().parse, 'u', source)
+
+    def test_interpreter(self):
+        for (source, result) in TEST_RESULT:
+            if isinstance(source, str):
+                source = {'main': source}
+            with self.subTest(source=source):
+                interpreter = Interpreter(DictLoader(source), cache=None,
+                                          parser='reader')
+                self.assertEqual(interpreter.run_module('main'), result)
+
+    def test_backends(self):
+        self.assertIs(get_parser('reader'), get_parser('reader'))
+        self.assertRaises(ValueError, get_parser, 'yacc')
+        self.assertRaises(ValueError, Interpreter, DictLoader({}),
+                          parser='yacc')
+
+
+FORMS = '''(set x "a string (with) \n spaces")  ; c
+(defun f (a b)
+   (+ a -1.5e-3 b))
+  12 -x #t "q"
+(f 1 2) ()  \t
+  '''
+
+
+class TestReadForms(unittest.TestCase):
+    def test_chunks(self):
+        expected = list(Reader().read_forms('u', FORMS))
+        self.assertEqual(len(expected), 10)
+        for size in range(1, len(FORMS) + 1):
+            chunks = [FORMS[i:i + size] for i in range(0, len(FORMS), size)]
+            with self.subTest(size=size):
+                self.assertEqual(list(Reader().read_forms('u', chunks)),
+                                 expected)
+                self.assertEqual(list(Reader().read_forms(
+                    'u', io.StringIO(FORMS), size)), expected)
+
+    def test_incremental(self):
+        # each form is yielded before the chunks after it are read
+        read = []
+
+        def chunks():
+            for i in range(1000):
+                read.append(i)
+                yield '(set x%d %d)\n' % (i, i)
+
+        for (i, form) in enumerate(Reader().read_forms('u', chunks())):
+            self.assertEqual(form.value['value'].value, i)
+            self.assertLessEqual(len(read), i + 2)
+
+    def test_unclosed(self):
+        for source in ('(f 1) (g', '(f "x'):
+            with self.subTest(source=source):
+                self.assertRaises(SyntaxError, list,
+                                  Reader().read_forms('u', [source]))
+
+    def test_run_stream(self):
+        source = '''(defun sq (x) (* x x))
+                    (set a (sq 4))
+                    (load "lib")
+                    (+ a (ext 1))'''
+        loader = DictLoader({'lib': '(defun ext (x) (+ x 1))'})
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(loader, engine=engine)
+                self.assertEqual(interpreter.run_stream(
+                    io.StringIO(source)), 18)
+                self.assertIsNone(interpreter.run_stream(iter([])))
+
+
+if __name__ == '__main__':
+    unittest.main()
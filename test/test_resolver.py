@@ -0,0 +1,91 @@
+import unittest
+
+from lispy.interpreter import make_datum
+from lispy.interpreter.resolver import resolve, Address
+from lispy.interpreter.error import VarNameNotFoundError
+from lispy.interpreter.datatypes import ExprSeq, Set, VarRef, StaticDatum
+from lispy.common import Syn, TokenPos
+from lispy.parser import LispyParser
+
+from .util import run
+
+dummy_pos = TokenPos('TEST', 0, 0)
+
+
+def ID(id):
+    return Syn('ID', id, dummy_pos)
+
+
+def parse(source):
+    return make_datum(LispyParser().parse('main', source))
+
+
+class TestResolve(unittest.TestCase):
+    def test_addresses(self):
+        unit = parse('''(defun f (x y)
+                           (set z (+ x y))
+                           (defun g (w) (+ w x z q)))''')
+        res = resolve(unit)
+        self.assertEqual(res.ref(unit).chain, ())
+
+        block = res.block(unit)
+        self.assertEqual(block.names, ['x', 'y', 'z', 'g'])
+        self.assertEqual(block.nparams, 2)
+        self.assertEqual(block.nlocals, 2)
+
+        set_z, defun_g = unit.body.items
+        self.assertEqual(res.ref(set_z).chain, (Address(0, 2),))
+        self.assertFalse(res.ref(set_z).bound)
+        x, y = set_z.value_expr.arg_exprs
+        self.assertEqual(res.ref(x).chain, (Address(0, 0),))
+        self.assertTrue(res.ref(x).bound)
+
+        w, x, z, q = defun_g.body.items[0].arg_exprs
+        self.assertEqual(res.ref(w).chain, (Address(0, 0),))
+        self.assertEqual(res.ref(x).chain, (Address(1, 0),))
+        self.assertEqual(res.ref(z).chain, (Address(1, 2),))
+        self.assertEqual(res.ref(q).chain, ())
+
+    def test_empty_block(self):
+        # an ExprSeq that defines nothing doesn't get a frame
+        seq = ExprSeq(dummy_pos, [StaticDatum(dummy_pos, 1)])
+        self.assertIsNone(resolve(seq).block(seq))
+        seq = ExprSeq(dummy_pos, [Set(dummy_pos, ID('a'),
+                                      StaticDatum(dummy_pos, 1)),
+                                  VarRef(dummy_pos, ID('a'))])
+        self.assertEqual(resolve(seq).block(seq).names, ['a'])
+
+
+class TestLexicalScope(unittest.TestCase):
+    def test_closure(self):
+        self.assertEqual(run('''((defun f (x)
+                                    (defun g (y) (+ x y))
+                                    (g 10))
+                                  (f 1))'''), [None, 11])
+
+    def test_set_updates_global(self):
+        source = '''((set n 1)
+                     (defun f (x) (set n (+ n x)))
+                     (f 2)
+                     n)'''
+        self.assertEqual(run(source), run(source, 'tree'))
+
+    def test_callers_locals_not_visible(self):
+        source = '''((defun show (d) x)
+                     (defun f (x) (show 0))
+                     (f 1))'''
+        # the tree engine scopes names dynamically, the others lexically
+        self.assertEqual(run(source, 'tree'), [None, None, 1])
+        for engine in ('closure', 'stack', 'vm'):
+            with self.subTest(engine=engine):
+                self.assertRaises(VarNameNotFoundError, run, source, engine)
+
+    def test_deep_recursion_global(self):
+        self.assertEqual(run('''(begin
+                                  (defun count (n)
+                                    (if (= n 0) 0 (+ 1 (count (- n 1)))))
+                                  (count 40))'''), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
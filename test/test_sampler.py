@@ -0,0 +1,162 @@
+import io
+import unittest
+from types import CodeType
+
+from lispy.builtins import global_builtins
+from lispy.common import TokenPos
+from lispy.interpreter import Interpreter
+from lispy.interpreter.budget import Budget, Meter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.error import BudgetExceededError
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.scope import ARG_MODES
+from lispy.interpreter.snapshot import Snapshot
+
+UNITS = {
+    # (tick 0) makes the run take a sample at its next step: the call of
+    # leaf
+    'calls': '''(begin
+                  (defun leaf (n) n)
+                  (defun inner (n) (begin (tick 0) (leaf n) 0))
+                  (defun outer (n) (begin (inner n) 0))
+                  (outer 0))''',
+    # calls whose results are arguments, and a call in tail position
+    'nested': '''(begin
+                   (defun id (n) n)
+                   (defun leaf (n) (begin (tick 0) (id n)))
+                   (defun inner (n) (+ (leaf n) 1))
+                   (defun outer (n) (+ (inner n) 1))
+                   (outer 0))''',
+    'loop': '''(begin (set i 0)
+                      (while (!= i 2000) (begin (tick 0) (set i (+ i 1))))
+                      i)''',
+    'fib': '''(begin
+                (defun fib (n)
+                  (if (= n 0) 0 (if (= n 1) 1
+                                    (+ (fib (- n 1)) (fib (- n 2))))))
+                (fib 16))''',
+}
+
+CALLS = ';'.join(('<unit> (calls:1:1)', 'outer (calls:4:20)',
+                  'inner (calls:3:20)', 'leaf (calls:2:20)'))
+
+NESTED = ';'.join(('<unit> (nested:1:1)', 'outer (nested:5:21)',
+                   'inner (nested:4:21)', 'leaf (nested:3:21)'))
+
+#: The stack of 'nested' sampled by each engine (engine name -> collapsed
+#: stack).  The closure engine and the VM have left leaf by the time they
+#: call id in tail position.
+NESTED_STACKS = {
+    'tree': NESTED + ';id (nested:2:21)',
+    'closure': NESTED,
+    'stack': NESTED + ';id (nested:2:21)',
+    'vm': NESTED,
+}
+
+
+def tickBuiltin(parent_scope, arg):
+    parent_scope.meter.preempt()
+
+
+class TestSampler(unittest.TestCase):
+    def sample(self, engine, arg_mode, unit_name, **kwargs):
+        interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                  arg_mode=arg_mode, cache=None,
+                                  sample_interval=3600, **kwargs)
+        snapshot = Snapshot(interpreter.engine.name, arg_mode,
+                            dict(global_builtins, tick=tickBuiltin), dict())
+        value = interpreter.run_module(unit_name, snapshot)
+        return value, interpreter.sampler
+
+    def test_stacks(self):
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    value, sampler = self.sample(engine, arg_mode, 'calls')
+                    self.assertEqual(sampler.collapsed(), [CALLS + ' 1'])
+                    stack, = sampler.samples
+                    self.assertEqual(stack[-1],
+                                     ('leaf', TokenPos('calls', 2, 20)))
+
+    def test_nested_stacks(self):
+        for engine in ENGINES:
+            for arg_mode in ARG_MODES:
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    value, sampler = self.sample(engine, arg_mode, 'nested')
+                    self.assertEqual(value, 2)
+                    self.assertEqual(sampler.collapsed(),
+                                     [NESTED_STACKS[engine] + ' 1'])
+
+    def test_frame_handlers(self):
+        for (name, engine) in ENGINES.items():
+            with self.subTest(engine=name):
+                handlers = engine.frame_handlers()
+                self.assertTrue(handlers)
+                for code in handlers:
+                    self.assertIs(type(code), CodeType)
+
+    def test_steps_are_counted(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                value, sampler = self.sample(engine, 'strict', 'loop',
+                                             budget=Budget(max_steps=2000))
+                self.assertEqual(value, 2000)
+                # the tick in the last iteration isn't followed by a step
+                self.assertIn(sampler.samples,
+                              [{(('<unit>', TokenPos('loop', 1, 1)),): n}
+                               for n in (1999, 2000)])
+                with self.assertRaises(BudgetExceededError):
+                    self.sample(engine, 'strict', 'loop',
+                                budget=Budget(max_steps=1999))
+
+    def test_timer(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None, sample_interval=0.001)
+                for i in range(20):
+                    interpreter.run_module('fib')
+                    if interpreter.sampler.samples:
+                        break
+                lines = interpreter.sampler.collapsed()
+                self.assertTrue(lines)
+                for line in lines:
+                    self.assertTrue(line.startswith('<unit> (fib:1:1)'))
+                    self.assertTrue(line.rsplit(' ', 1)[1].isdigit())
+
+    def test_write_collapsed(self):
+        value, sampler = self.sample('closure', 'name', 'calls')
+        out = io.StringIO()
+        sampler.write_collapsed(out)
+        self.assertEqual(out.getvalue(), CALLS + ' 1\n')
+        sampler.clear()
+        self.assertEqual(sampler.collapsed(), [])
+
+    def test_not_sampled(self):
+        interpreter = Interpreter(DictLoader(UNITS), cache=None)
+        self.assertIsNone(interpreter.sampler)
+
+    def test_preempt(self):
+        meter = Meter(Budget(max_steps=3000))
+        meter.sampler = sampler = _Recorder()
+        for i in range(1500):
+            if i in (10, 1100):
+                meter.preempt()
+                meter.preempt()
+            meter.fuel -= 1
+            if meter.fuel < 0:
+                meter.refuel(None)
+            self.assertEqual(meter.steps, i + 1)
+        self.assertEqual(sampler.counts, [2, 2])
+
+
+class _Recorder(object):
+    def __init__(self):
+        self.counts = []
+
+    def sample(self, frame, count=1):
+        self.counts.append(count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+from lispy.builtins import global_builtins
+from lispy.builtins.builtins import plusBuiltin
+
+PRELUDE = '''(begin
+               (set count 0)
+               (set limit 10)
+               (defun bump (n) (set count (+ count n)))
+               (defun double (x) (* x 2)))'''
+
+UNITS = {
+    'prelude': PRELUDE,
+    'script': '''(begin (require "prelude")
+                        (bump 5) (set limit (double limit))
+                        (set mine 1)
+                        (+ count limit))''',
+    'check': '''(begin (load "prelude") (+ count limit))''',
+    'plus': '''(begin (defun + (a b) 0) (+ 1 2))''',
+}
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_runs_are_isolated(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None)
+                interpreter.run_module('prelude')
+                snapshot = interpreter.snapshot()
+                for i in range(3):
+                    self.assertEqual(
+                        interpreter.run_module('script', snapshot), 25)
+                    self.assertNotIn('mine', snapshot.bindings)
+                # the prelude isn't run again: it is already loaded
+                self.assertEqual(interpreter.run_module('check', snapshot),
+                                 10)
+                self.assertEqual(snapshot.bindings['count'], 0)
+
+    def test_builtins_shared(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None)
+                self.assertEqual(interpreter.run_module('plus'), 0)
+                self.assertEqual(Interpreter(
+                    DictLoader({'main': '(+ 1 2)'}),
+                    engine=engine).run_module('main'), 3)
+                self.assertIs(global_builtins['+'], plusBuiltin)
+
+    def test_other_interpreter(self):
+        interpreter = Interpreter(DictLoader(UNITS), cache=None)
+        interpreter.run_module('prelude')
+        snapshot = interpreter.snapshot()
+        units = dict(UNITS, lib='(set from_lib 1)',
+                     main='(begin (load "lib") (bump from_lib) count)')
+        other = Interpreter(DictLoader(units), cache=None)
+        self.assertEqual(other.run_module('main', snapshot), 1)
+        self.assertIn('lib', other.modules)
+        self.assertNotIn('lib', interpreter.modules)
+
+    def test_engine_mismatch(self):
+        snapshot = Interpreter(DictLoader(UNITS)).snapshot()
+        interpreter = Interpreter(DictLoader(UNITS), engine='vm')
+        self.assertRaises(ValueError, interpreter.run_module, 'prelude',
+                          snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
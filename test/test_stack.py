@@ -0,0 +1,67 @@
+import sys
+import unittest
+
+from lispy.interpreter import make_datum
+from lispy.interpreter.scope import ARG_MODES, STRICT, BY_NEED
+from lispy.parser import LispyParser
+
+from .util import run
+
+# well past what Python recursion could manage
+DEPTH = 10 * sys.getrecursionlimit()
+
+
+class TestStackEngine(unittest.TestCase):
+    def test_deep_recursion(self):
+        source = '''(begin
+                      (defun count (n) (if (= n 0) 0 (+ 1 (count (- n 1)))))
+                      (count %d))''' % DEPTH
+        # (call-by-name re-evaluates n through every level, which is too
+        # slow at this depth)
+        for arg_mode in (STRICT, BY_NEED):
+            self.assertEqual(run(source, 'stack', arg_mode), DEPTH)
+
+    def test_lazy_accumulator(self):
+        # the accumulator is a chain of DEPTH unevaluated arguments
+        source = '''(begin
+                      (defun loop (n acc)
+                        (if (= n 0) acc (loop (- n 1) (+ acc 1))))
+                      (loop %d 0))''' % DEPTH
+        for arg_mode in (STRICT, BY_NEED):
+            self.assertEqual(run(source, 'stack', arg_mode), DEPTH)
+
+    def test_deep_source(self):
+        source = '(+ 1 ' * DEPTH + '0' + ')' * DEPTH
+        self.assertEqual(run(source, 'stack'), DEPTH)
+
+    def test_builtins(self):
+        source = '''(begin
+                      (set i 0)
+                      (set out (while (!= i 5) (set i (+ i 1)) (* i 2)))
+                      (print out)
+                      ((and (= 1 1 1) (!= 1 2)) (= 1 1 2) (if #f 1 2)))'''
+        for arg_mode in ARG_MODES:
+            self.assertEqual(run(source, 'stack', arg_mode),
+                             run(source, 'tree', arg_mode))
+
+
+class TestMakeDatum(unittest.TestCase):
+    def test_deep_nesting(self):
+        source = '(f ' * DEPTH + '1' + ')' * DEPTH
+        datum = make_datum(LispyParser().parse('main', source))
+        depth = 0
+        while datum.arg_exprs[0].value != 1:
+            datum = datum.arg_exprs[0]
+            depth += 1
+        self.assertEqual(depth, DEPTH - 1)
+
+    def test_ast_unchanged(self):
+        ast = LispyParser().parse('main', '((set x 1) (defun f (y) y))')
+        for i in range(2):
+            set_x, defun_f = make_datum(ast).items
+            self.assertEqual(set_x.value_expr.value, 1)
+            self.assertEqual(defun_f.body.items[0].name.value, 'y')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+
+from lispy.interpreter import make_datum
+from lispy.interpreter.compiler import compile_datum
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.frame import GlobalEnv
+from lispy.builtins import global_builtins
+from lispy.parser import LispyParser
+
+from .util import run
+
+
+LOOP = '''(begin
+            (defun loop (n acc)
+              (if (= n 0) acc (loop (- n 1) (+ acc n))))
+            (loop 20000 0))'''
+
+EVEN_ODD = '''(begin
+                (defun even (n) (if (= n 0) #t (odd (- n 1))))
+                (defun odd (n) (if (= n 0) #f (begin (even (- n 1)))))
+                (even 20001))'''
+
+COUNTDOWN = '''(begin
+                 (defun loop (n) (if (= n 0) 0 (loop (- n 1))))
+                 (loop 10000))'''
+
+
+class TestTailCalls(unittest.TestCase):
+    def test_self_tail_call(self):
+        self.assertEqual(run(LOOP, arg_mode='strict'), 200010000)
+
+    def test_default_settings(self):
+        self.assertEqual(run(COUNTDOWN), 0)
+        self.assertEqual(run(LOOP), 200010000)
+
+    def test_lazy_arguments(self):
+        # the arguments of a loop would otherwise make a chain as long as
+        # the loop, followed each time the last one is used
+        for engine in ENGINES:
+            if engine == 'tree':
+                # doesn't eliminate tail calls
+                continue
+            for arg_mode in ('name', 'need'):
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    self.assertEqual(run(LOOP, engine, arg_mode),
+                                     200010000)
+
+    def test_unused_argument(self):
+        # an argument that fails is only evaluated if it is used
+        source = '''(begin
+                      (defun first (a b) a)
+                      (defun f (n) (first n (/ n 0)))
+                      (f 3))'''
+        for engine in ENGINES:
+            for arg_mode in ('name', 'need'):
+                with self.subTest(engine=engine, arg_mode=arg_mode):
+                    self.assertEqual(run(source, engine, arg_mode), 3)
+
+    def test_mutual_tail_calls(self):
+        for arg_mode in ('strict', 'need'):
+            self.assertEqual(run(EVEN_ODD, arg_mode=arg_mode), False)
+
+    def test_not_in_tail_position(self):
+        source = '''(begin
+                      (defun count (n) (if (= n 0) 0 (+ 1 (count (- n 1)))))
+                      (count 30))'''
+        self.assertEqual(run(source, arg_mode='strict'), 30)
+
+    def test_rebound_if(self):
+        # if is just a name: a function that replaces it gets the values
+        # of its arguments, not tail calls
+        source = '''((defun if (c a b) (+ a b))
+                     (defun f (n) (if #t (g n) (g 1)))
+                     (defun g (n) (* n 10))
+                     (f 2))'''
+        for arg_mode in ('strict', 'name'):
+            self.assertEqual(run(source, arg_mode=arg_mode),
+                             [None, None, None, 30])
+
+    def test_frame_reuse(self):
+        frames = []
+
+        def spy(frame, *args):
+            frames.append(frame)
+
+        def frames_seen(arg_mode):
+            del frames[:]
+            ast = LispyParser().parse('main', '''
+                (begin
+                  (defun loop (n) (spy n) (if (= n 0) 0 (loop (- n 1))))
+                  (loop 5))''')
+            code = compile_datum(make_datum(ast), arg_mode)
+            builtins = dict(global_builtins, spy=spy)
+            code.evaluate(GlobalEnv(builtins, {}, None).top_frame())
+            return len(set(map(id, frames)))
+
+        self.assertEqual(frames_seen('strict'), 1)
+        self.assertEqual(frames_seen('need'), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import sys
+import threading
+import unittest
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.cache import UnitCache
+from lispy.interpreter.engine import ENGINES
+from lispy.interpreter.loader import DictLoader
+from lispy.parser import LispyParser, PARSERS
+
+UNITS = {
+    'lib': '''(begin (set calls 0)
+                     (defun fib (n)
+                       (begin (set calls (+ calls 1))
+                              (if (= n 0) 0
+                                (if (= n 1) 1 (+ (fib (- n 1))
+                                                 (fib (- n 2))))))))''',
+    'main': '''(begin (require "lib") (set base (fib 10))
+                      (load "worker") (+ base result calls))''',
+    'worker': '''(set result (* base 2))''',
+}
+
+# fib(10) is 55, and takes 177 calls
+EXPECTED = 55 + 110 + 177
+
+NTHREADS = 8
+
+
+def _run_threads(target, n=NTHREADS):
+    '''
+    Run target(i) in n threads at once, and return their results.
+    '''
+    results = [None] * n
+    errors = []
+    barrier = threading.Barrier(n)
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = target(i)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class TestThreads(unittest.TestCase):
+    '''
+    Interpreters running in threads at once.  Under a free-threaded build of
+    CPython (where sys._is_gil_enabled() is False), the threads really do
+    run in parallel.  Otherwise, the switch interval is made short, so that
+    they are interleaved often.
+    '''
+
+    def setUp(self):
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+
+    def test_separate_interpreters(self):
+        for engine in ENGINES:
+            for parser in PARSERS:
+                with self.subTest(engine=engine, parser=parser):
+                    # a cache of their own, so every thread parses and
+                    # compiles at the same time, and shares the results
+                    cache = UnitCache()
+
+                    def run(i):
+                        interpreter = Interpreter(DictLoader(UNITS),
+                                                  engine=engine,
+                                                  parser=parser, cache=cache)
+                        return [interpreter.run_module('main')
+                                for n in range(3)]
+
+                    self.assertEqual(_run_threads(run),
+                                     [[EXPECTED] * 3] * NTHREADS)
+
+    def test_shared_interpreter(self):
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = Interpreter(DictLoader(UNITS), engine=engine,
+                                          cache=None)
+                interpreter.run_module('lib')
+                snapshot = interpreter.snapshot()
+
+                def run(i):
+                    values = [interpreter.run_module('main', snapshot)
+                              for n in range(3)]
+                    # each thread sees the modules of its own last run
+                    return values, sorted(interpreter.modules)
+
+                self.assertEqual(
+                    _run_threads(run),
+                    [([EXPECTED] * 3, ['lib', 'main', 'worker'])] * NTHREADS)
+
+    def test_shared_parser(self):
+        parser = LispyParser(tables=False)
+        sources = ['(f\n %s)' % '\n '.join(str(j) for j in range(i, i + 50))
+                   for i in range(NTHREADS)]
+        expected = [LispyParser(tables=False).parse('u%d' % i, s)
+                    for (i, s) in enumerate(sources)]
+        results = _run_threads(
+            lambda i: [parser.parse('u%d' % i, sources[i])
+                       for n in range(5)][-1])
+        self.assertEqual(results, expected)
+        self.assertIsNone(parser.trees)
+
+
+class TestKeepTrees(unittest.TestCase):
+    def test_keep_trees(self):
+        parser = LispyParser(tables=False, keep_trees=True)
+        tree = parser.parse('u', '(f 1 2)')
+        self.assertEqual(parser.trees, {'u': tree})
+
+
+if __name__ == '__main__':
+    unittest.main()
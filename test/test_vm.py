@@ -0,0 +1,92 @@
+import pickle
+import sys
+import unittest
+
+from lispy.interpreter import make_datum
+from lispy.interpreter.bytecode import compile_code, disassemble
+from lispy.interpreter.frame import GlobalEnv
+from lispy.interpreter.scope import ARG_MODES, STRICT, BY_NEED
+from lispy.interpreter.vm import VMExpr
+from lispy.builtins import global_builtins
+from lispy.parser import LispyParser
+
+from .util import run
+
+# well past what Python recursion could manage
+DEPTH = 10 * sys.getrecursionlimit()
+
+
+def compile_source(source, arg_mode='name'):
+    return compile_code(make_datum(LispyParser().parse('main', source)),
+                        arg_mode)
+
+
+def run_code(code):
+    env = GlobalEnv(global_builtins, {}, None)
+    return VMExpr(code, 0, -1, code.pos).evaluate(env.top_frame())
+
+
+class TestVM(unittest.TestCase):
+    def test_deep_recursion(self):
+        source = '''(begin
+                      (defun count (n) (if (= n 0) 0 (+ 1 (count (- n 1)))))
+                      (count %d))''' % DEPTH
+        for arg_mode in (STRICT, BY_NEED):
+            self.assertEqual(run(source, 'vm', arg_mode), DEPTH)
+
+    def test_lazy_accumulator(self):
+        source = '''(begin
+                      (defun loop (n acc)
+                        (if (= n 0) acc (loop (- n 1) (+ acc 1))))
+                      (loop %d 0))''' % DEPTH
+        for arg_mode in (STRICT, BY_NEED):
+            self.assertEqual(run(source, 'vm', arg_mode), DEPTH)
+
+    def test_rebound_builtins(self):
+        # calls to builtins that are compiled inline still go to whatever
+        # the name refers to when the call runs
+        source = '''((defun f (n) (if (= n 0) (+ n 1) (* n 2)))
+                     (set a (f 0))
+                     (defun if (c x y) (- x y))
+                     (defun = (x y) #f)
+                     (set + *)
+                     (f 3)
+                     (while (= 1 2) (+ 3 4) 5)
+                     (begin 1 2)
+                     a)'''
+        for arg_mode in ARG_MODES:
+            self.assertEqual(run(source, 'vm', arg_mode),
+                             run(source, 'tree', arg_mode))
+
+    def test_inline_builtins(self):
+        source = '''(begin
+                      (set i 0)
+                      (set out (while (!= i 5) (set i (+ i 1)) (* i 2)))
+                      (print out)
+                      ((- 7 2 1) (= 1 1 2) (if #f 1 2) (+ 1.5 1)
+                       (+ #t #t) (begin 1 2 3)))'''
+        for arg_mode in ARG_MODES:
+            self.assertEqual(run(source, 'vm', arg_mode),
+                             run(source, 'tree', arg_mode))
+
+    def test_jumps(self):
+        code = compile_source('(while (!= 1 1) (if #t 2 3))')
+        listing = disassemble(code)
+        self.assertIn('JUMP_IF_FALSE', listing)
+        self.assertIn('COMPARE', listing)
+        self.assertNotIn('SELECT_CALL', listing)
+
+    def test_pickle(self):
+        source = '''(begin
+                      (defun fib (n)
+                        (if (= n 0) 0 (if (= n 1) 1
+                          (+ (fib (- n 1)) (fib (- n 2))))))
+                      (fib 10))'''
+        for arg_mode in ARG_MODES:
+            code = pickle.loads(pickle.dumps(compile_source(source, arg_mode)))
+            self.assertIsNone(code.linked)
+            self.assertEqual(run_code(code), 55)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import io
+from contextlib import redirect_stdout
+
+from lispy.interpreter import Interpreter
+from lispy.interpreter.engine import DEFAULT_ENGINE
+from lispy.interpreter.loader import DictLoader
+from lispy.interpreter.scope import BY_NAME
+
+__author__ = 'Dan Bullok and Ben Lambeth'
+
+
+def run(source, engine=DEFAULT_ENGINE, arg_mode=BY_NAME):
+    '''
+    Run the unit main with a new interpreter.
+
+    :param source: the source of main, or the sources of all the units
+                   (unit name -> source)
+    :type source: str or dict
+    :param engine: the name of the engine to run it with
+    :type engine: str
+    :param arg_mode: how arguments are passed to functions (one of
+                     scope.ARG_MODES)
+    :type arg_mode: str
+    :return: the result of main
+    '''
+    if isinstance(source, str):
+        source = {'main': source}
+    return Interpreter(DictLoader(source), engine=engine,
+                       arg_mode=arg_mode).run_module('main')
+
+
+def run_printed(source, engine=DEFAULT_ENGINE, arg_mode=BY_NAME):
+    '''
+    Run the unit main like run, and collect what it prints.
+
+    :return: the result of main, and the words it printed
+    :rtype: (any, list[str])
+    '''
+    out = io.StringIO()
+    with redirect_stdout(out):
+        result = run(source, engine, arg_mode)
+    return result, out.getvalue().split()